@@ -7,7 +7,8 @@ sequence and dispatches opcodes for the form (opcode, arg1, arg2, ...)
 to a method of the name emit_opcode(arg1, arg2, ...).
 
 Actual code generators should inherit from this class and implement
-the required emit_opcode() methods.
+the required emit_opcode() methods.  The methods are looked up once per
+class and opcode (see exprdispatch.py).
 
 The programming interface is based on generators.  It should be used
 roughly like this:
@@ -21,21 +22,24 @@ roughly like this:
 s can be anything at all, but a common output might be a line of text.
 '''
 
+from exprdispatch import method_table
+
 class CodeEmitter(object):
     def process(self,instructions):
+        methods = method_table(type(self), 'emit_')
         for inst in instructions:
             opcode = inst[0]
             args = inst[1:]
-            methname = "emit_" + opcode
-            if hasattr(self,methname):
-                result = getattr(self,methname)(*args)
+            method = methods[opcode]
+            if method is not None:
+                result = method(self, *args)
                 if isinstance(result,list):
                     for line in result:
                         yield line
                 else:
                     yield result
             else:
-                raise RuntimeError("No method %s" % methname)
+                raise RuntimeError("No method emit_%s" % opcode)
 
 
 
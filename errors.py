@@ -17,6 +17,13 @@ compiler supports multiple source files, add the filename keyword argument.
 
        error(lineno,"Some kind of error message",filename="foo.src")
 
+To add a filename to every error reported while working on one file,
+including those reported by code that does not know the filename, use
+the error_filename() context manager:
+
+       with error_filename("foo.src"):
+            run_compiler()
+
 Error handling is based on a subscription based model using context-managers
 and the subscribe_errors() function. For example, to route error messages to 
 standard output, use this:
@@ -50,39 +57,273 @@ errors reported so far.  Different stages of the compiler might use
 this to decide whether or not to keep processing or not.
 
 Use clear_errors() to clear the total number of errors.
+
+Errors can also carry structured information for tools.  The message
+may be a str.format() string whose arguments are given after it, in
+which case the text is only made if something needs it; code names the
+kind of error and span gives the (start, end) character offsets of the
+offending source text:
+
+       error(lineno, "Illegal character {!r}", ch, code="illegal-character",
+             span=(pos, pos+1))
+
+The message needs one field for each argument, and braces that are
+part of the text are doubled ("Expected '{{' after {}").  A message
+given no arguments is used as it is.
+
+Each error is recorded as a Diagnostic.  To receive the Diagnostic
+objects rather than message strings, use subscribe_diagnostics() in
+place of subscribe_errors().  diagnostics_json() turns a list of them
+into JSON.
+
+Everything above works on the current error sink.  An ErrorSink holds
+the subscribers, the error count and the error filename for one
+compilation.  Unless told otherwise, all code reports into one shared
+sink, so the functions above behave as if they worked on global
+variables.  To keep the errors of one compilation apart from all
+others, report them into a sink of its own with error_sink():
+
+       with error_sink() as sink:
+            run_compiler()
+       # sink.errors_reported(), sink.messages(), sink.diagnostics
+
+The current sink belongs to the current context (see the contextvars
+module), so threads and asyncio tasks can each compile into their own
+sink at the same time without any locking.
 '''
 
 import sys
+import json
+import string
+import warnings
 from contextlib import contextmanager
+from contextvars import ContextVar
 
-_subscribers = []
-_num_errors = 0
-
-def error(lineno, message, filename=None):
+def format_error(lineno, message, filename=None):
     '''
-    Report a compiler error to all subscribers
+    Return the text of an error message, as given to subscribers.
+    lineno is None for an error that has no line.
     '''
-    global _num_errors
+    if lineno is None:
+        return "{}: {}".format(filename, message) if filename else message
     if not filename:
-        errmsg = "{}: {}".format(lineno, message)
+        return "{}: {}".format(lineno, message)
     else:
-        errmsg = "{}:{}: {}".format(filename,lineno,message)
-    for subscriber in _subscribers:
-        subscriber(errmsg)
-    _num_errors += 1
+        return "{}:{}: {}".format(filename,lineno,message)
+
+class Diagnostic(object):
+    '''
+    Record of one reported error (or other diagnostic).  The text of the
+    message is message.format(*args), made only when it is asked for.
+    code names the kind of diagnostic and span is (start, end) character
+    offsets into the source, where end may be None; both are None if not
+    known.  str() gives the full message as passed to subscribers.
+    '''
+    __slots__ = ('lineno', 'message', 'args', 'code', 'span', 'severity', 'filename')
+
+    def __init__(self, lineno, message, args=(), code=None, span=None,
+                 severity="error", filename=None):
+        self.lineno = lineno
+        self.message = message
+        self.args = args
+        self.code = code
+        self.span = span
+        self.severity = severity
+        self.filename = filename
+
+    def text(self):
+        '''
+        Return the message text, without the filename and line number.
+        '''
+        if self.args:
+            return self.message.format(*self.args)
+        return self.message
+
+    def to_dict(self, source=None):
+        '''
+        Return the diagnostic as a dictionary of JSON values.  If the
+        source text is given, the span is also given as 1-based columns
+        of its line.
+        '''
+        result = {"severity": self.severity, "code": self.code,
+                  "filename": self.filename, "lineno": self.lineno,
+                  "message": self.text(), "args": [str(arg) for arg in self.args],
+                  "span": list(self.span) if self.span else None}
+        if source is not None and self.span:
+            start, end = self.span
+            linestart = source.rfind('\n', 0, start) + 1
+            result["column"] = start - linestart + 1
+            result["end_column"] = end - linestart + 1 if end is not None else None
+        return result
+
+    def __str__(self):
+        return format_error(self.lineno, self.text(), self.filename)
+
+    def __repr__(self):
+        return "Diagnostic(%r, %r, %r)" % (self.lineno, self.code, self.text())
+
+def diagnostics_json(diagnostics, source=None):
+    '''
+    Return a list of Diagnostics as a JSON array of objects (see
+    Diagnostic.to_dict() for source).
+    '''
+    return json.dumps([diag.to_dict(source) for diag in diagnostics])
+
+def _field_count(message):
+    # Return the number of positional arguments that the str.format()
+    # fields of message take, or None if it is not a format string for
+    # them.  error() has no named arguments, so a lone brace or a named
+    # field ("Expected '{' or '}'") must be part of the text.
+    try:
+        fields = [name for _, name, _, _ in string.Formatter().parse(message)
+                  if name is not None]
+    except ValueError:
+        return None
+    auto = numbered = 0
+    for name in fields:
+        first = name.split('.')[0].split('[')[0]
+        if not first:
+            auto += 1
+        elif first.isdigit():
+            numbered = max(numbered, int(first) + 1)
+        else:
+            return None
+    return max(auto, numbered)
+
+def _format_args(message, args, filename):
+    # Return (args, filename) for the arguments of error().  Raises
+    # TypeError unless message has a field for each of args.
+    if not args:
+        return args, filename
+    fields = _field_count(message)
+    if fields == len(args):
+        return args, filename
+    # Before messages took format arguments, the filename was the third
+    # positional argument of error().  That form is deprecated, and only
+    # recognized for a message with no fields.
+    if not fields and len(args) == 1 and isinstance(args[0], str) \
+            and filename is None:
+        warnings.warn("pass the filename of an error as filename=", DeprecationWarning,
+                      stacklevel=3)
+        return (), args[0]
+    raise TypeError("error message {!r} does not have one field for each of its "
+                    "arguments {!r}".format(message, args))
+
+class ErrorSink(object):
+    '''
+    Receives the diagnostics reported during one compilation.  Each one
+    is passed to the diagnostic subscribers, and to the subscribers as
+    a message string, and if record is True, it is added to diagnostics.
+    filename is used for the errors reported without a filename.
+    '''
+    def __init__(self, filename=None, record=True):
+        self.filename = filename
+        self.record = record
+        self.subscribers = []
+        self.diagnostic_subscribers = []
+        self.diagnostics = []
+        self.num_errors = 0
+
+    def error(self, lineno, message, *args, filename=None, code=None, span=None,
+              severity="error"):
+        '''
+        Report a compiler error to this sink (see error())
+        '''
+        args, filename = _format_args(message, args, filename)
+        self.report(Diagnostic(lineno, message, args, code, span, severity, filename))
+
+    def report(self, diag):
+        '''
+        Report a Diagnostic to this sink.  It is given the filename of
+        the sink if it does not have one.
+        '''
+        if diag.filename is None:
+            diag.filename = self.filename
+        if self.diagnostic_subscribers:
+            for subscriber in self.diagnostic_subscribers:
+                subscriber(diag)
+        if self.subscribers:
+            errmsg = str(diag)
+            for subscriber in self.subscribers:
+                subscriber(errmsg)
+        if self.record:
+            self.diagnostics.append(diag)
+        if diag.severity == "error":
+            self.num_errors += 1
+
+    def errors_reported(self):
+        '''
+        Return number of errors reported to this sink
+        '''
+        return self.num_errors
+
+    def clear_errors(self):
+        '''
+        Clear the number of errors reported to this sink.
+        '''
+        self.num_errors = 0
+
+    def messages(self):
+        '''
+        Return the list of messages reported to this sink.
+        '''
+        return [str(diag) for diag in self.diagnostics]
+
+    def __repr__(self):
+        return "ErrorSink(%r, %d errors)" % (self.filename, self.num_errors)
+
+# The shared sink does not record errors, since nothing would ever
+# clear them out.
+_current_sink = ContextVar('error_sink', default=ErrorSink(record=False))
+
+@contextmanager
+def error_sink(sink=None):
+    '''
+    Context manager that reports all errors inside it into sink, or
+    into a new ErrorSink if sink is None, and returns the sink.
+    '''
+    if sink is None:
+        sink = ErrorSink()
+    token = _current_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _current_sink.reset(token)
+
+def current_sink():
+    '''
+    Return the sink that errors are currently reported into.
+    '''
+    return _current_sink.get()
+
+def error(lineno, message, *args, filename=None, code=None, span=None, severity="error"):
+    '''
+    Report a compiler error to all subscribers.  message is formatted
+    with args by str.format().  Raises TypeError unless it has a field
+    for each of args.  The old form error(lineno, message, filename),
+    for a message with no fields, is deprecated but still accepted.
+    '''
+    args, filename = _format_args(message, args, filename)
+    _current_sink.get().report(Diagnostic(lineno, message, args, code, span, severity,
+                                          filename))
+
+def report(diag):
+    '''
+    Report a Diagnostic, such as one collected in another process.
+    '''
+    _current_sink.get().report(diag)
 
 def errors_reported():
     '''
     Return number of errors reported
     '''
-    return _num_errors
+    return _current_sink.get().num_errors
 
 def clear_errors():
     '''
     Clear the total number of errors reported.
     '''
-    global _num_errors
-    _num_errors = 0
+    _current_sink.get().num_errors = 0
 
 @contextmanager
 def subscribe_errors(handler):
@@ -94,11 +335,36 @@ def subscribe_errors(handler):
     with subscribe_errors(handler):
          ... do compiler ops ...
     '''
-    _subscribers.append(handler)
+    subscribers = _current_sink.get().subscribers
+    subscribers.append(handler)
+    try:
+        yield
+    finally:
+        subscribers.remove(handler)
+
+@contextmanager
+def subscribe_diagnostics(handler):
+    '''
+    Context manager like subscribe_errors(), except that handler is
+    called with each Diagnostic rather than its message string.
+    '''
+    subscribers = _current_sink.get().diagnostic_subscribers
+    subscribers.append(handler)
     try:
         yield
     finally:
-        _subscribers.remove(handler)
-    
-    
+        subscribers.remove(handler)
 
+@contextmanager
+def error_filename(filename):
+    '''
+    Context manager that supplies filename for the errors reported
+    inside it that do not give a filename of their own.
+    '''
+    sink = _current_sink.get()
+    saved = sink.filename
+    sink.filename = filename
+    try:
+        yield
+    finally:
+        sink.filename = saved
@@ -2,29 +2,489 @@
 '''
 The Expr compiler.  Entry point for everything
 '''
-if __name__ == '__main__':
-    import exprlex
-    import exprparse
-    import exprcheck
-    import exprcode
-    import exprpygen
-    import exprconst
-
-    import sys
-    from errors import subscribe_errors, errors_reported
-    lexer = exprlex.make_lexer()
-    parser = exprparse.make_parser()
-    with subscribe_errors(lambda msg: sys.stdout.write(msg+"\n")):
-        program = parser.parse(open(sys.argv[1]).read())
+
+import os
+import sys
+import json
+import stat
+import hashlib
+import weakref
+import itertools
+import threading
+import collections
+import socketserver
+import multiprocessing
+import concurrent.futures
+
+import exprlex
+import exprparse
+import exprcheck
+import exprcode
+import exprconst
+import exprcache
+
+from errors import errors_reported, error_sink, error_filename, ErrorSink, Diagnostic, report
+
+class CompileResult(object):
+    '''
+    The outcome of compiling one program with compile_text().  code is the
+    3-address code from exprcode.generate_code(), or None if there were
+    errors, and diagnostics is the list of errors.Diagnostic reported for
+    the file.  errors gives them as error messages.
+    '''
+    def __init__(self, filename, code, diagnostics):
+        self.filename = filename
+        self.code = code
+        self.diagnostics = diagnostics
+
+    @property
+    def errors(self):
+        return [str(diag) for diag in self.diagnostics]
+
+    def __repr__(self):
+        return "CompileResult(%r, %d errors)" % (self.filename, len(self.diagnostics))
+
+def compile_text(text, lexer, parser, filename=None, sink=None):
+    '''
+    Compile the source text to 3-address code with the given lexer and
+    parser and return a CompileResult.  The errors are reported into
+    sink, or a new ErrorSink if it is None, rather than the current
+    sink, so several compiles can run at once.  If filename is given,
+    it is added to each error message.  If there are syntax errors,
+    the program is not checked and only they are reported.
+    '''
+    code = None
+    with error_sink(sink or ErrorSink()) as sink, error_filename(filename):
+        lexer.lineno = 1
+        program = parser.parse(text, lexer=lexer)
+        # A tree recovered from syntax errors is not checked, as it
+        # would only give more errors caused by the syntax errors
+        if program is None or errors_reported():
+            return CompileResult(filename, None, sink.diagnostics)
         # Check the program
         exprcheck.check_program(program)
         # If no errors occurred, generate code
         if not errors_reported():
-            # Fold constants
             program = exprconst.fold_constants(program)
-            # Generate 3 address code IR
             code = exprcode.generate_code(program)
-            # Emit Python code
-            exprpygen.emit_pycode("main", code)
-            print("if __name__ == '__main__':")
-            print("     main()")
+    return CompileResult(filename, code, sink.diagnostics)
+
+def internal_error(exc, filename=None):
+    '''
+    Return a Diagnostic for the exception exc raised by the compiler
+    itself while compiling, rather than an error in the program.
+    '''
+    return Diagnostic(None, "Internal compiler error: {}: {}", (type(exc).__name__, str(exc)),
+                      code="internal-error", filename=filename)
+
+def compile_file(path, lexer, parser):
+    '''
+    Compile the file at path with compile_text().  The filename is
+    added to each error message.  If the compiler fails with an
+    exception, the result has no code, and an internal_error() after
+    the errors reported before the failure, so that one file does not
+    stop the others given to compile_many() or compile_parallel().
+    '''
+    with open(path) as f:
+        text = f.read()
+    sink = ErrorSink()
+    try:
+        return compile_text(text, lexer, parser, path, sink)
+    except Exception as e:
+        sink.report(internal_error(e, path))
+        return CompileResult(path, None, sink.diagnostics)
+
+def compile_many(paths, backend="ply"):
+    '''
+    Compile each of the files in paths with compile_file() and return a
+    list of CompileResults in the same order.  One lexer and one parser
+    (see exprparse.make_parser() for backend) are made up front and
+    used for every file.
+    '''
+    lexer = exprlex.make_lexer()
+    parser = exprparse.make_parser(backend=backend)
+    return [compile_file(path, lexer, parser) for path in paths]
+
+# ----------------------------------------------------------------------
+# Compiling in a process pool.
+#
+# Each worker process makes its own lexer and parser once, when it
+# starts, and then compiles whole batches of files with compile_file().
+# The workers are started with the "spawn" method rather than forked,
+# so that they do not inherit the state of this process.  The errors of
+# each file come back in its CompileResult, including an internal error
+# for a file that crashes the compiler (see compile_file()), so that
+# the rest of its batch is still compiled.
+
+_worker_lexer = None
+_worker_parser = None
+
+def _init_worker(backend):
+    global _worker_lexer, _worker_parser
+    _worker_lexer = exprlex.make_lexer()
+    _worker_parser = exprparse.make_parser(backend=backend)
+
+def _compile_batch(paths):
+    return [compile_file(path, _worker_lexer, _worker_parser) for path in paths]
+
+def compile_parallel(paths, workers=None, chunksize=16, ordered=True, backend="ply"):
+    '''
+    Compile the files in paths in a pool of worker processes and
+    generate a CompileResult for each one as it becomes available.
+    workers defaults to the number of CPUs.  The files are handed out
+    chunksize at a time.  If ordered is True, the results come in the
+    same order as paths; otherwise in the order the chunks finish.
+
+    Only a few chunks per worker are queued at any time, so the results
+    of a long list of files are not all held in memory at once.
+    '''
+    workers = workers or os.cpu_count() or 1
+    chunks = (paths[n:n + chunksize] for n in range(0, len(paths), chunksize))
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                initializer=_init_worker,
+                                                initargs=(backend,)) as pool:
+        pending = collections.deque(pool.submit(_compile_batch, chunk)
+                                    for chunk in itertools.islice(chunks, 2 * workers))
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(pool.submit(_compile_batch, chunk))
+            for result in future.result():
+                yield result
+
+# ----------------------------------------------------------------------
+# Compiling from asyncio.
+#
+# An asyncio program (a language server, say, or a web service) cannot
+# call compile_text() directly without stalling its event loop for the
+# length of the compile.  compile_source() runs the compile in an
+# executor instead.  compile_text() reports the errors of each compile
+# into an ErrorSink of its own (see errors.py), so compiles in different
+# threads do not see each other's errors.  Lexers and parsers are not safe to share between threads, so every
+# executor thread makes its own the first time it is used.
+
+class AsyncCompiler(object):
+    '''
+    Runs compile_text() for asyncio code.  At most limit compiles are
+    in progress at any time; the others wait their turn in
+    compile_source().  The compiles run in executor, or in the default
+    executor of the event loop if it is None.  It must be an executor
+    that runs in threads of this process.
+
+    The limit applies to each event loop separately, so the same
+    AsyncCompiler can be used from one asyncio.run() after another.
+    '''
+    def __init__(self, limit=4, executor=None, backend="ply"):
+        self.limit = limit
+        self.executor = executor
+        self.backend = backend
+        # An asyncio.Semaphore can only be used in one event loop, so
+        # there is one for each loop, made when first needed
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    async def compile_source(self, text, filename=None):
+        '''
+        Compile the source text and return its CompileResult.
+        '''
+        # asyncio is imported here, as it takes longer to import than
+        # the rest of the compiler
+        import asyncio
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        async with semaphore:
+            return await loop.run_in_executor(self.executor, self._compile, text, filename)
+
+    def _compile(self, text, filename):
+        local = self._local
+        if not hasattr(local, "parser"):
+            # Making the parser may write the table cache
+            with self._lock:
+                local.lexer = exprlex.make_lexer()
+                local.parser = exprparse.make_parser(backend=self.backend)
+        return compile_text(text, local.lexer, local.parser, filename)
+
+_async_compiler = None
+
+async def compile_source(text, filename=None):
+    '''
+    Compile the source text with a shared AsyncCompiler and return its
+    CompileResult.  Use an AsyncCompiler of your own to choose the limit
+    on compiles in progress, the executor or the parser backend.
+    '''
+    global _async_compiler
+    if _async_compiler is None:
+        _async_compiler = AsyncCompiler()
+    return await _async_compiler.compile_source(text, filename)
+
+# ----------------------------------------------------------------------
+# Compile cache.
+#
+# The same source files are compiled again and again without changing.
+# CompileCache keeps the final output of each compile (the listing of
+# its code and its errors) on disk under a digest of the source text
+# and of the compiler, so that compile_listing() can give the output
+# again without lexing, parsing, checking, folding or generating code.
+# The compiler digest covers the grammar and the source of every module
+# that a compile goes through.  After any change to the compiler, the
+# old entries are no longer found, and are evicted in time as the least
+# recently used.
+
+_PIPELINE_MODULES = ('errors', 'exprlex', 'exprparse', 'exprast', 'exprvisit', 'exprdispatch',
+                     'exprcheck', 'exprtype', 'exprconst', 'exprcode', 'exprblock', 'expr')
+
+_compiler_fingerprint = None
+
+def compiler_fingerprint():
+    '''
+    Return a digest identifying this version of the compiler: its
+    grammar and the source of each module of the compile pipeline.
+    '''
+    global _compiler_fingerprint
+    if _compiler_fingerprint is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        sources = []
+        for name in _PIPELINE_MODULES:
+            with open(os.path.join(directory, name + ".py"), 'rb') as f:
+                sources.append((name, hashlib.sha1(f.read()).hexdigest()))
+        _compiler_fingerprint = exprcache.fingerprint(exprparse.grammar_signature(), sources)
+    return _compiler_fingerprint
+
+class CompileCache(exprcache.ContentCache):
+    '''
+    On-disk cache of the output of compile_listing(), in the "compiled"
+    subdirectory of the cache directory (see exprcache.py).  When the
+    entries take more than max_bytes, the least recently used ones are
+    evicted.
+    '''
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        super().__init__("compiled", directory, max_bytes)
+
+    def key(self, text):
+        '''
+        Return the key of the entry for the source text.
+        '''
+        digest = hashlib.sha256(compiler_fingerprint().encode('ascii'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def lookup(self, text):
+        '''
+        Return (listing, diagnostics) saved for the source text, or None.
+        The Diagnostics have their message text already formatted, and
+        no filename.
+        '''
+        data = self.get(self.key(text))
+        if data is None:
+            return None
+        try:
+            entry = json.loads(data.decode('utf-8'))
+            diagnostics = [Diagnostic(lineno, message, code=code, severity=severity,
+                                      span=tuple(span) if span else None)
+                           for lineno, message, code, span, severity in entry["diagnostics"]]
+            return entry["listing"], diagnostics
+        except (ValueError, KeyError, TypeError):
+            # A damaged entry counts as a miss, and is replaced
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def save(self, text, listing, diagnostics):
+        '''
+        Save the listing and the diagnostics from compiling the source text.
+        '''
+        entry = {"listing": listing,
+                 "diagnostics": [[diag.lineno, diag.text(), diag.code, diag.span, diag.severity]
+                                 for diag in diagnostics]}
+        self.put(self.key(text), json.dumps(entry).encode('utf-8'))
+
+def compile_listing(text, lexer=None, parser=None, filename=None, sink=None, cache=None):
+    '''
+    Compile the source text with compile_text() and return the listing
+    of its code from exprcode.list_code(), or None if there were errors.
+    The errors are reported into sink as by compile_text().  A lexer
+    and parser are made if not given.
+
+    If cache is a CompileCache holding the output for text, its errors
+    are reported again and its listing returned, without compiling.
+    Otherwise the output is saved in the cache.
+    '''
+    if cache is not None:
+        cached = cache.lookup(text)
+        if cached is not None:
+            listing, diagnostics = cached
+            with error_sink(sink or ErrorSink()), error_filename(filename):
+                for diag in diagnostics:
+                    report(diag)
+            return listing
+    result = compile_text(text, lexer or exprlex.make_lexer(), parser or exprparse.make_parser(),
+                          filename, sink)
+    listing = None
+    if result.code is not None:
+        listing = exprcode.list_code(result.code)
+    if cache is not None:
+        cache.save(text, listing, result.diagnostics)
+    return listing
+
+# ----------------------------------------------------------------------
+# Compile server.
+#
+# Starting Python, importing the compiler and loading the parser tables
+# takes far longer than compiling a small program.  "expr.py --serve"
+# does all of that once and then compiles one request after another
+# with the same lexer and parser.  Requests and responses are JSON
+# objects, one per line:
+#
+#     {"source": "var x int = 1;", "filename": "x.e"}
+#     {"errors": ["x.e:1: ..."], "code": null}
+#
+# filename is optional and only used in the error messages.  code is
+# the listing from exprcode.list_code(), or null if there were errors.
+# If the compiler itself fails on a request, the response has the
+# errors reported before the failure followed by an "Internal compiler
+# error: ..." error, and the server goes on to the next request.
+# If the request has "diagnostics": true, the response also has the
+# errors as a "diagnostics" list of objects, for tools (see
+# errors.Diagnostic.to_dict()).
+# The server talks over stdin/stdout, or over a Unix domain socket if
+# given a path.  exprclient.py is a client that can stand in for
+# running "python expr.py file.e".
+
+class CompileServer(object):
+    '''
+    Compiles the requests of the compile server with one lexer and
+    parser (see exprparse.make_parser() for backend), and with cache
+    if it is a CompileCache.
+    '''
+    def __init__(self, backend="ply", cache=None):
+        self.lexer = exprlex.make_lexer()
+        self.parser = exprparse.make_parser(backend=backend)
+        self.cache = cache
+
+    def handle(self, line):
+        '''
+        Compile the request in one line of JSON and return the response
+        as a line of JSON (without the newline).
+        '''
+        try:
+            request = json.loads(line)
+            text = request["source"]
+            filename = request.get("filename")
+            diagnostics = request.get("diagnostics")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return json.dumps({"errors": ["Bad request: %s" % e], "code": None})
+        sink = ErrorSink()
+        try:
+            code = compile_listing(text, self.lexer, self.parser, filename, sink, self.cache)
+        except Exception as e:
+            # A bug in the compiler must not take down the server, or
+            # leave the client waiting for a response
+            sink.report(internal_error(e, filename))
+            code = None
+        response = {"errors": sink.messages(), "code": code}
+        if diagnostics:
+            response["diagnostics"] = [diag.to_dict(text) for diag in sink.diagnostics]
+        return json.dumps(response)
+
+    def serve_stdio(self, infile=sys.stdin, outfile=sys.stdout):
+        '''
+        Answer the requests read from infile until it is closed.
+        '''
+        for line in infile:
+            if line.strip():
+                outfile.write(self.handle(line) + "\n")
+                outfile.flush()
+
+    def serve_socket(self, path):
+        '''
+        Listen on a Unix domain socket at path and answer the requests
+        of each connection in turn, until interrupted.  A socket left
+        behind at path by an earlier server is replaced.
+        '''
+        compiler = self
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if line.strip():
+                        response = compiler.handle(line.decode('utf-8')) + "\n"
+                        self.wfile.write(response.encode('utf-8'))
+                        self.wfile.flush()
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+        with socketserver.UnixStreamServer(path, Handler) as server:
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(path)
+
+def main(argv):
+    '''
+    Command line entry point:
+
+        bash % python expr.py good.e                  # Compile a file
+        bash % python expr.py --no-cache good.e       # Compile without the cache
+        bash % python expr.py --cache-stats           # Show compile cache statistics
+        bash % python expr.py --serve                 # Serve on stdin/stdout
+        bash % python expr.py --serve /tmp/expr.sock  # Serve on a socket
+
+    Files are compiled with a CompileCache in the cache directory (see
+    exprcache.py), unless --no-cache is given.
+    '''
+    usage = "usage: %s [[--no-cache] file.e | --cache-stats | --serve [socket]]\n" % argv[0]
+    if len(argv) < 2:
+        sys.stderr.write(usage)
+        raise SystemExit(1)
+    if argv[1] == '--serve':
+        server = CompileServer()
+        try:
+            if len(argv) > 2:
+                server.serve_socket(argv[2])
+            else:
+                server.serve_stdio()
+        except KeyboardInterrupt:
+            pass
+        return
+    if argv[1] == '--cache-stats':
+        stats = CompileCache().stats()
+        lookups = stats["hits"] + stats["misses"]
+        print("%d entries, %d bytes" % (stats["entries"], stats["bytes"]))
+        print("%d hits, %d misses (%.1f%% hits), %d evictions" % (
+            stats["hits"], stats["misses"], 100.0 * stats["hits"] / (lookups or 1),
+            stats["evictions"]))
+        return
+    cache = None
+    if argv[1] == '--no-cache':
+        argv = argv[1:]
+        if len(argv) < 2:
+            sys.stderr.write(usage)
+            raise SystemExit(1)
+    else:
+        try:
+            cache = CompileCache()
+        except OSError:
+            pass
+    with open(argv[1]) as f:
+        text = f.read()
+    sink = ErrorSink()
+    sink.subscribers.append(lambda msg: sys.stdout.write(msg+"\n"))
+    try:
+        listing = compile_listing(text, sink=sink, cache=cache)
+    finally:
+        if cache is not None:
+            cache.save_stats()
+    if listing is not None:
+        print(listing)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -9,8 +9,28 @@ each kind of grammar rule.  A few sample AST nodes can be found at the
 top of this file.  You will need to add more on your own.
 '''
 
+class _Slotted(type):
+    '''
+    Metaclass of the AST nodes.  Each node class gets __slots__ for its
+    _fields and _attributes (except those its base classes already
+    have), so nodes do not carry a per-instance __dict__.  _attributes
+    names the attributes that are filled in after the node is made,
+    like lineno by the parser or check_type by exprcheck; a node cannot
+    hold any attribute that is not in one of the two.
+    '''
+    def __new__(meta, name, bases, namespace):
+        if '__slots__' not in namespace:
+            inherited = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    inherited.update(getattr(klass, '__slots__', ()))
+            names = list(namespace.get('_fields', ())) + list(namespace.get('_attributes', ()))
+            namespace['__slots__'] = tuple(name for name in dict.fromkeys(names)
+                                           if name not in inherited)
+        return type.__new__(meta, name, bases, namespace)
+
 # DO NOT MODIFY
-class AST(object):
+class AST(object, metaclass=_Slotted):
     '''
     Base class for all of the AST nodes.  Each node is expected to
     define the _fields attribute which lists the names of stored
@@ -19,6 +39,7 @@ class AST(object):
     additional arguments specified as keywords are also assigned. 
     '''
     _fields = []
+    _attributes = ['lineno']
     def __init__(self,*args,**kwargs):
         assert len(args) == len(self._fields)
         for name,value in zip(self._fields,args):
@@ -30,9 +51,9 @@ class AST(object):
     def __repr__(self):
         excluded = {"lineno"}
         return "{}[{}]".format(self.__class__.__name__, 
-                              {key: value 
-                               for key, value in vars(self).items() 
-                               if not key.startswith("_") and not key in excluded})
+                              {key: getattr(self, key)
+                               for key in list(self._fields) + list(self._attributes)
+                               if hasattr(self, key) and not key in excluded})
 
 # ----------------------------------------------------------------------
 # Specific AST nodes.
@@ -50,26 +71,51 @@ class AST(object):
 # way up to building the complete grammar
 # ----------------------------------------------------------------------
 
+# The _attributes of expressions and of declarations.  check_type is
+# set by exprcheck, and gen_location by exprcode.  parm is the function
+# parameter that a function call argument is passed to.
+_expr_attributes = ['lineno', 'check_type', 'gen_location', 'parm']
+_decl_attributes = ['lineno', 'check_type', 'scope_level']
+
 class Literal(AST):
     _fields = ['value']          
+    _attributes = _expr_attributes
 
 class Typename(AST):
     _fields = ['name']          
+    _attributes = ['lineno', 'check_type']
 
 class Location(AST):
     _fields = ['name']          
+    _attributes = _expr_attributes
 
 class LoadLocation(AST):
     _fields = ['location']          
+    _attributes = _expr_attributes
 
 class Unaryop(AST):
     _fields = ['op','expr']           
+    _attributes = _expr_attributes
 
 class Binop(AST):
     _fields = ['op','left','right']          
+    _attributes = _expr_attributes
     
 class Relop(AST):
     _fields = ['op','left','right']          
+    _attributes = _expr_attributes
+
+# A run of the same left-associative operator, such as a + b + c + d,
+# as one node.  The operands are combined from left to right, so it
+# means the same as the left-deep Binop/Relop tree it replaces.  Only
+# made by parsers asked to flatten chains (see exprparse.py).
+class BinopChain(AST):
+    _fields = ['op','operands']
+    _attributes = _expr_attributes
+
+class RelopChain(AST):
+    _fields = ['op','operands']
+    _attributes = _expr_attributes
     
 class AssignmentStatement(AST):
     _fields = ['location','expr']          
@@ -89,12 +135,15 @@ class Statements(AST):
 
 class Program(AST):
     _fields = ['statements']          
+    _attributes = ['lineno', 'environment', 'symtab']
 
 class VarDeclaration(AST):
     _fields = ['name','typename','expr']          
+    _attributes = _decl_attributes
     
 class ConstDeclaration(AST):
     _fields = ['name','expr']          
+    _attributes = _decl_attributes
     
 class IfStatement(AST):
     _fields = ['expr', 'truebranch', 'falsebranch']
@@ -104,6 +153,7 @@ class WhileStatement(AST):
 
 class FuncStatement(AST):
     _fields = ['name', 'returntype', 'parameters', 'expr']
+    _attributes = _decl_attributes
 
 class FuncParameterList(AST):
     _fields = ['parameters']
@@ -119,6 +169,7 @@ class FuncParameter(VarDeclaration):
 
 class FuncCall(AST):
     _fields = ['name', 'arguments']
+    _attributes = _expr_attributes
 
 class FuncCallArguments(AST):
     _fields = ['arguments']
@@ -131,10 +182,17 @@ class FuncCallArguments(AST):
 
 class FuncCallArgument(AST):
     _fields = ['expr']
+    _attributes = _expr_attributes
 
 class ReturnStatement(AST):
     _fields = ['expr']
 
+# Placeholder for a statement that could not be parsed.  If the bad
+# text was followed by a { block }, the statements parsed from the
+# block are kept.
+class ErrorStatement(AST):
+    _fields = ['statements']
+
 
 # ----------------------------------------------------------------------
 #                  DO NOT MODIFY ANYTHING BELOW HERE
@@ -0,0 +1,879 @@
+# exprbench.py
+'''
+Benchmarks for the Expr compiler.
+
+Each benchmark is a function named bench_name() that prints a small
+table of timings.  Run them from the command line:
+
+     bash % python exprbench.py                  # Run everything
+     bash % python exprbench.py lexer_startup    # Run one benchmark
+
+Timings are the best of several runs, reported in milliseconds.
+'''
+
+import os
+import re
+import sys
+import glob
+import time
+import shutil
+import tempfile
+import types
+import tracemalloc
+
+from errors import subscribe_errors
+
+def timed(func, repeat=5):
+    '''
+    Return the best wall-clock time of func() over repeat runs.
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(label, seconds):
+    print("    %-44s %10.3f ms" % (label, seconds * 1000))
+
+def peak_memory(func):
+    '''
+    Run func() and return (result, peak bytes allocated while it ran).
+    '''
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def report_memory(label, nbytes):
+    print("    %-44s %10.1f MB" % (label, nbytes / (1024 * 1024)))
+
+def sample_source(size, parses=False):
+    '''
+    Return Expr source text of at least size characters, made by
+    repeating the sample programs in tests/.  If parses is True, the
+    programs with syntax errors are left out.
+    '''
+    texts = []
+    testdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+    for filename in sorted(glob.glob(os.path.join(testdir, '*.e'))):
+        with open(filename) as f:
+            texts.append(f.read())
+    if parses:
+        import exprparse
+        parser = exprparse.make_parser(backend="rd")
+        errors = []
+        def parses_cleanly(text):
+            del errors[:]
+            with subscribe_errors(errors.append):
+                parser.parse(text)
+            return not errors
+        texts = list(filter(parses_cleanly, texts))
+    chunk = "\n".join(texts) + "\n"
+    return chunk * (size // len(chunk) + 1)
+
+def lex_all(lexer, text):
+    '''
+    Run text through lexer, discarding the tokens and any errors.
+    '''
+    with subscribe_errors(lambda msg: None):
+        lexer.input(text)
+        for tok in iter(lexer.token, None):
+            pass
+
+# ----------------------------------------------------------------------
+# Benchmarks
+
+def bench_lexer_startup():
+    '''
+    Cost of make_lexer() in a fresh process.  The regex module cache
+    is purged before each run so that pattern compilation is counted.
+    '''
+    import exprlex
+    cache_dir = tempfile.mkdtemp()
+    try:
+        def cold():
+            re.purge()
+            exprlex.make_lexer()
+        def cold_cache():
+            shutil.rmtree(cache_dir)
+            re.purge()
+            exprlex.make_lexer(optimize=True, cache_dir=cache_dir)
+        def warm_cache():
+            re.purge()
+            exprlex.make_lexer(optimize=True, cache_dir=cache_dir)
+        report("make_lexer()", timed(cold))
+        report("make_lexer(optimize=True), empty cache", timed(cold_cache))
+        report("make_lexer(optimize=True), warm cache", timed(warm_cache))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def bench_lexer_backends():
+    '''
+    Tokenizing a 4MB source with each lexer backend.
+    '''
+    import exprlex
+    text = sample_source(4 * 1024 * 1024)
+    for backend in ("ply", "scanner"):
+        lexer = exprlex.make_lexer(backend=backend)
+        report("backend=%r, %d bytes" % (backend, len(text)),
+               timed(lambda: lex_all(lexer, text), repeat=3))
+
+def bench_string_escapes():
+    '''
+    Decoding escape codes in string literals, alone and as part of
+    lexing a source that is mostly string constants.
+    '''
+    import exprlex
+    class Token(object):
+        lexer = exprlex.Scanner()
+    values = ['plain text %d' % n for n in range(20000)] + \
+             [r'a\tb\nc\\d\b41\"e %d\r' % n for n in range(20000)]
+    def decode():
+        tok = Token()
+        for value in values:
+            tok.value = value
+            exprlex._replace_escape_codes(tok)
+    report("_replace_escape_codes(), %d strings" % len(values), timed(decode))
+
+    text = "".join('print "%s";\n' % value for value in values)
+    for backend in ("ply", "scanner"):
+        lexer = exprlex.make_lexer(backend=backend)
+        report("backend=%r, %d string tokens" % (backend, len(values)),
+               timed(lambda: lex_all(lexer, text)))
+
+def bench_token_memory():
+    '''
+    Peak memory of holding every token of a 4MB source in a list,
+    with PLY LexTokens and with compact Token records.
+    '''
+    import exprlex
+    text = sample_source(4 * 1024 * 1024)
+    for label, options in (("LexToken", {}), ("compact Token", {"compact": True})):
+        lexer = exprlex.make_lexer(backend="scanner", **options)
+        def collect():
+            with subscribe_errors(lambda msg: None):
+                lexer.input(text)
+                return list(iter(lexer.token, None))
+        toks, nbytes = peak_memory(collect)
+        report_memory("%s, %d tokens" % (label, len(toks)), nbytes)
+        del toks
+
+def bench_ast_memory():
+    '''
+    Peak memory of a program of 1M AST nodes, with the slotted node
+    classes of exprast and with equivalent classes that keep their
+    attributes in a per-instance __dict__.
+    '''
+    import exprast
+    class DictAST(object):
+        _fields = []
+        def __init__(self, *args, **kwargs):
+            for name, value in zip(self._fields, args):
+                setattr(self, name, value)
+            for name, value in kwargs.items():
+                setattr(self, name, value)
+    names = ('Program', 'Statements', 'AssignmentStatement', 'Location',
+             'LoadLocation', 'Binop', 'Literal')
+    slotted = [getattr(exprast, name) for name in names]
+    unslotted = [type(name, (DictAST,), {'_fields': getattr(exprast, name)._fields})
+                 for name in names]
+    def build(Program, Statements, AssignmentStatement, Location, LoadLocation,
+              Binop, Literal):
+        # x = y + n;  is six nodes, checked as the type checker would
+        statements = []
+        for n in range(1000000 // 6):
+            expr = Binop('+', LoadLocation(Location('y', lineno=n), lineno=n),
+                         Literal(n, lineno=n), lineno=n)
+            expr.check_type = expr.left.check_type = expr.right.check_type = int
+            statements.append(AssignmentStatement(Location('x', lineno=n), expr, lineno=n))
+        return Program(Statements(statements))
+    for label, classes in (("__dict__ nodes", unslotted), ("slotted nodes", slotted)):
+        program, nbytes = peak_memory(lambda: build(*classes))
+        report_memory("%s, %d nodes" % (label, 6 * len(program.statements.statements) + 2),
+                      nbytes)
+        del program
+
+def bench_ast_store():
+    '''
+    Memory kept by a program of 1M AST nodes as a tree of exprast nodes
+    and in an exprstore.ASTStore, and the time taken by flatten() and
+    each pass over a program of 400 functions in either form.
+    '''
+    import pickle
+    import exprast
+    import exprlex
+    import exprparse
+    import exprcheck
+    import exprconst
+    import exprcode
+    from exprstore import ASTStore
+    from errors import error_sink
+    def build():
+        # x = y + n;  is six nodes, with lineno and check_type set
+        statements = []
+        for n in range(1000000 // 6):
+            expr = exprast.Binop('+', exprast.LoadLocation(exprast.Location('y', lineno=n), lineno=n),
+                                 exprast.Literal(n, lineno=n), lineno=n)
+            expr.check_type = expr.left.check_type = expr.right.check_type = int
+            statements.append(exprast.AssignmentStatement(exprast.Location('x', lineno=n),
+                                                          expr, lineno=n))
+        return exprast.Program(exprast.Statements(statements))
+    def to_store():
+        store = ASTStore()
+        store.add(build())
+        return store
+    for label, func in (("exprast nodes", build), ("ASTStore", to_store)):
+        tracemalloc.start()
+        try:
+            kept = func()
+            nbytes = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        report_memory("%s, 1M nodes" % label, nbytes)
+        del kept
+
+    unit = '''func f%d int(x int) {
+    var y int = x * 2 + %d;
+    var s float = 1.5;
+    while y > 0 {
+        if y > 3 && x < 10 {
+            print y + x * 3 - 1;
+        } else {
+            print -y;
+        }
+        s = s * 2.0;
+        y = y - 1;
+    }
+    print s;
+}
+'''
+    text = "".join(unit % (n, n) for n in range(400))
+    with error_sink():
+        parsed = pickle.dumps(exprparse.make_parser().parse(text, lexer=exprlex.make_lexer()))
+    def checked(program):
+        with error_sink():
+            exprcheck.check_program(program)
+        return program
+    def tree():
+        return pickle.loads(parsed)
+    def stored():
+        return ASTStore().add(pickle.loads(parsed))
+    for label, make in (("exprast nodes", tree), ("ASTStore", stored)):
+        report("%s, add to store" % label if make is stored else "%s, unpickle" % label,
+               timed(make))
+        for name, prepare, run in (
+                ("flatten", make, exprast.flatten),
+                ("check", make, checked),
+                ("fold", lambda: checked(make()), exprconst.fold_constants),
+                ("generate code", lambda: exprconst.fold_constants(checked(make())),
+                 exprcode.generate_code)):
+            copies = [prepare() for _ in range(5)]
+            report("%s, %s" % (label, name), timed(lambda: run(copies.pop())))
+
+def bench_serialize():
+    '''
+    Getting a checked program of 400 functions by parsing and checking
+    the source, by loading it with exprserial and by unpickling it,
+    and the time to write it and the size written by each.
+    '''
+    import pickle
+    import exprlex
+    import exprparse
+    import exprcheck
+    import exprserial
+    from errors import error_sink
+    unit = '''func f%d int(x int) {
+    var y int = x * 2 + %d;
+    var s float = 1.5;
+    while y > 0 {
+        if y > 3 && x < 10 {
+            print y + x * 3 - 1;
+        } else {
+            print -y;
+        }
+        s = s * 2.0;
+        y = y - 1;
+    }
+    print s;
+}
+'''
+    text = "".join(unit % (n, n) for n in range(400))
+    lexer = exprlex.make_lexer()
+    parser = exprparse.make_parser()
+    def parse_and_check():
+        with error_sink():
+            program = parser.parse(text, lexer=lexer)
+            exprcheck.check_program(program)
+        return program
+    program = parse_and_check()
+    report("parse and check %d characters" % len(text), timed(parse_and_check))
+    data = exprserial.dumps(program)
+    report("exprserial.dumps(), %d bytes" % len(data), timed(lambda: exprserial.dumps(program)))
+    report("exprserial.loads()", timed(lambda: exprserial.loads(data)))
+    data = pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+    report("pickle.dumps(), %d bytes" % len(data),
+           timed(lambda: pickle.dumps(program, pickle.HIGHEST_PROTOCOL)))
+    report("pickle.loads()", timed(lambda: pickle.loads(data)))
+
+def bench_lex_parallel():
+    '''
+    lex_parallel() on a 16MB file with different numbers of workers,
+    against the scanner reading the same file serially.  Building the
+    tokens from what the workers send back costs the parent about half
+    as much as lexing, so more workers only help with as many free CPUs.
+    '''
+    import exprlex
+    with tempfile.NamedTemporaryFile("w", suffix=".e", delete=False) as f:
+        f.write(sample_source(16 * 1024 * 1024))
+    try:
+        lexer = exprlex.make_lexer(backend="scanner", compact=True)
+        def serial():
+            with subscribe_errors(lambda msg: None), open(f.name) as source:
+                lexer.input(source)
+                return list(iter(lexer.token, None))
+        report("serial scanner", timed(serial, repeat=1))
+        for workers in (1, 2, 4):
+            def parallel():
+                with subscribe_errors(lambda msg: None):
+                    return exprlex.lex_parallel(f.name, workers=workers, compact=True)
+            report("lex_parallel(workers=%d)" % workers, timed(parallel, repeat=1))
+    finally:
+        os.remove(f.name)
+
+def bench_incremental_lexing():
+    '''
+    Typing into the middle of 10k and 100k line sources with
+    IncrementalLexer, against re-lexing the whole text once.  The
+    editor's own buffer update is not counted.
+    '''
+    import exprlex
+    chunk = sample_source(1)
+    for lines in (10000, 100000):
+        text = chunk * (lines // chunk.count('\n') + 1)
+        lexer = exprlex.make_lexer(backend="scanner")
+        report("full re-lex, %d lines" % lines, timed(lambda: lex_all(lexer, text), repeat=1))
+        with subscribe_errors(lambda msg: None):
+            inc = exprlex.IncrementalLexer(text)
+            offset = text.index('\n', len(text) // 2) + 1
+            keys = 'var x int = 1 + 2;\n' * 10
+            elapsed = 0
+            for n, key in enumerate(keys):
+                text = text[:offset + n] + key + text[offset + n:]
+                start = time.perf_counter()
+                inc.edit(offset + n, 0, key, text)
+                elapsed += time.perf_counter() - start
+        report("per keystroke, %d lines" % lines, elapsed / len(keys))
+
+def bench_parser_backends():
+    '''
+    Parsing a 1MB source with each parser backend.  Both read their
+    tokens from the scanner, so the difference is in the parser.
+    '''
+    import exprlex
+    import exprparse
+    text = sample_source(1024 * 1024, parses=True)
+    lexer = exprlex.make_lexer(backend="scanner")
+    report("lexing only, %d bytes" % len(text), timed(lambda: lex_all(lexer, text), repeat=3))
+    for backend in ("ply", "rd"):
+        parser = exprparse.make_parser(backend=backend)
+        def parse():
+            with subscribe_errors(lambda msg: None):
+                parser.parse(text, lexer=lexer)
+        report("backend=%r, %d bytes" % (backend, len(text)), timed(parse, repeat=3))
+
+def bench_long_expressions():
+    '''
+    Parsing, checking, folding and generating code for a function that
+    prints one long sum, with the LALR parser, the recursive-descent
+    parser, and the recursive-descent parser building flattened chains.
+    The unflattened trees are as deep as the sum is long.
+    '''
+    import exprlex
+    import exprparse
+    import exprcheck
+    import exprconst
+    import exprcode
+    from errors import clear_errors
+    lexer = exprlex.make_lexer(backend="scanner")
+    for terms in (1000, 10000, 100000):
+        text = "func main int() {\n var a int = 1;\n print %s;\n}\n" % \
+               " + ".join(["a"] * terms)
+        for label, options in (("ply", {}), ("rd", {"backend": "rd"}),
+                               ("rd, flatten", {"backend": "rd", "flatten": True})):
+            parser = exprparse.make_parser(**options)
+            def parse():
+                with subscribe_errors(lambda msg: None):
+                    return parser.parse(text, lexer=lexer)
+            report("%s, parse %d terms" % (label, terms), timed(parse, repeat=1))
+            def compile_all():
+                clear_errors()
+                with subscribe_errors(lambda msg: None):
+                    program = parser.parse(text, lexer=lexer)
+                    exprcheck.check_program(program)
+                    exprcode.generate_code(exprconst.fold_constants(program))
+            try:
+                report("%s, parse to code %d terms" % (label, terms), timed(compile_all, repeat=1))
+            except RecursionError:
+                print("    %-44s %13s" % ("%s, parse to code %d terms" % (label, terms),
+                                          "RecursionError"))
+
+def bench_nested_statements():
+    '''
+    Parsing, checking, folding and generating code for a function made
+    of if statements nested inside each other.
+    '''
+    import exprlex
+    import exprparse
+    import exprcheck
+    import exprconst
+    import exprcode
+    from errors import error_sink
+    lexer = exprlex.make_lexer(backend="scanner")
+    parser = exprparse.make_parser()
+    for depth in (1000, 10000, 100000):
+        text = "func main int() {\n var a int = 1;\n%s print a;\n%s}\n" % \
+               (" if a > 0 {\n" * depth, " }\n" * depth)
+        def compile_all():
+            with error_sink():
+                program = parser.parse(text, lexer=lexer)
+                exprcheck.check_program(program)
+                exprcode.generate_code(exprconst.fold_constants(program))
+        try:
+            report("parse to code, %d levels" % depth, timed(compile_all, repeat=1))
+        except RecursionError:
+            print("    %-44s %13s" % ("parse to code, %d levels" % depth, "RecursionError"))
+
+def bench_parse_parallel():
+    '''
+    parse_parallel() on a file of 50000 small functions with different
+    numbers of workers, against parsing the same file serially.
+    '''
+    import exprlex
+    import exprparse
+    template = (
+        "func f%d int(x int, y int) {\n"
+        "    var z int = x + y * %d;\n"
+        "    if z > 10 { print z; } else { print x; }\n"
+        "    return z;\n"
+        "}\n")
+    with tempfile.NamedTemporaryFile("w", suffix=".e", delete=False) as f:
+        f.write("".join(template % (n, n) for n in range(50000)))
+    try:
+        for backend in ("ply", "rd"):
+            parser = exprparse.make_parser(backend=backend)
+            lexer = exprlex.make_lexer(backend="scanner")
+            def serial():
+                with subscribe_errors(lambda msg: None), open(f.name) as source:
+                    return parser.parse(source.read(), lexer=lexer)
+            report("backend=%r, serial" % backend, timed(serial, repeat=1))
+            for workers in (2, 4):
+                def parallel():
+                    with subscribe_errors(lambda msg: None):
+                        return exprparse.parse_parallel(f.name, workers=workers,
+                                                        backend=backend)
+                report("backend=%r, parse_parallel(workers=%d)" % (backend, workers),
+                       timed(parallel, repeat=1))
+    finally:
+        os.remove(f.name)
+
+def bench_incremental_parsing():
+    '''
+    Reparsing a file of 2000 small functions after changing one of
+    them, with IncrementalParser and with a full parse.  The reparse
+    only parses the changed function, but makes new nodes for all of
+    them, so it saves about half the time of a full parse.
+    '''
+    import exprlex
+    import exprparse
+    template = (
+        "func f%d int(x int, y int) {\n"
+        "    var z int = x + y * %d;\n"
+        "    if z > 10 { print z; } else { print x; }\n"
+        "    return z;\n"
+        "}\n")
+    versions = []
+    for edit in range(5):
+        funcs = [template % (n, n) for n in range(2000)]
+        funcs[1000] = template % (1000, -edit)
+        versions.append("".join(funcs))
+    for backend in ("ply", "rd"):
+        parser = exprparse.make_parser(backend=backend)
+        lexer = exprlex.make_lexer(backend="scanner")
+        def full():
+            for text in versions:
+                lexer.lineno = 1
+                parser.parse(text, lexer=lexer)
+        report("backend=%r, full parse" % backend, timed(full, repeat=1) / len(versions))
+        inc = exprparse.IncrementalParser(backend=backend)
+        inc.parse(versions[-1])
+        report("backend=%r, IncrementalParser" % backend,
+               timed(lambda: [inc.parse(text) for text in versions], repeat=1) / len(versions))
+
+def bench_many_errors():
+    '''
+    Lexing machine-generated input with 50000 illegal characters, with
+    the errors only recorded, with a subscriber that takes the message
+    strings, and then turning the recorded errors into JSON.
+    '''
+    import exprlex
+    from errors import error_sink, diagnostics_json
+    text = "var x int = 1; $\n" * 50000
+    lexer = exprlex.make_lexer(backend="scanner")
+    def lex():
+        lexer.input(text)
+        for tok in iter(lexer.token, None):
+            pass
+    def recorded():
+        with error_sink():
+            lex()
+    def subscribed():
+        with error_sink(), subscribe_errors(lambda msg: None):
+            lex()
+    report("recorded only", timed(recorded, repeat=3))
+    report("message subscriber", timed(subscribed, repeat=3))
+    with error_sink() as sink:
+        lex()
+    report("diagnostics_json(), %d errors" % len(sink.diagnostics),
+           timed(lambda: diagnostics_json(sink.diagnostics, text), repeat=3))
+
+def sample_files(directory, count):
+    '''
+    Fill directory with count copies of the sample programs in tests/
+    and return their paths.
+    '''
+    testdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+    # The checker raises an exception on errors.e
+    samples = [filename for filename in sorted(glob.glob(os.path.join(testdir, '*.e')))
+               if os.path.basename(filename) != 'errors.e']
+    paths = []
+    for n in range(count):
+        path = os.path.join(directory, "f%d.e" % n)
+        shutil.copy(samples[n % len(samples)], path)
+        paths.append(path)
+    return paths
+
+def bench_compile_many():
+    '''
+    Compiling 500 small files with one compile_many() call, which makes
+    the lexer and parser once, against one call per file.
+    '''
+    import expr
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = sample_files(tmpdir, 500)
+        def one_call():
+            expr.compile_many(paths)
+        def call_per_file():
+            for path in paths:
+                expr.compile_many([path])
+        report("compile_many(), %d files" % len(paths), timed(one_call, repeat=3))
+        report("compile_many() per file, %d files" % len(paths), timed(call_per_file, repeat=3))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_compile_parallel():
+    '''
+    Throughput of compile_parallel() on 4000 small files with 1, 2, 4
+    and 8 workers, against compile_many() in this process.  Worker
+    start-up is included.
+    '''
+    import expr
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = sample_files(tmpdir, 4000)
+        def serial():
+            expr.compile_many(paths)
+        elapsed = timed(serial, repeat=1)
+        report("compile_many(), %.0f files/s" % (len(paths) / elapsed), elapsed)
+        for workers in (1, 2, 4, 8):
+            def parallel():
+                for result in expr.compile_parallel(paths, workers=workers):
+                    pass
+            elapsed = timed(parallel, repeat=1)
+            report("workers=%d, %.0f files/s" % (workers, len(paths) / elapsed), elapsed)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_compile_server():
+    '''
+    Latency of compiling one small file by running expr.py in a new
+    process, against sending it to an "expr.py --serve" process that is
+    already running.
+    '''
+    import json
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    filename = os.path.join(here, 'tests', 'fngood.e')
+    with open(filename) as f:
+        request = json.dumps({"source": f.read()}) + "\n"
+    def new_process():
+        subprocess.run([sys.executable, os.path.join(here, 'expr.py'), filename],
+                       stdout=subprocess.DEVNULL, check=True)
+    report("python expr.py file.e", timed(new_process))
+    server = subprocess.Popen([sys.executable, os.path.join(here, 'expr.py'), '--serve'],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              universal_newlines=True)
+    try:
+        def send():
+            server.stdin.write(request)
+            server.stdin.flush()
+            server.stdout.readline()
+        send()
+        report("expr.py --serve, one request", timed(send, repeat=20))
+    finally:
+        server.stdin.close()
+        server.wait()
+
+def bench_compile_source():
+    '''
+    Compiling 200 sample programs from an asyncio event loop, calling
+    compile_text() directly against awaiting compile_source() with
+    limits of 1, 4 and 16 compiles in progress.  The longest stall is
+    the longest time the event loop went without running another task.
+    '''
+    import asyncio
+    import expr
+    import exprlex
+    import exprparse
+    tmpdir = tempfile.mkdtemp()
+    try:
+        texts = []
+        for path in sample_files(tmpdir, 200):
+            with open(path) as f:
+                texts.append(f.read())
+    finally:
+        shutil.rmtree(tmpdir)
+    async def run(compile_all):
+        stalls = [0.0]
+        async def ticker():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                stalls[0] = max(stalls[0], now - last)
+                last = now
+        task = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        await compile_all()
+        elapsed = time.perf_counter() - start
+        task.cancel()
+        return elapsed, stalls[0]
+    lexer = exprlex.make_lexer()
+    parser = exprparse.make_parser()
+    async def direct():
+        for text in texts:
+            expr.compile_text(text, lexer, parser)
+            await asyncio.sleep(0)
+    elapsed, stall = asyncio.run(run(direct))
+    report("compile_text(), longest stall %.1f ms" % (stall * 1000), elapsed)
+    for limit in (1, 4, 16):
+        async def awaited():
+            compiler = expr.AsyncCompiler(limit=limit)
+            await asyncio.gather(*[compiler.compile_source(text) for text in texts])
+        elapsed, stall = asyncio.run(run(awaited))
+        report("compile_source(), limit=%d, longest stall %.1f ms" % (limit, stall * 1000),
+               elapsed)
+
+def bench_dispatch():
+    '''
+    Each pass over a program of 400 functions, with its methods found
+    through the per-class dispatch tables and with the method names
+    built and looked up with getattr() for every node, block or
+    instruction.  For the checker, folder and code generator that is
+    the enter_, visit_ and leave_ methods of every node.  The tree
+    walk uses a plain NodeVisitor that counts the nodes, given a
+    visit() that looks its methods up in a dispatch table, and the
+    emitter has one emit_ method per opcode that formats the
+    instruction.
+    '''
+    import pickle
+    import exprast
+    import exprblock
+    import exprdispatch
+    import exprlex
+    import exprparse
+    import exprcheck
+    import exprconst
+    import exprcode
+    import codegen
+    from errors import error_sink
+    unit = '''func f%d int(x int) {
+    var y int = x * 2 + %d;
+    var s float = 1.5;
+    while y > 0 {
+        if y > 3 && x < 10 {
+            print y + x * 3 - 1;
+        } else {
+            print -y;
+        }
+        s = s * 2.0;
+        y = y - 1;
+    }
+    print s;
+}
+'''
+    text = "".join(unit % (n, n) for n in range(400))
+    with error_sink():
+        program = exprparse.make_parser().parse(text, lexer=exprlex.make_lexer())
+        exprcheck.check_program(program)
+    parsed = pickle.dumps(program)
+    code = exprcode.generate_code(exprconst.fold_constants(program))
+    instructions = []
+    class Collect(exprblock.BlockVisitor):
+        def visit_BasicBlock(self, block):
+            instructions.extend(block.instructions)
+        def visit_IfBlock(self, block):
+            self.visit_BasicBlock(block)
+            yield block.truebranch
+            yield block.falsebranch
+        def visit_WhileBlock(self, block):
+            self.visit_BasicBlock(block)
+            yield block.truebranch
+    Collect().visit(code)
+
+    # Walkers that look up their methods by name every time
+    class _NoCache(exprdispatch.DispatchTable):
+        def __missing__(self, key):
+            return self.lookup(self.cls, key)
+    def uncached_pass(cls):
+        walker = type(cls.__name__, (cls,), { })
+        walker._dispatch_table = _NoCache(walker, cls._dispatch_table.lookup)
+        return walker
+    def visit_by_table(self, node):
+        if node:
+            visitor = exprdispatch.method_table(type(self), 'visit_')[type(node)]
+            if visitor is None:
+                return self.generic_visit(node)
+            return visitor(self, node)
+    def visit_blocks_by_name(self, block):
+        stack = []
+        while True:
+            if block:
+                name = "visit_%s" % type(block).__name__
+                result = getattr(self, name)(block) if hasattr(self, name) else None
+                following = getattr(block, "next", None)
+                if not isinstance(result, types.GeneratorType):
+                    block = following
+                    continue
+                stack.append((result, following))
+            if not stack:
+                break
+            gen, following = stack[-1]
+            try:
+                block = next(gen)
+            except StopIteration:
+                stack.pop()
+                block = following
+    def process_by_name(self, instructions):
+        for inst in instructions:
+            methname = "emit_" + inst[0]
+            if hasattr(self, methname):
+                yield getattr(self, methname)(*inst[1:])
+            else:
+                raise RuntimeError("No method %s" % methname)
+
+    def on_copies(func):
+        # Best time of func(program) on fresh copies of the parsed program
+        copies = [pickle.loads(parsed) for _ in range(5)]
+        def run():
+            with error_sink():
+                func(copies.pop())
+        return timed(run)
+    passes = (("check", exprcheck.CheckProgramVisitor, lambda checker, program: checker.visit(program)),
+              ("fold", exprconst.ConstantFolder, lambda folder, program: folder.visit(program)),
+              ("generate code", exprcode.GenerateCode, lambda gen, program: gen.visit(program)))
+    for label, cls, run in passes:
+        report("%s, dispatch table" % label, on_copies(lambda program: run(cls(), program)))
+        walker = uncached_pass(cls)
+        report("%s, getattr" % label, on_copies(lambda program: run(walker(), program)))
+
+    class CountNodes(exprast.NodeVisitor):
+        def __init__(self):
+            self.count = 0
+        def visit_Literal(self, node):
+            self.count += 1
+        def visit_Location(self, node):
+            self.count += 1
+        def generic_visit(self, node):
+            self.count += 1
+            exprast.NodeVisitor.generic_visit(self, node)
+    class CountNodesByTable(CountNodes):
+        visit = visit_by_table
+    for label, cls in (("dispatch table", CountNodesByTable), ("getattr", CountNodes)):
+        report("count nodes, %s" % label, on_copies(lambda program: cls().visit(program)))
+
+    class ListCode(exprcode.CodeLister):
+        pass
+    class ListCodeByName(exprcode.CodeLister):
+        visit = visit_blocks_by_name
+    for label, cls in (("dispatch table", ListCode), ("getattr", ListCodeByName)):
+        report("list code, %s" % label, timed(lambda: cls().visit(code)))
+
+    opcodes = set(inst[0] for inst in instructions)
+    methods = dict(("emit_" + opcode, lambda self, *args: repr(args)) for opcode in opcodes)
+    Emitter = type("Emitter", (codegen.CodeEmitter,), methods)
+    EmitterByName = type("EmitterByName", (Emitter,), {"process": process_by_name})
+    for label, cls in (("dispatch table", Emitter), ("getattr", EmitterByName)):
+        report("emit %d instructions, %s" % (len(instructions), label),
+               timed(lambda: list(cls().process(instructions))))
+
+def bench_compile_cache():
+    '''
+    Compiling 200 distinct sample programs with compile_listing(),
+    without a cache, with an empty CompileCache and with one that
+    already holds them all, and running "python expr.py" on 20 of
+    them with --no-cache and with the cache.
+    '''
+    import subprocess
+    import expr
+    import exprlex
+    import exprparse
+    from errors import ErrorSink
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = sample_files(tmpdir, 200)
+        texts = []
+        for n, path in enumerate(paths):
+            # Make each copy different so that each one is a separate entry
+            with open(path, 'a') as f:
+                f.write("\n// Copy %d\n" % n)
+            with open(path) as f:
+                texts.append(f.read())
+        lexer = exprlex.make_lexer()
+        parser = exprparse.make_parser()
+        cachedir = os.path.join(tmpdir, "cache")
+        def compile_all(cache):
+            for text in texts:
+                expr.compile_listing(text, lexer, parser, sink=ErrorSink(), cache=cache)
+        report("no cache", timed(lambda: compile_all(None), repeat=1))
+        cache = expr.CompileCache(cachedir)
+        report("empty cache", timed(lambda: compile_all(cache), repeat=1))
+        report("warm cache", timed(lambda: compile_all(cache), repeat=1))
+        env = dict(os.environ, EXPR_CACHE_DIR=cachedir)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'expr.py')
+        def run(options, path):
+            subprocess.run([sys.executable, script] + options + [path], env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        # Build the parser tables in the new cache directory
+        run(["--no-cache"], paths[0])
+        for label, options in (("--no-cache", ["--no-cache"]), ("warm cache", [])):
+            def run_all():
+                for path in paths[:20]:
+                    run(options, path)
+            report("python expr.py x 20, %s" % label, timed(run_all, repeat=1))
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(name[6:] for name in globals()
+                                   if name.startswith('bench_'))
+    for name in names:
+        print("%s:" % name)
+        globals()['bench_' + name]()
@@ -8,6 +8,10 @@ basic blocks.  You need to write all of the code needed yourself.
 See Exercise 7.
 '''
 
+from types import GeneratorType
+
+from exprdispatch import method_table
+
 class Block(object):
     def __init__(self):
         self.instructions = []   # Instructions in the block
@@ -54,11 +58,38 @@ class BlockVisitor(object):
     Class for visiting basic blocks.  Define a subclass and define
     methods such as visit_BasicBlock or visit_IfBlock to implement
     custom processing (similar to ASTs).
+
+    The blocks are visited without recursing, so that the depth to
+    which ifs and whiles are nested is limited only by memory.  A
+    visit_ method that calls self.visit() on the branches of a block
+    works as usual, but recurses.  To visit a branch without recursing,
+    write the method as a generator that yields the branch instead.
+    The method resumes once the whole chain of blocks starting at the
+    branch has been visited:
+
+        def visit_IfBlock(self, block):
+            yield block.truebranch
+            yield block.falsebranch
     '''
     def visit(self,block):
-        while block:
-            name = "visit_%s" % type(block).__name__
-            if hasattr(self,name):
-                getattr(self,name)(block)
-            block = getattr(block, "next", None)
-
+        methods = method_table(type(self), 'visit_')
+        # (generator, next block) for each block whose visit_ method
+        # is waiting for a branch to be visited
+        stack = []
+        while True:
+            if block:
+                method = methods[type(block)]
+                result = method(self, block) if method is not None else None
+                following = getattr(block, "next", None)
+                if type(result) is not GeneratorType:
+                    block = following
+                    continue
+                stack.append((result, following))
+            if not stack:
+                break
+            gen, following = stack[-1]
+            try:
+                block = next(gen)
+            except StopIteration:
+                stack.pop()
+                block = following
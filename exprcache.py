@@ -0,0 +1,205 @@
+# exprcache.py
+'''
+On-disk cache support.
+
+Several parts of the compiler produce artifacts that are expensive to
+build but only change when the compiler itself changes.  The LALR
+tables for the parser are the main example.  Rather than rebuilding
+them in every process, they are written to a cache directory and
+reused on the next run.
+
+The cache directory defaults to ~/.cache/expr.  To put it somewhere
+else, set the EXPR_CACHE_DIR environment variable or pass an explicit
+directory to the functions that use the cache.  For example:
+
+       bash % EXPR_CACHE_DIR=/tmp/exprcache python expr.py good.e
+
+Everything in the cache directory is disposable.  Deleting it simply
+forces the cached artifacts to be rebuilt.
+
+ContentCache keeps artifacts made from some input, such as the output
+of compiling a source file, under a key derived from the input, and
+bounds the space they take.
+'''
+
+import os
+import json
+import hashlib
+
+def get_cache_dir(path=None):
+    '''
+    Return the cache directory to use, creating it if necessary.
+    '''
+    if path is None:
+        path = os.environ.get("EXPR_CACHE_DIR") or \
+               os.path.join(os.path.expanduser("~"), ".cache", "expr")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def fingerprint(*parts):
+    '''
+    Return a short hex digest identifying the supplied parts.  Each
+    part is converted to a string with repr() before hashing.
+    '''
+    sig = hashlib.sha1()
+    for part in parts:
+        sig.update(repr(part).encode('utf-8'))
+        sig.update(b'\0')
+    return sig.hexdigest()[:16]
+
+def temp_name(filename):
+    '''
+    Return a temporary filename next to filename.  Artifacts are written
+    to the temporary name and then moved into place with os.replace()
+    so that other processes never see a partially written file.
+    '''
+    return "{}.{}.tmp".format(filename, os.getpid())
+
+class ContentCache(object):
+    '''
+    A cache of byte strings on disk, one file per entry, named by a key
+    such as a hex digest of the content the entry was made from.  The
+    entries are kept in the subdirectory name of the cache directory.
+
+    When the entries take more than max_bytes in all, the least
+    recently used ones are deleted.  Reading an entry marks it as used
+    by updating its modification time.  The directory is only scanned
+    for the sizes of the entries the first time an entry is added, and
+    again whenever the entries added since then may have taken it over
+    max_bytes.
+
+    hits, misses and evictions count what happened in this process.
+    save_stats() adds them to running totals kept in the directory,
+    and stats() reports those totals.
+    '''
+    def __init__(self, name, directory=None, max_bytes=64 * 1024 * 1024):
+        self.directory = os.path.join(get_cache_dir(directory), name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._saved = (0, 0, 0)
+        self._size = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".entry")
+
+    def get(self, key):
+        '''
+        Return the entry for key, or None if there is none.
+        '''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        '''
+        Store data as the entry for key, and evict the least recently used
+        entries if the cache is now over its size limit.  If the entry
+        cannot be written, the cache is left as it was.
+        '''
+        path = self._path(key)
+        tmpfile = temp_name(path)
+        try:
+            with open(tmpfile, 'wb') as f:
+                f.write(data)
+            os.replace(tmpfile, path)
+        except OSError:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            return
+        if self._size is not None:
+            self._size += len(data)
+        if self._size is None or self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        # Return a list of (mtime, size, path) for the entries
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".entry"):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        '''
+        Delete the least recently used entries until the entries take at
+        most max_bytes.
+        '''
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.evictions += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        self._size = total
+
+    def clear(self):
+        '''
+        Delete every entry.
+        '''
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size = None
+
+    def _stats_path(self):
+        return os.path.join(self.directory, "stats.json")
+
+    def _saved_totals(self):
+        try:
+            with open(self._stats_path()) as f:
+                totals = json.load(f)
+        except (OSError, ValueError):
+            totals = { }
+        return [totals.get(name, 0) for name in ("hits", "misses", "evictions")]
+
+    def save_stats(self):
+        '''
+        Add the counts of this process since the last call to the totals
+        kept in the cache directory.  Processes saving at the same moment
+        may lose some of each other's counts.
+        '''
+        counts = (self.hits, self.misses, self.evictions)
+        totals = [total + count - saved for total, count, saved
+                  in zip(self._saved_totals(), counts, self._saved)]
+        path = self._stats_path()
+        tmpfile = temp_name(path)
+        try:
+            with open(tmpfile, 'w') as f:
+                json.dump(dict(zip(("hits", "misses", "evictions"), totals)), f)
+            os.replace(tmpfile, path)
+        except OSError:
+            return
+        self._saved = counts
+
+    def stats(self):
+        '''
+        Return a dictionary of the saved totals of hits, misses and
+        evictions, with the number of entries and the bytes they take.
+        '''
+        entries = self._entries()
+        hits, misses, evictions = self._saved_totals()
+        return {"hits": hits, "misses": misses, "evictions": evictions,
+                "entries": len(entries), "bytes": sum(size for _, size, _ in entries)}
@@ -88,6 +88,7 @@ A shell of the code is provided below.
 
 from errors import error
 from exprast import *
+from exprvisit import IterativeNodeVisitor
 from exprtype import IntType, FloatType, StringType, BoolType, ExprType
 from pprint import pprint
 
@@ -150,7 +151,7 @@ class Environment(object):
             print("Scope for {}".format("ROOT" if scope.decl is None else scope.decl))
             pprint(scope, indent=indent*4, width=20)
 
-class CheckProgramVisitor(NodeVisitor):
+class CheckProgramVisitor(IterativeNodeVisitor):
     '''
     Program checking class.   This class uses the visitor pattern as described
     in exprast.py.   You need to define methods of the form visit_NodeName()
@@ -171,13 +172,13 @@ class CheckProgramVisitor(NodeVisitor):
     def check_type_unary(self, node, op, val):
         if hasattr(val, "check_type"):
             if op not in val.check_type.unary_ops:
-                error(node.lineno, "Unary operator {} not supported".format(op))
+                error(node.lineno, "Unary operator {} not supported", op, code="unsupported-operator")
             return val.check_type
 
     def check_type_binary(self, node, op, left, right):
         if hasattr(left, "check_type") and hasattr(right, "check_type"):
             if left.check_type != right.check_type:
-                error(node.lineno, "Binary operator {} does not have matching LHS/RHS types".format(op))
+                error(node.lineno, "Binary operator {} does not have matching LHS/RHS types", op, code="type-mismatch")
                 return left.check_type
             errside = None
             if op not in left.check_type.binary_ops:
@@ -185,14 +186,14 @@ class CheckProgramVisitor(NodeVisitor):
             if op not in right.check_type.binary_ops:
                 errside = "RHS"
             if errside is not None:
-                error(node.lineno, "Binary operator {} not supported on {} of expression".format(op, errside))
+                error(node.lineno, "Binary operator {} not supported on {} of expression", op, errside, code="unsupported-operator")
             # XXX: right now we just propagate the left type, but we should probably handle error conditions
             return left.check_type
 
     def check_type_rel(self, node, op, left, right):
         if hasattr(left, "check_type") and hasattr(right, "check_type"):
             if left.check_type != right.check_type:
-                error(node.lineno, "Relational operator {} does not have matching LHS/RHS types".format(op))
+                error(node.lineno, "Relational operator {} does not have matching LHS/RHS types", op, code="type-mismatch")
                 return left.check_type
             errside = None
             if op not in left.check_type.rel_ops:
@@ -200,7 +201,7 @@ class CheckProgramVisitor(NodeVisitor):
             if op not in right.check_type.rel_ops:
                 errside = "RHS"
             if errside is not None:
-                error(node.lineno, "Relational operator {} not supported on {} of expression".format(op, errside))
+                error(node.lineno, "Relational operator {} not supported on {} of expression", op, errside, code="unsupported-operator")
             # XXX: right now we just propagate the left type, but we should probably handle error conditions
             return BoolType
 
@@ -218,7 +219,7 @@ class CheckProgramVisitor(NodeVisitor):
                 self.environment.add_local(statement.location.name, statement.expr)
 
     def visit_Unaryop(self,node):
-        self.visit(node.expr)
+        yield node.expr
         # 1. Make sure that the operation is supported by the type
         check_type = self.check_type_unary(node, node.op, node.expr)
         # 2. Set the result type to the same as the operand
@@ -228,8 +229,8 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Make sure left and right operands have the same type
         # 2. Make sure the operation is supported
         # AM note: both are done in check_type_binary
-        self.visit(node.left)
-        self.visit(node.right)
+        yield node.left
+        yield node.right
         check_type = self.check_type_binary(node, node.op, node.left, node.right)
         # 3. Assign the result type
         node.check_type = check_type
@@ -238,20 +239,39 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Make sure left and right operands have the same type
         # 2. Make sure the operation is supported
         # AM note: both are done in check_type_binary
-        self.visit(node.left)
-        self.visit(node.right)
+        yield node.left
+        yield node.right
         check_type = self.check_type_rel(node, node.op, node.left, node.right)
         # 3. Assign the result type
         node.check_type = check_type
 
+    def visit_BinopChain(self,node):
+        # Check the operands pairwise from left to right, exactly as for
+        # the equivalent tree of Binop nodes.  The node itself stands in
+        # for the result so far.
+        for operand in node.operands:
+            yield operand
+        left = node.operands[0]
+        for right in node.operands[1:]:
+            node.check_type = self.check_type_binary(node, node.op, left, right)
+            left = node
+
+    def visit_RelopChain(self,node):
+        for operand in node.operands:
+            yield operand
+        left = node.operands[0]
+        for right in node.operands[1:]:
+            node.check_type = self.check_type_rel(node, node.op, left, right)
+            left = node
+
     def visit_AssignmentStatement(self,node):
         if not self.inside_function():
-            error(node.lineno, "Cannot assign variable '{}' outside function body".format(node.location.name))
+            error(node.lineno, "Cannot assign variable '{}' outside function body", node.location.name, code="outside-function")
             return
         # 1. Make sure the location of the assignment is defined
         sym = self.environment.lookup(node.location.name)
         if not sym:
-            error(node.lineno, "name '{}' not defined".format(node.location.name))
+            error(node.lineno, "name '{}' not defined", node.location.name, code="undefined-name")
         # 2. Check that assignment is allowed
         self.visit(node.expr)
         if isinstance(sym, VarDeclaration):
@@ -260,43 +280,43 @@ class CheckProgramVisitor(NodeVisitor):
                 declared_type = sym.check_type
                 value_type = node.expr.check_type
                 if declared_type != value_type:
-                    error(node.lineno, "Cannot assign {} to {}".format(value_type, declared_type))
+                    error(node.lineno, "Cannot assign {} to {}", value_type, declared_type, code="type-mismatch")
                     return
         if isinstance(sym, ConstDeclaration):
-            error(node.lineno, "Cannot assign to constant {}".format(sym.name))
+            error(node.lineno, "Cannot assign to constant {}", sym.name, code="const-assignment")
             return
         # 3. Check that the types match
         if hasattr(node.location, "check_type") and hasattr(node.expr, "check_type"):
             declared_type = node.location.check_type
             value_type = node.expr.check_type
             if declared_type != value_type:
-                error(node.lineno, "Cannot assign {} to {}".format(value_type, declared_type))
+                error(node.lineno, "Cannot assign {} to {}", value_type, declared_type, code="type-mismatch")
 
     def visit_IfStatement(self,node):
         if not self.inside_function():
-            error(node.lineno, "Cannot use if statement outside function body")
+            error(node.lineno, "Cannot use if statement outside function body", code="outside-function")
             return
-        self.visit(node.expr)
+        yield node.expr
         if node.expr.check_type != BoolType:
-            error(node.lineno, "Expression in if statement must evaluate to bool")
-        self.visit(node.truebranch)
+            error(node.lineno, "Expression in if statement must evaluate to bool", code="type-mismatch")
+        yield node.truebranch
         if node.falsebranch is not None:
-            self.visit(node.falsebranch)
+            yield node.falsebranch
 
     def visit_WhileStatement(self,node):
         if not self.inside_function():
-            error(node.lineno, "Cannot use while statement outside function body")
+            error(node.lineno, "Cannot use while statement outside function body", code="outside-function")
             return
-        self.visit(node.expr)
+        yield node.expr
         if node.expr.check_type != BoolType:
-            error(node.lineno, "Expression in while statement must evaluate to bool")
-        self.visit(node.truebranch)
+            error(node.lineno, "Expression in while statement must evaluate to bool", code="type-mismatch")
+        yield node.truebranch
 
     def visit_ConstDeclaration(self,node):
         node.scope_level = self.environment.scope_level()
         # 1. Check that the constant name is not already defined
         if self.environment.lookup(node.name) is not None:
-            error(node.lineno, "Attempted to redefine const '{}', not allowed".format(node.name))
+            error(node.lineno, "Attempted to redefine const '{}', not allowed", node.name, code="redefinition")
         # 2. Add an entry to the symbol table
         self.environment.add_local(node.name, node)
         self.visit(node.expr)
@@ -306,11 +326,11 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Check that the variable name is not already defined
         node.scope_level = self.environment.scope_level()
         if node.scope_level > 1:
-            error(node.lineno, "Nested functions not implemented")
+            error(node.lineno, "Nested functions not implemented", code="not-implemented")
             return
         self.environment.push(node)
         if self.environment.lookup(node.name) is not None:
-            error(node.lineno, "Attempted to redefine func '{}', not allowed".format(node.name))
+            error(node.lineno, "Attempted to redefine func '{}', not allowed", node.name, code="redefinition")
             return
         # 2. Add an entry to the symbol table, and also create a nested symbol
         # table for the function statement
@@ -335,23 +355,23 @@ class CheckProgramVisitor(NodeVisitor):
 
     def visit_FuncCall(self, node):
         if not self.inside_function():
-            error(node.lineno, "Cannot call function from outside function body; see main() for entry point")
+            error(node.lineno, "Cannot call function from outside function body; see main() for entry point", code="outside-function")
             return
         sym = self.environment.lookup(node.name)
         if not sym:
             self.environment.print()
-            error(node.lineno, "Function name '{}' not found".format(node.name))
+            error(node.lineno, "Function name '{}' not found", node.name, code="undefined-name")
             return
         if not isinstance(sym, FuncStatement):
-            error(node.lineno, "Tried to call non-function '{}'".format(node.name))
+            error(node.lineno, "Tried to call non-function '{}'", node.name, code="not-a-function")
             return
         if len(sym.parameters) != len(node.arguments):
-            error(node.lineno, "Number of arguments for call to function '{}' do not match function parameter declaration on line {}".format(node.name, sym.lineno))
+            error(node.lineno, "Number of arguments for call to function '{}' do not match function parameter declaration on line {}", node.name, sym.lineno, code="argument-count")
         self.visit(node.arguments)
         argerrors = False
         for arg, parm in zip(node.arguments.arguments, sym.parameters.parameters):
             if arg.check_type != parm.check_type:
-                error(node.lineno, "Argument type '{}' does not match parameter type '{}' in function call to '{}'".format(arg.check_type.typename, parm.check_type.typename, node.name))
+                error(node.lineno, "Argument type '{}' does not match parameter type '{}' in function call to '{}'", arg.check_type.typename, parm.check_type.typename, node.name, code="type-mismatch")
                 argerrors = True
             if argerrors:
                 return
@@ -364,19 +384,19 @@ class CheckProgramVisitor(NodeVisitor):
     def visit_ReturnStatement(self, node):
         self.visit(node.expr)
         if self.environment.peek().return_type() != node.expr.check_type:
-            error(node.lineno, "Type of return statement expression does not match declared return type for function")
+            error(node.lineno, "Type of return statement expression does not match declared return type for function", code="type-mismatch")
             return
 
     def visit_PrintStatement(self, node):
         if not self.inside_function():
-            error(node.lineno, "Cannot use print statement outside function body")
+            error(node.lineno, "Cannot use print statement outside function body", code="outside-function")
             return
         self.visit(node.expr)
 
     def visit_VarDeclaration(self,node):
         # 1. Check that the variable name is not already defined
         if self.environment.lookup(node.name) is not None:
-            error(node.lineno, "Attempted to redefine var '{}', not allowed".format(node.name))
+            error(node.lineno, "Attempted to redefine var '{}', not allowed", node.name, code="redefinition")
             return
         # 2. Add an entry to the symbol table
         self.environment.add_local(node.name, node)
@@ -397,7 +417,7 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Make sure the typename is valid and that it's actually a type
         sym = self.environment.lookup(node.name)
         if not isinstance(sym, ExprType):
-            error(node.lineno, "{} is not a valid type".format(node.name))
+            error(node.lineno, "{} is not a valid type", node.name, code="bad-type")
             return
         node.check_type = sym
 
@@ -405,7 +425,7 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Make sure the location is a valid variable or constant value
         sym = self.environment.lookup(node.name)
         if not sym:
-            error(node.lineno, "name '{}' not found".format(node.name))
+            error(node.lineno, "name '{}' not found", node.name, code="undefined-name")
         # 2. Assign the type of the location to the node
         node.check_type = sym.check_type
 
@@ -413,15 +433,15 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Make sure the loaded location is valid
         sym = self.environment.lookup(node.location.name)
         if not sym:
-            error(node.lineno, "name '{}' not found".format(node.location.name))
+            error(node.lineno, "name '{}' not found", node.location.name, code="undefined-name")
             return
         # 2. Assign the appropriate type
         if isinstance(sym, ExprType):
-            error(node.lineno, "cannot use {} outside of variable declarations".format(sym.typename))
+            error(node.lineno, "cannot use {} outside of variable declarations", sym.typename, code="bad-type")
             return
         check_type = sym.check_type
         if check_type is None:
-            error(node.lineno, "Using unrecognized type {}".format(valtype))
+            error(node.lineno, "Using unrecognized type {}", valtype, code="bad-type")
         node.check_type = check_type
 
     def visit_Literal(self,node):
@@ -429,7 +449,7 @@ class CheckProgramVisitor(NodeVisitor):
         valtype = type(node.value)
         check_type = self.typemap.get(valtype, None)
         if check_type is None:
-            error(node.lineno, "Using unrecognized type {}".format(valtype))
+            error(node.lineno, "Using unrecognized type {}", valtype, code="bad-type")
         node.check_type = check_type
         
 # ----------------------------------------------------------------------
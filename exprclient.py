@@ -0,0 +1,62 @@
+# exprclient.py
+'''
+Client for the compile server (see "Compile server" in expr.py).
+
+This is a drop-in replacement for running the compiler directly.  It
+prints the same output as "python expr.py file.e", but the file is
+compiled by a server that is already running, so there is no start-up
+cost per file:
+
+     bash % python expr.py --serve /tmp/expr.sock &
+     bash % export EXPR_SOCKET=/tmp/expr.sock
+     bash % python exprclient.py good.e
+
+If EXPR_SOCKET is not set, no server is listening there, or the server
+does not give a proper response, the file is compiled in this process
+instead, exactly as expr.py would.
+'''
+
+import os
+import sys
+import json
+import socket
+
+def compile_remote(text, path, filename=None):
+    '''
+    Send the source text to the compile server listening on the Unix
+    domain socket at path, and return its response as a dictionary
+    with "errors" and "code" keys.  Raises OSError if no server is
+    listening, and ValueError if the server closes the connection
+    without a response or sends one that is not a JSON object.
+    '''
+    request = {"source": text}
+    if filename:
+        request["filename"] = filename
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall((json.dumps(request) + "\n").encode('utf-8'))
+        with sock.makefile('rb') as f:
+            response = json.loads(f.readline().decode('utf-8'))
+    if not isinstance(response, dict) or "errors" not in response or "code" not in response:
+        raise ValueError("Bad response from compile server: %r" % (response,))
+    return response
+
+def main(argv):
+    path = os.environ.get("EXPR_SOCKET")
+    if len(argv) != 2 or argv[1].startswith('--') or not path:
+        import expr
+        return expr.main(argv)
+    with open(argv[1]) as f:
+        text = f.read()
+    try:
+        response = compile_remote(text, path)
+    except (OSError, ValueError):
+        import expr
+        return expr.main(argv)
+    for msg in response["errors"]:
+        sys.stdout.write(msg + "\n")
+    if response["code"] is not None:
+        print(response["code"])
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -124,13 +124,13 @@ generation class. Here is a rough idea of how it should work:
 # to use a different set of opcodes for ints as for strings.
 
 import exprtype
-import exprast
 import exprblock
+import exprvisit
 
 # STEP 2: Implement the following Node Visitor class so that it creates
 # a sequence of three-address code instructions and attaches it to
 # the top-level Program AST node.
-class GenerateCode(exprast.NodeVisitor):
+class GenerateCode(exprvisit.IterativeNodeVisitor):
     '''
     Node visitor class that creates 3-address encoded instruction sequences.
     '''
@@ -162,7 +162,7 @@ class GenerateCode(exprast.NodeVisitor):
         node.gen_location = target
 
     def visit_Unaryop(self,node):
-        self.visit(node.expr)
+        yield node.expr
         target = self.new_temp(node.check_type)
         instruction = node.check_type.unary_opcodes[node.op] 
         inst = (instruction, node.expr.gen_location, target)
@@ -177,8 +177,8 @@ class GenerateCode(exprast.NodeVisitor):
         node.gen_location = target
 
     def visit_Binop(self, node):
-        self.visit(node.left)
-        self.visit(node.right)
+        yield node.left
+        yield node.right
         target = self.new_temp(node.check_type)
         instruction = node.check_type.binary_opcodes[node.op]
         inst = (instruction, node.left.gen_location, node.right.gen_location, target)
@@ -186,14 +186,36 @@ class GenerateCode(exprast.NodeVisitor):
         node.gen_location = target
 
     def visit_Relop(self, node):
-        self.visit(node.left)
-        self.visit(node.right)
+        yield node.left
+        yield node.right
         target = self.new_temp(node.check_type)
         instruction = node.left.check_type.rel_opcodes[node.op]
         inst = (instruction, node.left.gen_location, node.right.gen_location, target)
         self.code.append(inst)
         node.gen_location = target
 
+    def visit_BinopChain(self, node):
+        # Same instructions as for the equivalent tree of Binop nodes
+        instruction = node.check_type.binary_opcodes[node.op]
+        yield from self.emit_chain(node, lambda lefttype: instruction)
+
+    def visit_RelopChain(self, node):
+        yield from self.emit_chain(node, lambda lefttype: lefttype.rel_opcodes[node.op])
+
+    def emit_chain(self, node, opcode):
+        # opcode(lefttype) gives the instruction combining a value of
+        # lefttype with the next operand
+        first = node.operands[0]
+        yield first
+        left, lefttype = first.gen_location, first.check_type
+        for operand in node.operands[1:]:
+            yield operand
+            target = self.new_temp(node.check_type)
+            inst = (opcode(lefttype), left, operand.gen_location, target)
+            self.code.append(inst)
+            left, lefttype = target, node.check_type
+        node.gen_location = left
+
     def visit_VarDeclaration(self, node):
         self.visit(node.expr)
         if node.scope_level == 0:
@@ -228,14 +250,14 @@ class GenerateCode(exprast.NodeVisitor):
         self.code.next = ifblock
         ifblock.truebranch = exprblock.BasicBlock()
         self.code = ifblock
-        self.visit(node.expr)
+        yield node.expr
         self.code.condvar = node.expr.gen_location
         self.code = ifblock.truebranch
-        self.visit(node.truebranch)
+        yield node.truebranch
         if node.falsebranch is not None:
             ifblock.falsebranch = exprblock.BasicBlock()
             self.code = ifblock.falsebranch
-            self.visit(node.falsebranch)
+            yield node.falsebranch
         # Done expanding if statement, now link to a fresh block
         self.code = exprblock.BasicBlock()
         ifblock.next = self.code
@@ -245,17 +267,16 @@ class GenerateCode(exprast.NodeVisitor):
         self.code.next = whileblock
         whileblock.truebranch = exprblock.BasicBlock()
         self.code = whileblock
-        self.visit(node.expr)
+        yield node.expr
         self.code.condvar = node.expr.gen_location
         self.code = whileblock.truebranch
         #print("visiting %r" % node)
-        self.visit(node.truebranch)
+        yield node.truebranch
         # Done expanding while statement, now link to fresh block
         self.code = exprblock.BasicBlock()
         whileblock.next = self.code
 
     def visit_FuncCall(self, node):
-        print("encountered function call")
         self.code.append(("new_frame",))
         self.visit(node.arguments)
         for arg in node.arguments.arguments:
@@ -266,6 +287,51 @@ class GenerateCode(exprast.NodeVisitor):
         for arg in node.arguments:
                 self.visit(arg)
 
+class CodeLister(exprblock.BlockVisitor):
+    '''
+    Block visitor that lists the 3-address code of a program as text,
+    one instruction per line, with the branches of if and while blocks
+    indented under their condition variable.
+    '''
+    def __init__(self):
+        self.lines = []
+        self.level = 0
+
+    def emit(self, line):
+        self.lines.append("    " * self.level + line)
+
+    def visit_BasicBlock(self, block):
+        for inst in block.instructions:
+            self.emit(repr(inst))
+
+    def visit_IfBlock(self, block):
+        self.visit_BasicBlock(block)
+        self.emit("if %s:" % block.condvar)
+        self.level += 1
+        yield block.truebranch
+        self.level -= 1
+        if block.falsebranch:
+            self.emit("else:")
+            self.level += 1
+            yield block.falsebranch
+            self.level -= 1
+
+    def visit_WhileBlock(self, block):
+        self.emit("while:")
+        self.level += 1
+        self.visit_BasicBlock(block)
+        self.emit("if not %s: break" % block.condvar)
+        yield block.truebranch
+        self.level -= 1
+
+def list_code(code):
+    '''
+    Return the text listing of the 3-address code from generate_code().
+    '''
+    lister = CodeLister()
+    lister.visit(code)
+    return "\n".join(lister.lines)
+
 
 
 
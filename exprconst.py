@@ -72,8 +72,9 @@ import exprtype
 # Implement the class below and make the indicated transformations
 
 import exprast
+import exprvisit
 
-class ConstantFolder(exprast.NodeTransformer):
+class ConstantFolder(exprvisit.IterativeNodeTransformer):
     def __init__(self, debug=False):
         self.debug = debug
 
@@ -86,8 +87,8 @@ class ConstantFolder(exprast.NodeTransformer):
     def visit_Binop(self,node):
         # If both the left and right are constant literals, replace the node
         # with a literal value that is the result of the binary operator
-        node.left = self.visit(node.left)
-        node.right = self.visit(node.right)
+        node.left = yield node.left
+        node.right = yield node.right
         if isinstance(node.left, exprast.Literal) and isinstance(node.right, exprast.Literal):
             foldop = node.check_type.binary_folds[node.op]
             replacement = exprast.Literal(foldop(node.left.value, node.right.value))
@@ -100,8 +101,8 @@ class ConstantFolder(exprast.NodeTransformer):
     def visit_Relop(self,node):
         # If both the left and right are constant literals, replace the node
         # with a literal value that is the result of the binary operator
-        node.left = self.visit(node.left)
-        node.right = self.visit(node.right)
+        node.left = yield node.left
+        node.right = yield node.right
         if isinstance(node.left, exprast.Literal) and isinstance(node.right, exprast.Literal):
             foldop = node.left.check_type.rel_folds[node.op]
             replacement = exprast.Literal(foldop(node.left.value, node.right.value))
@@ -111,10 +112,42 @@ class ConstantFolder(exprast.NodeTransformer):
             return replacement
         return node
 
+    def visit_BinopChain(self,node):
+        # The tree of Binop nodes for a chain is left-deep, so folding it
+        # only ever combines the leading run of constant operands
+        return (yield from self.fold_chain(node, lambda left: node.check_type.binary_folds))
+
+    def visit_RelopChain(self,node):
+        return (yield from self.fold_chain(node, lambda left: left.check_type.rel_folds))
+
+    def fold_chain(self, node, folds):
+        # Replace the leading constant operands by a single literal, or
+        # the whole node if every operand is constant.  folds(left) gives
+        # the table of fold functions to combine left with the next operand
+        operands = []
+        for operand in node.operands:
+            operands.append((yield operand))
+        node.operands = operands
+        folded, count = operands[0], 1
+        while count < len(operands) and isinstance(folded, exprast.Literal) \
+                and isinstance(operands[count], exprast.Literal):
+            foldop = folds(folded)[node.op]
+            folded = exprast.Literal(foldop(folded.value, operands[count].value))
+            folded.check_type = node.check_type
+            count += 1
+        if count == 1:
+            return node
+        if self.debug:
+            print("Folding {} =>\n\t{}".format(node, folded))
+        if count == len(operands):
+            return folded
+        node.operands[:count] = [folded]
+        return node
+
     def visit_Unaryop(self,node):
         # If the operand is a constant literal, replace the node with a
         # literal value that is the result of the unary operator
-        node.expr = self.visit(node.expr)
+        node.expr = yield node.expr
         if isinstance(node.expr, exprast.Literal):
             foldop = node.check_type.unary_folds[node.op]
             replacement = exprast.Literal(foldop(node.expr.value))
@@ -0,0 +1,82 @@
+# exprdispatch.py
+'''
+Method dispatch tables.
+
+The tree and block visitors and the code emitters all work the same
+way: for each item they find a method named after it, such as
+visit_Binop() for a Binop node or emit_add_int() for an add_int
+instruction, and call it.  Building the method name and looking it up
+with getattr() for every item is a noticeable part of the cost of a
+pass over a large program.
+
+method_table(cls, prefix) returns a table of the methods of cls whose
+names start with prefix.  It is indexed by the rest of the name, or
+by a class whose __name__ is the rest of the name, and gives the
+plain function (called with the instance as its first argument) or
+None if cls has no such method:
+
+       methods = method_table(type(self), 'visit_')
+       method = methods[type(node)]
+       if method is not None:
+           method(self, node)
+
+Each name is looked up only the first time it is used, and the table
+for each class and prefix is shared by all of its instances.  Methods
+must be defined on the class, not attached to instances.
+
+A walker that finds more than one method per item, or has fallbacks
+of its own, gets its table here too.  dispatch_table(cls, lookup)
+returns a table of whatever lookup(cls, key) gives for each key, again
+looked up only the first time the key is used.  IterativeNodeVisitor
+(see exprvisit.py) keeps the enter, visit and leave methods for each
+class of node in one of these.
+'''
+
+class DispatchTable(dict):
+    '''
+    Table of what lookup(cls, key) gives for each key.  Missing entries
+    are looked up and remembered.
+    '''
+    def __init__(self, cls, lookup):
+        super(DispatchTable, self).__init__()
+        self.cls = cls
+        self.lookup = lookup
+
+    def __missing__(self, key):
+        entry = self[key] = self.lookup(self.cls, key)
+        return entry
+
+class MethodTable(DispatchTable):
+    '''
+    Table of the methods of a class with a given name prefix.  Missing
+    entries are looked up on the class and remembered.
+    '''
+    def __init__(self, cls, prefix):
+        super(MethodTable, self).__init__(cls, self._method)
+        self.prefix = prefix
+
+    def _method(self, cls, key):
+        name = key if isinstance(key, str) else key.__name__
+        return getattr(cls, self.prefix + name, None)
+
+# (class, prefix) -> MethodTable and (class, lookup) -> DispatchTable
+_tables = { }
+
+def method_table(cls, prefix):
+    '''
+    Return the MethodTable of the methods of cls whose names start
+    with prefix.
+    '''
+    table = _tables.get((cls, prefix))
+    if table is None:
+        table = _tables.setdefault((cls, prefix), MethodTable(cls, prefix))
+    return table
+
+def dispatch_table(cls, lookup):
+    '''
+    Return the DispatchTable of cls for the function lookup.
+    '''
+    table = _tables.get((cls, lookup))
+    if table is None:
+        table = _tables.setdefault((cls, lookup), DispatchTable(cls, lookup))
+    return table
@@ -85,19 +85,32 @@ Once you are reasonably happy with the output, try running the unit tests.
 The unit tests are designed to stress test various corner cases.
 '''
 import re
+import os
+import codecs
+import sys
+import shutil
+import tempfile
+import importlib.util
+import concurrent.futures
+from array import array
 
 # ----------------------------------------------------------------------
 # The following import loads a function error(lineno,msg) that should be
 # used to report all error messages issued by your lexer.  Unit tests and
 # other features of the compiler will rely on this function.  See the
 # file errors.py for more documentation about the error handling mechanism.
-from errors import error
+from errors import error, error_sink, report
 
 # ----------------------------------------------------------------------
 # Lexers are defined using the ply.lex library.
 #
 # See http://www.dabeaz.com/ply/ply.html#ply_nn3
-from ply.lex import lex
+import ply.lex
+from ply.lex import lex, LexToken
+
+# ----------------------------------------------------------------------
+# Optimized lexers cache their master regexes on disk.  See exprcache.py
+import exprcache
 
 # ----------------------------------------------------------------------
 # Token list. This list identifies the complete list of token names
@@ -125,6 +138,9 @@ tokens = [
     'LCURL', 'RCURL'
 ]
 
+# Integer codes for the token names, used by compact Token records
+token_codes = { name: code for code, name in enumerate(tokens) }
+
 # ----------------------------------------------------------------------
 # Ignored characters (whitespace)
 #
@@ -189,21 +205,25 @@ def t_FLOAT(t):
 #     0x1234 or 0X1234 (hex)
 #
 # The value should be converted to a Python int when lexed.
-def t_INTEGER(t):
-    r'(\d+|0[Xx]\d+)'
+def _integer_value(text):
     # Conversion to a Python int
-    if t.value.startswith(('0x','0X')):
-        t.value = int(t.value,16)              
-    elif t.value.startswith('0'):
-        t.value = int(t.value,8)
+    if text.startswith(('0x','0X')):
+        return int(text,16)
+    elif text.startswith('0'):
+        return int(text,8)
     else:
-        t.value = int(t.value)
+        return int(text)
+
+def t_INTEGER(t):
+    r'(\d+|0[Xx]\d+)'
+    t.value = _integer_value(t.value)
     return t
 
+_bool_values = {"true": True, "false": False}
+
 def t_BOOL(t):
     r'(true|false)'
-    mapping = {"true": True, "false": False}
-    t.value = mapping[t.value]
+    t.value = _bool_values[t.value]
     return t
 
 # String constant. You must recognize text enclosed in quotes.
@@ -228,41 +248,51 @@ def t_BOOL(t):
 # The token value should be the string with all escape codes replaced by
 # their corresponding raw character code.
 
+# Every escape code maps to its replacement text in a single table,
+# including all of the \bhh forms.  An escape is a backslash followed by
+# either 'b' and two hex digits or any single character.  Anything not
+# in the table is a bad escape code.
+_escape_codes = {
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+    '\\': '\\',
+    '"': '"',
+}
+for _code in range(256):
+    for _digits in ('%x%x', '%x%X', '%X%x', '%X%X'):
+        _escape_codes['b' + _digits % divmod(_code, 16)] = chr(_code)
+del _code, _digits
+
+_escape_pat = re.compile(r'\\(b[0-9a-fA-F]{2}|.?)', re.DOTALL)
+
+def _decode_escapes(text, lineno):
+    '''
+    Return text with its escape codes replaced.  This is done in one
+    pass with re.sub() and a lookup in _escape_codes.
+    '''
+    if '\\' not in text:
+        return text
+    def replace(m):
+        value = _escape_codes.get(m.group(1))
+        if value is None:
+            error(lineno,"Bad string escape code '{}'", m.group(), code="bad-escape")
+            return m.group()
+        return value
+    return _escape_pat.sub(replace, text)
+
 def _replace_escape_codes(t):
     r'''
-    *** YOU MUST IMPLEMENT ***
-    
     Replace all of the valid escape codes \.. in a string with
-    their raw character code equivalents.   Suggest doing this
-    with re.sub()
+    their raw character code equivalents.
     '''
-    literals = {
-        r"\\n": "\n",
-        r"\\r": "\r",
-        r"\\t": "\t",
-        r"\\\\": r"\\",
-        r'\\"': r'"'
-    }
-    re_byte = r".*\\b(?P<val>[0-9a-fA-F]{2}).*"
-    byte_pat = re.compile(re_byte)
-    for pattern, repl in literals.items():
-        t.value = re.sub(pattern, repl, t.value)
-    matcher = byte_pat.match(t.value)
-    if matcher:
-        val = matcher.groupdict()["val"]
-        val = chr(int(val, 16))
-        # chomping first 2 and last 2 chars of pattern to eliminate .*
-        # yes, this is a bit hacky
-        t.value = re.sub(re_byte[2:-2], val, t.value)
-    # Error to use for reporting a bad escape code
-    if False:
-        error(t.lexer.lineno,"Bad string escape code '%s'" % escape_code)
-    
+    t.value = _decode_escapes(t.value, t.lexer.lineno)
+
 def t_STRING(t):
-    r'\".*?\"'
+    r'\"(\\.|[^\\"\n])*\"'
     # Convert t.value into a string with escape codes replaced by actual values.
     t.value = t.value[1:-1]
-    _replace_escape_codes(t)    # Must implement above
+    _replace_escape_codes(t)
     return t
 
 # ----------------------------------------------------------------------
@@ -312,31 +342,855 @@ def t_CPPCOMMENT(t):
 
 # Illegal character (generic error handling)
 def t_error(t):
-    error(t.lexer.lineno,"Illegal character %r" % t.value[0])
+    error(t.lexer.lineno,"Illegal character {!r}", t.value[0], code="illegal-character",
+          span=(t.lexpos, t.lexpos + 1))
     t.lexer.skip(1)
 
 # Unterminated C-style comment
 def t_COMMENT_UNTERM(t):
     r'/\*(.|\n)*$'
-    error(t.lexer.lineno,"Unterminated comment")
+    error(t.lexer.lineno,"Unterminated comment", code="unterminated-comment",
+          span=(t.lexpos, t.lexpos + len(t.value)))
 
 # Unterminated string literal
 def t_STRING_UNTERM(t):
     r'\"(\.|.)*?\n'
-    error(t.lexer.lineno,"Unterminated string literal")
+    error(t.lexer.lineno,"Unterminated string literal", code="unterminated-string",
+          span=(t.lexpos, t.lexpos + len(t.value) - 1))
     t.lexer.lineno += 1
     
+# ----------------------------------------------------------------------
+# Hand-written scanner.
+#
+# An alternative to the PLY lexer built from the rules above.  The
+# scanner looks at the first character of the token and dispatches to
+# a routine that only knows about the tokens that can start with that
+# character.  Sources given as a string take a faster path: the common
+# tokens are matched by one regex in a generator that keeps its state
+# in local variables, and only the rest is dispatched.  Either way it
+# produces the same token stream (types, values, line numbers and
+# error messages) as the PLY lexer, including its quirks.  For
+# example, 'trueish' lexes as BOOL followed by ID because t_BOOL is
+# tried before t_ID.
+#
+# Use make_lexer(backend="scanner") to get one.
+
+_float_re = re.compile(t_FLOAT.__doc__)
+_integer_re = re.compile(t_INTEGER.__doc__)
+_id_re = re.compile(t_ID.__doc__)
+_string_re = re.compile(t_STRING.__doc__)
+_keyword_types = { name: name.upper() for name in keywords }
+
+_bool_prefixes = ('true', 'false')
+
+# Operator spellings and their token types.  None is longer than two
+# characters.
+_operators = { }
+for _name, _value in sorted(list(globals().items())):
+    if _name.startswith('t_') and _name != 't_ignore' and isinstance(_value, str):
+        _operators[re.sub(r'\\(.)', r'\1', _value)] = _name[2:]
+del _name, _value
+
+# Whitespace, including newlines, is skipped a run at a time
+_whitespace = t_ignore + '\n'
+_whitespace_re = re.compile('[%s]+' % re.escape(_whitespace))
+
+# All of the common tokens, and the whitespace before them, in one
+# regex for sources given as a string.  Anything it doesn't match
+# (errors, unterminated comments and strings, non-ASCII digits and
+# trailing whitespace) is left to the dispatch routines.  In particular
+# a '/' followed by '*' is never a DIVIDE, so that an unterminated
+# comment is left to _skip_comment() to report.
+_master_re = re.compile(r'''
+    [%s]*
+    (?:(?P<newline>\n[%s]*)
+    | (?P<name>%s)
+    | (?P<FLOAT>%s)
+    | (?P<INTEGER>%s)
+    | (?P<STRING>%s)
+    | (?P<comment>/\*[^*]*\*+(?:[^*/][^*]*\*+)*/)
+    | (?P<cppcomment>//[^\n]*\n)
+    | (?P<operator>%s))
+''' % (re.escape(t_ignore), re.escape(_whitespace), t_ID.__doc__, t_FLOAT.__doc__, t_INTEGER.__doc__,
+       t_STRING.__doc__,
+       '|'.join(re.escape(text) if text != '/' else r'/(?!\*)'
+                for text in sorted(_operators, key=len, reverse=True))),
+    re.VERBOSE)
+
+def _read_chunks(source, chunksize):
+    '''
+    Generate the text of a file object or mmap chunksize at a time
+    '''
+    decoder = None
+    while True:
+        chunk = source.read(chunksize)
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            text = decoder.decode(chunk, final=not chunk)
+        else:
+            text = chunk
+        if text:
+            yield text
+        if not chunk:
+            return
+
+class Token(object):
+    '''
+    Compact token record made by a Scanner created with compact=True.
+    The token type is stored as an integer code (see token_codes) and
+    identifier values are interned, so a large token list costs far
+    less memory than the equivalent PLY LexToken objects.
+
+    The type, value, lineno and lexpos attributes are all the PLY
+    parser looks at, so these tokens can be fed straight to exprparse.
+    PLY also attaches a lexer attribute to the token handed to p_error()
+    if it does not already have one; the class-level default keeps it
+    from trying to set an attribute that the slots don't allow.
+    '''
+    __slots__ = ('code', 'value', 'lineno', 'lexpos')
+    lexer = None
+
+    def __init__(self, code, value, lineno, lexpos):
+        self.code = code
+        self.value = value
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+    @property
+    def type(self):
+        return tokens[self.code]
+
+    def __repr__(self):
+        return "Token(%s,%r,%d,%d)" % (self.type,self.value,self.lineno,self.lexpos)
+
+class Scanner(object):
+    '''
+    Single-pass scanner with the same interface as a PLY lexer:
+    input(), token(), iteration, and the lineno/lexpos attributes.
+
+    Unlike the PLY lexer, input() also accepts a file object (text or
+    binary) or an mmap.  The source is then read in chunks of chunksize
+    characters and only the unconsumed part of the current chunk is kept
+    in memory.  Chunks are cut at line boundaries, and /* ... */ comments
+    are skipped one chunk at a time, so memory use is bounded by the
+    chunk size plus the longest line.  Binary sources are decoded as
+    UTF-8.  Token lexpos values are always absolute offsets.
+
+    If compact is True, tokens are returned as Token records instead
+    of PLY LexToken objects.
+    '''
+    def __init__(self, compact=False):
+        self.compact = compact
+        self.lexdata = None
+        self.lexpos = 0
+        self.lexlen = 0
+        self.lineno = 1
+        self.lexoffset = 0         # Offset of lexdata[0] in the source
+        self._chunks = None        # Remaining chunks of a streamed source
+        self._pending = ''         # Read ahead past the last newline
+        self._tokens = None        # Token generator for a string source
+
+    def input(self, data, chunksize=65536):
+        if isinstance(data, str):
+            self.lexdata = data
+            self._chunks = None
+            self._tokens = self._scan_text()
+        else:
+            self.lexdata = ''
+            self._chunks = _read_chunks(data, chunksize)
+            self._tokens = None
+        self.lexpos = 0
+        self.lexlen = len(self.lexdata)
+        self.lexoffset = 0
+        self._pending = ''
+
+    def _refill(self, keep):
+        '''
+        Discard lexdata[:keep] and append the next lines of a streamed
+        source.  Returns False if there is no more input.
+        '''
+        if self._chunks is None:
+            return False
+        parts = [self._pending]
+        self._pending = ''
+        for chunk in self._chunks:
+            newline = chunk.rfind('\n')
+            if newline >= 0:
+                parts.append(chunk[:newline+1])
+                self._pending = chunk[newline+1:]
+                break
+            parts.append(chunk)
+        else:
+            self._chunks = None
+        text = ''.join(parts)
+        if not text:
+            return False
+        self.lexdata = self.lexdata[keep:] + text
+        self.lexoffset += keep
+        self.lexpos -= keep
+        self.lexlen = len(self.lexdata)
+        return True
+
+    def token(self):
+        if self._tokens is not None:
+            return next(self._tokens, None)
+        data = self.lexdata
+        if data is None:
+            raise RuntimeError("No input string given with input()")
+        dispatch = self._dispatch
+        pos = self.lexpos
+        while True:
+            if pos >= self.lexlen:
+                self.lexpos = pos
+                if not self._refill(pos):
+                    return None
+                data = self.lexdata
+                pos = self.lexpos
+            ch = data[pos]
+            if ch in _whitespace:
+                end = _whitespace_re.match(data, pos).end()
+                self.lineno += data.count('\n', pos, end)
+                pos = end
+                continue
+            tok = dispatch.get(ch, Scanner._scan_other)(self, data, pos)
+            if tok is not None:
+                return tok
+            # Skipping a comment may have refilled a streamed source
+            data = self.lexdata
+            pos = self.lexpos
+
+    def _scan_text(self):
+        # Generate the tokens of a string source.  Most tokens are found
+        # with a single match of _master_re, keeping the state in local
+        # variables, which is a lot faster than dispatching in token().
+        # The state is read when the first token is asked for, so lineno
+        # and lexpos may be set after input(), and is read again if they
+        # are changed while the tokens are being read.
+        data = self.lexdata
+        datalen = self.lexlen
+        pos = self.lexpos
+        lineno = self.lineno
+        offset = self.lexoffset
+        compact = self.compact
+        match = _master_re.match
+        while pos < datalen:
+            m = match(data, pos)
+            if m is None:
+                ch = data[pos]
+                if ch in _whitespace:
+                    end = _whitespace_re.match(data, pos).end()
+                    lineno += data.count('\n', pos, end)
+                    pos = end
+                    continue
+                self.lexpos = pos
+                self.lineno = lineno
+                tok = self._dispatch.get(ch, Scanner._scan_other)(self, data, pos)
+                if tok is not None:
+                    yield tok
+                pos = self.lexpos
+                lineno = self.lineno
+                continue
+            kind = m.lastgroup
+            end = m.end()
+            if kind == 'newline':
+                lineno += data.count('\n', pos, end)
+                pos = end
+                continue
+            pos = m.start(kind)
+            if kind == 'name':
+                value = m.group(kind)
+                type = _keyword_types.get(value)
+                if type is None:
+                    if value.startswith(_bool_prefixes):
+                        # t_BOOL is tried before t_ID, so 'trueish' is BOOL, ID
+                        if value.startswith('true'):
+                            type, value, end = 'BOOL', True, pos + 4
+                        else:
+                            type, value, end = 'BOOL', False, pos + 5
+                    else:
+                        type = 'ID'
+                        if compact:
+                            value = sys.intern(value)
+            elif kind == 'operator':
+                value = m.group(kind)
+                type = _operators[value]
+            elif kind == 'INTEGER':
+                type = kind
+                value = _integer_value(m.group(kind))
+            elif kind == 'FLOAT':
+                type = kind
+                value = float(m.group(kind))
+            elif kind == 'STRING':
+                type = kind
+                value = _decode_escapes(data[pos+1:end-1], lineno)
+            else:
+                # Comments
+                lineno += data.count('\n', pos, end)
+                pos = end
+                continue
+            if compact:
+                tok = Token(token_codes[type], value, lineno, offset + pos)
+            else:
+                tok = LexToken()
+                tok.type = type
+                tok.value = value
+                tok.lineno = lineno
+                tok.lexpos = offset + pos
+            self.lexpos = pos = end
+            self.lineno = lineno
+            yield tok
+            if self.lexpos != pos or self.lineno != lineno:
+                pos = self.lexpos
+                lineno = self.lineno
+        self.lexpos = pos
+        self.lineno = lineno
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        tok = self.token()
+        if tok is None:
+            raise StopIteration
+        return tok
+
+    def _make_token(self, type, value, lexpos, end):
+        self.lexpos = end
+        if self.compact:
+            return Token(token_codes[type], value, self.lineno, self.lexoffset + lexpos)
+        tok = LexToken()
+        tok.type = type
+        tok.value = value
+        tok.lineno = self.lineno
+        tok.lexpos = self.lexoffset + lexpos
+        return tok
+
+    def _illegal(self, data, pos):
+        start = self.lexoffset + pos
+        error(self.lineno,"Illegal character {!r}", data[pos], code="illegal-character",
+              span=(start, start + 1))
+        self.lexpos = pos + 1
+
+    def _scan_number(self, data, pos):
+        m = _float_re.match(data, pos)
+        if m:
+            return self._make_token('FLOAT', float(m.group()), pos, m.end())
+        m = _integer_re.match(data, pos)
+        if m:
+            return self._make_token('INTEGER', _integer_value(m.group()), pos, m.end())
+        self._illegal(data, pos)
+
+    def _scan_name(self, data, pos):
+        end = _id_re.match(data, pos).end()
+        value = data[pos:end]
+        type = _keyword_types.get(value)
+        if type is None:
+            if value.startswith(_bool_prefixes):
+                # t_BOOL is tried before t_ID, so 'trueish' is BOOL, ID
+                if value.startswith('true'):
+                    return self._make_token('BOOL', True, pos, pos + 4)
+                return self._make_token('BOOL', False, pos, pos + 5)
+            type = 'ID'
+        if self.compact:
+            value = sys.intern(value)
+        return self._make_token(type, value, pos, end)
+
+    def _scan_string(self, data, pos):
+        m = _string_re.match(data, pos)
+        if m:
+            end = m.end()
+            value = _decode_escapes(data[pos+1:end-1], self.lineno)
+            return self._make_token('STRING', value, pos, end)
+        newline = data.find('\n', pos + 1)
+        if newline >= 0:
+            error(self.lineno,"Unterminated string literal", code="unterminated-string",
+                  span=(self.lexoffset + pos, self.lexoffset + newline))
+            self.lineno += 1
+            self.lexpos = newline + 1
+        else:
+            self._illegal(data, pos)
+
+    def _scan_slash(self, data, pos):
+        if data.startswith('/*', pos):
+            self._skip_comment(data, pos + 2)
+            return None
+        if data.startswith('//', pos):
+            end = data.find('\n', pos + 2)
+            if end >= 0:
+                self.lineno += 1
+                self.lexpos = end + 1
+                return None
+        return self._make_token('DIVIDE', '/', pos, pos + 1)
+
+    def _skip_comment(self, data, start):
+        # A comment is the only token that can span lines, so it may run
+        # past the end of a streamed chunk.  Rather than holding on to the
+        # whole comment, count its newlines and discard all but the last
+        # character (which might be the '*' of the closing '*/').
+        begin = self.lexoffset + start - 2
+        newlines = 0
+        while True:
+            end = data.find('*/', start)
+            if end >= 0:
+                self.lineno += newlines + data.count('\n', start, end)
+                self.lexpos = end + 2
+                return
+            keep = max(start, self.lexlen - 1)
+            newlines += data.count('\n', start, keep)
+            self.lexpos = keep
+            if not self._refill(keep):
+                error(self.lineno,"Unterminated comment", code="unterminated-comment",
+                      span=(begin, self.lexoffset + self.lexlen))
+                self.lexpos = self.lexlen
+                return
+            data = self.lexdata
+            start = self.lexpos
+
+    def _scan_operator(self, data, pos):
+        text = data[pos:pos+2]
+        type = _operators.get(text)
+        if type is None:
+            text = data[pos]
+            type = _operators.get(text)
+            if type is None:
+                return self._illegal(data, pos)
+        return self._make_token(type, text, pos, pos + len(text))
+
+    def _scan_other(self, data, pos):
+        # Characters outside the dispatch table.  \d also matches
+        # non-ASCII digits, so give the number rules a chance first.
+        if data[pos].isdigit():
+            return self._scan_number(data, pos)
+        self._illegal(data, pos)
+
+    _dispatch = { }
+    for ch in '0123456789.':
+        _dispatch[ch] = _scan_number
+    for ch in '_abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ':
+        _dispatch[ch] = _scan_name
+    for ch in _operators:
+        _dispatch[ch[0]] = _scan_operator
+    _dispatch['"'] = _scan_string
+    _dispatch['/'] = _scan_slash
+    del ch
+
+# ----------------------------------------------------------------------
+# Cached lexer tables, for make_lexer(optimize=True) below.
+
+def lexer_signature():
+    '''
+    Return a digest identifying the token rules.  It covers the token
+    list, the ignored characters and every t_ rule (string rules by value,
+    function rules by docstring in definition order).
+    '''
+    module = sys.modules[__name__]
+    rules = []
+    for name in dir(module):
+        if not name.startswith('t_'):
+            continue
+        value = getattr(module, name)
+        if callable(value):
+            rules.append((value.__code__.co_firstlineno, name, value.__doc__))
+        else:
+            rules.append((0, name, value))
+    return exprcache.fingerprint(ply.lex.__version__, tokens, sorted(rules))
+
+def _load_lextab(filename):
+    '''
+    Import a lextab file written by PLY from an arbitrary path
+    '''
+    spec = importlib.util.spec_from_file_location(
+        os.path.splitext(os.path.basename(filename))[0], filename)
+    lextab = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(lextab)
+    return lextab
+
+# ----------------------------------------------------------------------
+# Parallel lexing.
+#
+# A large source can be cut into pieces at any ';' or '}' that is not
+# inside a string or comment.  Such a character is always a complete
+# token, so each piece lexes exactly as it would as part of the whole.
+# The pieces are tokenized by the scanner in a process pool, each one
+# starting from its absolute line number and offset.
+
+# The code that cuts the source into pieces, here and in exprparse.py,
+# must not mistake a ';', '{', '}' or keyword inside a comment or string
+# for code.  comment_string_re() makes the regular expressions it scans
+# the source with, which match every comment and string whole.
+
+_comment_string_pattern = r'''
+      /\*.*?\*/                # Comment
+    | /\*.*                   # Unterminated comment (runs to the end)
+    | //[^\n]*                # C++ comment
+    | "(?:\\[^\n]|[^\\"\n])*"  # String (a backslash doesn't escape a newline)
+    | "[^\n]*                 # Unterminated string (runs to the end of the line)
+'''
+
+def comment_string_re(other=None):
+    '''
+    Return a compiled regular expression that matches a comment or a
+    string, or else other, a pattern in verbose syntax.  A match that
+    starts with '/' or '"' is a comment or string.
+    '''
+    pattern = _comment_string_pattern
+    if other:
+        pattern += "    | " + other + "\n"
+    return re.compile(pattern, re.DOTALL | re.VERBOSE)
+
+_skip_re = comment_string_re()
+
+_split_re = re.compile(r'[;}]')
+
+def _split_points(data, parts):
+    '''
+    Return a list of up to parts-1 offsets at which data can be split.
+    Each one is just past a ';' or '}' outside of strings and comments,
+    at or beyond the next multiple of len(data)/parts.
+    '''
+    step = len(data) // parts
+    points = []
+    target = step
+    if not step:
+        return points
+    # Whether a character is in a string or comment depends on all of
+    # the text before it, so the strings and comments are found from
+    # the start.  Split points are only looked for in the code between
+    # them, once it reaches the next target.
+    start = 0
+    for m in _skip_re.finditer(data):
+        while m.start() > target:
+            split = _split_re.search(data, max(start, target), m.start())
+            if split is None:
+                break
+            points.append(split.end())
+            if len(points) == parts - 1:
+                return points
+            target = split.end() + step
+        start = m.end()
+    while len(points) < parts - 1:
+        split = _split_re.search(data, max(start, target))
+        if split is None:
+            break
+        points.append(split.end())
+        target = split.end() + step
+    return points
+
+def _lex_chunk(job):
+    '''
+    Worker for lex_parallel().  Tokenize one piece of the source and
+    return (columns, errors).  The tokens are returned as parallel
+    columns of codes, values, line numbers and positions, which are much
+    cheaper to send back to the parent than token objects.  All but the
+    values are integer arrays.  errors is a list of Diagnostics.
+    '''
+    data, lineno, lexpos = job
+    # Errors are collected rather than reported here.  A forked worker
+    # inherits the parent's error subscribers, which must not be called
+    # from the worker.
+    with error_sink() as sink:
+        scanner = Scanner(compact=True)
+        scanner.input(data)
+        scanner.lineno = lineno
+        scanner.lexoffset = lexpos
+        toks = list(iter(scanner.token, None))
+    columns = (array('B', [tok.code for tok in toks]), [tok.value for tok in toks],
+               array('l', [tok.lineno for tok in toks]), array('q', [tok.lexpos for tok in toks]))
+    return columns, sink.diagnostics
+
+def lex_parallel(path, workers=None, compact=False):
+    '''
+    Tokenize the file at path using a pool of worker processes and
+    return the complete list of tokens, in order.  workers defaults
+    to the number of CPUs.  Tokens are PLY LexTokens, or Token records
+    if compact is True.  They are identical to what the scanner
+    produces serially, and errors are reported through error() in
+    source order.
+
+    The parent process still has to read the file, find the split
+    points and build every token object from what the workers send
+    back, which costs about half as much as lexing the file.  So this
+    only pays off for large files with several idle CPUs, and is slower
+    than lexing serially otherwise.  With one worker the file is simply
+    lexed in this process.
+    '''
+    with open(path) as f:
+        data = f.read()
+    workers = workers or os.cpu_count() or 1
+    jobs = []
+    start = 0
+    lineno = 1
+    for end in _split_points(data, workers) + [len(data)]:
+        jobs.append((data[start:end], lineno, start))
+        lineno += data.count('\n', start, end)
+        start = end
+    if len(jobs) == 1:
+        scanner = Scanner(compact=compact)
+        scanner.input(data)
+        return list(iter(scanner.token, None))
+
+    result = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+        for columns, errors in pool.map(_lex_chunk, jobs):
+            for diag in errors:
+                report(diag)
+            if compact:
+                result.extend(map(Token, *columns))
+            else:
+                for code, value, lineno, lexpos in zip(*columns):
+                    tok = LexToken()
+                    tok.type = tokens[code]
+                    tok.value = value
+                    tok.lineno = lineno
+                    tok.lexpos = lexpos
+                    result.append(tok)
+    return result
+
+# ----------------------------------------------------------------------
+# Incremental lexing.
+#
+# An editor re-lexes after every keystroke.  Most of the token stream
+# is unaffected by a small edit, so IncrementalLexer only re-lexes the
+# damaged region and splices the result into the previous tokens.
+#
+# Re-lexing starts a little before the edit.  A token can depend on text
+# past its end (1e+ followed by 5 is one FLOAT, // needs a newline, an
+# open quote looks for its closing quote on the same line), so lexing
+# restarts at the last token of the line before the one holding the
+# token three places ahead of the edit.  It stops as soon as a new token
+# starts at the same place (after the edit) as an old one did: the lexer
+# has no state between tokens, so everything from there on is the same.
+#
+# To keep the cost of an edit independent of the size of the file, the
+# tokens are kept in blocks of at most BLOCKSIZE, so a splice only
+# rebuilds the blocks it touches.  The tokens after the edit also need
+# their lexpos and lineno shifted.  That is done lazily, like the gap in
+# a gap buffer: blocks before index _gap are exact, and the tokens in
+# the others are off by (_dpos, _dline).  Moving the gap only touches the
+# blocks between its old and new place, so edits near the previous one
+# are cheap.
+
+class IncrementalLexer(object):
+    '''
+    Keeps the text and tokens of a source that is being edited.  Use
+    edit() to apply a change.  The current text is in the text attribute
+    and the full token list is returned by the tokens attribute.  Errors
+    in re-lexed text are reported through error() again.
+    '''
+    BLOCKSIZE = 256
+
+    def __init__(self, text, tokens=None, compact=False):
+        self.text = text
+        self.compact = compact
+        if tokens is None:
+            scanner = Scanner(compact=compact)
+            scanner.input(text)
+            tokens = list(iter(scanner.token, None))
+        size = self.BLOCKSIZE
+        self._blocks = [tokens[n:n+size] for n in range(0, len(tokens), size)]
+        self._gap = len(self._blocks)
+        self._dpos = 0
+        self._dline = 0
+
+    @property
+    def tokens(self):
+        self._move_gap(len(self._blocks))
+        return [tok for block in self._blocks for tok in block]
+
+    def _move_gap(self, gap):
+        if self._dpos or self._dline:
+            if gap > self._gap:
+                dpos, dline = self._dpos, self._dline
+                blocks = self._blocks[self._gap:gap]
+            else:
+                dpos, dline = -self._dpos, -self._dline
+                blocks = self._blocks[gap:self._gap]
+            for block in blocks:
+                for tok in block:
+                    tok.lexpos += dpos
+                    tok.lineno += dline
+        self._gap = gap
+
+    # Tokens are addressed by (block, index) cursors.  The cursor
+    # (len(self._blocks), 0) is the end of the token stream.
+
+    def _pos(self, b, i):
+        if b < self._gap:
+            return self._blocks[b][i].lexpos
+        return self._blocks[b][i].lexpos + self._dpos
+
+    def _lineno(self, b, i):
+        if b < self._gap:
+            return self._blocks[b][i].lineno
+        return self._blocks[b][i].lineno + self._dline
+
+    def _prev(self, b, i):
+        if i > 0:
+            return b, i - 1
+        elif b > 0:
+            return b - 1, len(self._blocks[b - 1]) - 1
+        return None
+
+    def _next(self, b, i):
+        if i + 1 < len(self._blocks[b]):
+            return b, i + 1
+        return b + 1, 0
+
+    def _find(self, offset):
+        # Cursor of the first token starting at or after offset
+        lo, hi = 0, len(self._blocks)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._pos(mid, 0) < offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return 0, 0
+        b = lo - 1
+        i, hi = 0, len(self._blocks[b])
+        while i < hi:
+            mid = (i + hi) // 2
+            if self._pos(b, mid) < offset:
+                i = mid + 1
+            else:
+                hi = mid
+        if i == len(self._blocks[b]):
+            return lo, 0
+        return b, i
+
+    def edit(self, offset, deleted, inserted, text=None):
+        '''
+        Replace deleted characters at offset with the text inserted and
+        re-lex.  An editor that already has the updated source should
+        pass it as text; otherwise it is built from the previous text,
+        which means copying the whole source.
+
+        Returns (index, count, new) meaning that the count tokens
+        starting at index were replaced by the list of tokens new.
+        '''
+        if text is None:
+            text = self.text[:offset] + inserted + self.text[offset+deleted:]
+        blocks = self._blocks
+        nblocks = len(blocks)
+
+        # Find where to restart
+        start = self._find(offset)
+        for _ in range(3):
+            start = self._prev(*start) or start
+        if start[0] < nblocks:
+            lineno = self._lineno(*start)
+            prev = self._prev(*start)
+            while prev and self._lineno(*prev) == lineno:
+                start, prev = prev, self._prev(*prev)
+            start = prev or (0, 0)
+        b0, i0 = start
+        self._move_gap(b0)
+        scanner = Scanner(compact=self.compact)
+        scanner.input(text)
+        if start != (0, 0):
+            scanner.lexpos = self._pos(b0, i0)
+            scanner.lineno = self._lineno(b0, i0)
+
+        # Re-lex until a token lines up with an old one after the edit
+        delta = len(inserted) - deleted
+        dline = 0
+        end = offset + len(inserted)
+        b1, i1 = self._find(offset + deleted)
+        new = []
+        for tok in iter(scanner.token, None):
+            if tok.lexpos >= end:
+                target = tok.lexpos - delta
+                while b1 < nblocks and self._pos(b1, i1) < target:
+                    b1, i1 = self._next(b1, i1)
+                if b1 < nblocks and self._pos(b1, i1) == target:
+                    dline = tok.lineno - self._lineno(b1, i1)
+                    break
+            new.append(tok)
+        else:
+            b1, i1 = nblocks, 0
+
+        # Splice the new tokens in.  The untouched tokens that share a
+        # block with them are made exact; later blocks get the new shift.
+        index = sum(map(len, blocks[:b0])) + i0
+        count = sum(map(len, blocks[b0:b1])) - i0 + i1
+        prefix = blocks[b0][:i0] if b0 < nblocks else []
+        suffix = blocks[b1][i1:] if b1 < nblocks else []
+        for tok in prefix:
+            tok.lexpos += self._dpos
+            tok.lineno += self._dline
+        for tok in suffix:
+            tok.lexpos += self._dpos + delta
+            tok.lineno += self._dline + dline
+        merged = prefix + new + suffix
+        size = self.BLOCKSIZE
+        merged = [merged[n:n+size] for n in range(0, len(merged), size)]
+        blocks[b0:b1+1] = merged
+        self._gap = b0 + len(merged)
+        self._dpos += delta
+        self._dline += dline
+        self.text = text
+        return index, count, new
+
 # ----------------------------------------------------------------------
 #                DO NOT CHANGE ANYTHING BELOW THIS PART
 # ----------------------------------------------------------------------
-def make_lexer():
+def make_lexer(optimize=False, cache_dir=None, backend="ply", compact=False):
     '''
-    Utility function for making the lexer object
+    Utility function for making the lexer object.
+
+    backend selects the implementation: "ply" for the PLY lexer built
+    from the t_ rules, or "scanner" for the hand-written Scanner.  Both
+    produce the same tokens.  compact=True (scanner only) makes the
+    scanner return compact Token records.
+
+    If optimize is True, the lexer is built in PLY's optimized mode.
+    The master regular expressions are saved in a lextab file in
+    cache_dir (see exprcache.py) and reused by later processes, which
+    skips reflection-time validation of the token rules.  Only use this
+    once the rules are known to be good.
     '''
-    return lex()
+    if backend == "scanner":
+        return Scanner(compact=compact)
+    elif backend != "ply":
+        raise ValueError("Unknown lexer backend %r" % backend)
+    elif compact:
+        raise ValueError("Compact tokens require the scanner backend")
+
+    module = sys.modules[__name__]
+    if not optimize:
+        return lex(module=module)
+
+    cache_dir = exprcache.get_cache_dir(cache_dir)
+    tabname = "lextab_%s" % lexer_signature()
+    tabfile = os.path.join(cache_dir, tabname + ".py")
+    if os.path.exists(tabfile):
+        try:
+            lextab = _load_lextab(tabfile)
+            # PLY quietly rebuilds the lexer from the rules if the table
+            # is from another version, so check for that here.
+            if getattr(lextab, '_tabversion', None) != ply.lex.__version__:
+                raise ImportError("lextab was written by another version of PLY")
+            return lex(module=module, optimize=1, lextab=lextab)
+        except (ImportError, SyntaxError, AttributeError):
+            # A corrupt or stale table.  Remove it so that it is rebuilt
+            # below instead of failing again in every later process.
+            try:
+                os.remove(tabfile)
+            except OSError:
+                pass
+    # PLY names the output file after the table, so write it into a
+    # private directory and move it into place afterwards.
+    tmpdir = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        lexer = lex(module=module, optimize=1, lextab=tabname, outputdir=tmpdir)
+        os.replace(os.path.join(tmpdir, tabname + ".py"), tabfile)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return lexer
 
 if __name__ == '__main__':
-    import sys
     from errors import subscribe_errors
     
     if len(sys.argv) != 2:
@@ -344,8 +1198,10 @@ if __name__ == '__main__':
         raise SystemExit(1)
 
     
-    lexer = make_lexer()
-    with subscribe_errors(lambda msg: sys.stderr.write(msg+"\n")):
-        lexer.input(open(sys.argv[1]).read())
+    # The scanner reads the file incrementally instead of all at once
+    lexer = make_lexer(backend="scanner")
+    with subscribe_errors(lambda msg: sys.stderr.write(msg+"\n")), \
+         open(sys.argv[1]) as f:
+        lexer.input(f)
         for tok in iter(lexer.token,None):
             sys.stdout.write("%s\n" % tok)
@@ -91,18 +91,30 @@ To do the project, follow the instructions contained below.
 #
 # See http://www.dabeaz.com/ply/ply.html#ply_nn23
 # ----------------------------------------------------------------------
+import re
+import os
+import sys
+import gc
+import pickle
+import concurrent.futures
+from contextlib import contextmanager
 from ply import yacc
 
+# ----------------------------------------------------------------------
+# The parsing tables are cached on disk between runs.  See exprcache.py
+import exprcache
+
 # ----------------------------------------------------------------------
 # The following import loads a function error(lineno,msg) that should be
 # used to report all error messages issued by your parser.  Unit tests and
 # other features of the compiler will rely on this function.  See the
 # file errors.py for more documentation about the error handling mechanism.
-from errors import error
+from errors import error, error_sink, report
 
 # ----------------------------------------------------------------------
 # Get the token list defined in the lexer module.  This is required
 # in order to validate and build the parsing tables.
+import exprlex
 from exprlex import tokens
 
 # ----------------------------------------------------------------------
@@ -110,6 +122,10 @@ from exprlex import tokens
 # Read instructions in exprast.py
 from exprast import *
 
+# ----------------------------------------------------------------------
+# IncrementalParser keeps the trees it has parsed serialized
+import exprserial
+
 # ----------------------------------------------------------------------
 # Operator precedence table.   Operators must follow the same 
 # precedence rules as in Python.  Instructions to be given in the project.
@@ -162,10 +178,14 @@ def p_program_empty(p):
 
 def p_program(p):
     '''
-    program : basicblock
+    program : toplevel
     '''
     p[0] = Program(p[1])
-    
+
+# The statements at the top level are a separate list from those in a
+# { block } only so that they can recover from syntax errors differently.
+# See the error recovery rules below p_statement().
+
 def p_basicblock(p):
     '''
     basicblock : statements
@@ -176,6 +196,7 @@ def p_basicblock(p):
 def p_statements(p):
     '''
     statements : statements statement
+    toplevel : toplevel statement
     '''
     p[0] = p[1]
     p[0].append(p[2])
@@ -183,6 +204,7 @@ def p_statements(p):
 def p_statements_1(p):
     '''
     statements : statement
+    toplevel : statement
     '''
     p[0] = Statements([p[1]])
 
@@ -202,6 +224,55 @@ def p_statement(p):
     '''
     p[0] = p[1]
 
+# Panic-mode error recovery.  After a syntax error is reported, PLY
+# discards parser states back to the innermost list of statements and
+# then input tokens until one of these rules matches.  The bad statement
+# becomes an ErrorStatement and parsing carries on, so one parse reports
+# the syntax errors in every statement.  Recovery stops after the next
+# ';', or takes in a following { block } (a broken if/while/func
+# header), or stops without consuming anything in front of the start of
+# another statement or the end of the list.  The end of a list in a
+# block is its closing '}'.  The top level has no closing '}', so a
+# stray one there is skipped; stopping in front of it would only report
+# it again, forever.  That is why the top-level statements are a
+# separate list.
+#
+# Until three tokens have been accepted after an error, PLY does not
+# report further errors, since they are usually knock-on effects of the
+# first one.  A ';' or a complete block is a reliable place to resume,
+# so the first two rules lift that restriction with errok().  (PLY may
+# have already reported the token after the ';' or '}' by the time it
+# reduces the rule, which is why make_parser() installs _report_once().)
+
+def p_statement_error(p):
+    '''
+    statement : error SEMI
+    '''
+    p[0] = ErrorStatement(None, lineno=p.lineno(1) or p.lineno(2))
+    p.parser.errok()
+
+def p_statement_error_block(p):
+    '''
+    statement : error LCURL basicblock RCURL
+    '''
+    p[0] = ErrorStatement(p[3], lineno=p.lineno(1) or p.lineno(2))
+    p.parser.errok()
+
+def p_statements_error(p):
+    '''
+    statements : statements error
+    toplevel : toplevel error
+    '''
+    p[0] = p[1]
+    p[0].append(ErrorStatement(None, lineno=p.lineno(2)))
+
+def p_statements_error_1(p):
+    '''
+    statements : error
+    toplevel : error
+    '''
+    p[0] = Statements([ErrorStatement(None, lineno=p.lineno(1))])
+
 def p_if_statement(p):
     '''
     if_statement : IF expression LCURL basicblock RCURL
@@ -397,21 +468,809 @@ def p_empty(p):
 # bad input.  See http://www.dabeaz.com/ply/ply.html#ply_nn31
 def p_error(p):
     if p:
-        error(p.lineno, "Syntax error in input at token '%s'" % p.value)
+        error(p.lineno, "Syntax error in input at token '{}'", p.value, code="syntax-error",
+              span=(p.lexpos, None))
     else:
-        error("EOF","Syntax error. No more input.")
+        error("EOF","Syntax error. No more input.", code="unexpected-eof")
+
+# ----------------------------------------------------------------------
+# Hand-written recursive-descent parser.
+#
+# An alternative to the LALR parser built by PLY from the rules above.
+# Each kind of statement is parsed by its own method, chosen by looking
+# at the first token, and expressions are parsed by precedence climbing
+# driven by the precedence table above.  There is no callback per
+# production and no parsing stack, just one method call per statement
+# and per operand.  It builds the same AST nodes with the same line
+# numbers and reports syntax errors through p_error(), so the messages
+# are the same as well.  It also accepts the same oddities as the
+# grammar.  For example, f(,x) is a valid call whose arguments are None
+# because the argument list starts out empty.
+#
+# It recovers from syntax errors the same way as the error rules of the
+# LALR parser (see p_statement_error()), down to PLY's habit of not
+# reporting another error until three tokens have been accepted, so
+# both report the same errors and build the same ErrorStatements.
+#
+# A long run of one operator, such as 1 + 2 + ... + 10000, becomes a
+# left-deep tree of Binop nodes, as deep as the run is long.  Walking it
+# with the recursive visitors in the later passes overflows the Python
+# stack.  If flatten is True, the parser builds a single BinopChain or
+# RelopChain node (see exprast.py) for each run of two or more of the
+# same left-associative operator instead.  A lone operator is still a
+# Binop or Relop.
+#
+# Use make_parser(backend="rd") to get one.
+
+# Binary operators: token type -> (level, associativity, node class,
+# chain node class)
+_binary_operators = { }
+for _level, (_assoc, *_names) in enumerate(precedence, 1):
+    for _name in _names:
+        if _name in ('PLUS','MINUS','TIMES','DIVIDE'):
+            _binary_operators[_name] = (_level, _assoc, Binop, BinopChain)
+        elif _name != 'UNARY':
+            _binary_operators[_name] = (_level, _assoc, Relop, RelopChain)
+del _level, _assoc, _names, _name
+
+_unary_types = { 'PLUS', 'MINUS', 'NOT' }
+_literal_types = { 'INTEGER', 'FLOAT', 'STRING', 'BOOL' }
+
+class _ParseError(Exception):
+    '''
+    Raised to unwind to the innermost list of statements after a
+    syntax error.  statement is a complete statement in front of the
+    error that PLY would keep, if there is one.
+    '''
+    def __init__(self, statement=None):
+        self.statement = statement
+
+class _ParseAbort(Exception):
+    '''
+    Raised to give up after a syntax error at the end of the input.
+    '''
+
+class RecursiveDescentParser(object):
+    '''
+    Parser with the same interface as a PLY parser.  parse() takes the
+    source text and returns a Program node, or None if it gave up at a
+    syntax error at the end of the input.  The tokens come from lexer,
+    which defaults to a new Scanner.  If flatten is True, runs of the
+    same left-associative operator are returned as BinopChain/RelopChain
+    nodes.
+
+    Each method below implements the grammar rule in its docstring.
+    The .tok attribute holds the last accepted token and the .nexttok
+    attribute holds the lookahead token (None at the end of input).
+    '''
+    def __init__(self, lexer=None, flatten=False):
+        if lexer is None:
+            lexer = exprlex.make_lexer(backend="scanner")
+        self.lexer = lexer
+        self.flatten = flatten
+        self.tok = None
+        self.nexttok = None
+
+    def parse(self, input=None, lexer=None):
+        '''
+        Parse input, or the input already given to the lexer if None.
+        '''
+        lexer = lexer or self.lexer
+        if input is not None:
+            lexer.input(input)
+        self._token = self._lexer_token = lexer.token
+        self._errorcount = 0            # Tokens to accept before reporting errors
+        self._errorok = False           # Report the next error regardless
+        self._resync = None             # Last token of a recovery, until errok()
+        self._reported = None           # Token of the last error reported
+        self.tok = None
+        self.nexttok = self._token()
+        try:
+            return self.program()
+        except _ParseAbort:
+            return None
+        finally:
+            self._token = self._lexer_token = None
+
+    # ------------------------------------------------------------
+    # Token handling
+
+    def _advance(self):
+        'Accept the lookahead token'
+        self.tok, self.nexttok = self.nexttok, self._token()
+
+    def _accept(self, toktype):
+        'Accept the lookahead token if it has the given type'
+        if self.nexttok is not None and self.nexttok.type == toktype:
+            self.tok, self.nexttok = self.nexttok, self._token()
+            return True
+        return False
+
+    def _expect(self, toktype):
+        'Accept and return the lookahead token or report a syntax error'
+        tok = self.nexttok
+        if tok is None or tok.type != toktype:
+            self._error()
+        self.tok, self.nexttok = tok, self._token()
+        return tok
+
+    def _error(self, statement=None):
+        '''
+        Report a syntax error at the lookahead token and unwind to the
+        innermost list of statements.  At the end of the input, give up.
+        '''
+        self._report()
+        self._token = self._counting_token
+        if self.nexttok is None:
+            raise _ParseAbort()
+        raise _ParseError(statement)
+
+    def _report(self):
+        '''
+        Report a syntax error at the lookahead token, unless it is too
+        soon after the last one, the way PLY decides it.
+        '''
+        # If the token after a recovery is bad, PLY detects the error
+        # before it reduces the error rule and calls errok().
+        self._errok()
+        tok = self.nexttok
+        if self._errorcount == 0 or self._errorok:
+            if tok is None or tok is not self._reported:
+                p_error(tok)
+            self._reported = tok
+            self._errorok = False
+        self._errorcount = yacc.error_count
+        if self._resync is not None:
+            self._resync = None
+            self._errorok = True
+
+    def _errok(self):
+        '''
+        Apply the errok() of the last recovery if PLY would have called
+        it by now.  PLY reduces an error rule, and so calls errok(), once
+        it has looked at the token after its ';' or '}', but only if
+        that token can follow a statement somewhere in the grammar.
+        '''
+        tok = self.nexttok
+        if self._resync is not None and (self.tok is not self._resync or tok is None or
+                                         tok.type == 'RCURL' or tok.type in self._statements):
+            self._resync = None
+            self._errorok = True
+
+    def _counting_token(self):
+        '''
+        Replaces the lexer's token() after an error, to count down the
+        tokens accepted before errors are reported again.
+        '''
+        if self._errorcount:
+            self._errorcount -= 1
+        if not self._errorcount:
+            self._token = self._lexer_token
+        return self._lexer_token()
+
+    def _recover(self, toplevel):
+        '''
+        Skip over a statement with a syntax error in it, like the error
+        rules of the LALR parser do, and return an ErrorStatement for
+        it.  Returns None if nothing has been accepted yet, in which
+        case PLY just drops the bad token.
+        '''
+        if self.tok is None:
+            self.nexttok = self._lexer_token()
+            return None
+        lineno = self.nexttok.lineno
+        self._errorcount -= 1           # For accepting the error itself
+        while True:
+            tok = self.nexttok
+            if tok is None:
+                if toplevel:
+                    return ErrorStatement(None, lineno=lineno)
+                self._error()
+            elif tok.type == 'SEMI':
+                self._advance()
+                self._errok()
+                self._resync = self.tok
+                return ErrorStatement(None, lineno=lineno)
+            elif tok.type == 'LCURL':
+                statements = self._block()
+                self._errok()
+                self._resync = self.tok
+                return ErrorStatement(statements, lineno=lineno)
+            elif tok.type in self._statements or (tok.type == 'RCURL' and not toplevel):
+                return ErrorStatement(None, lineno=lineno)
+            self._report()
+            self.nexttok = self._lexer_token()
+
+    # ------------------------------------------------------------
+    # Statements
+
+    def program(self):
+        '''
+        program : toplevel
+        '''
+        return Program(self.basicblock(toplevel=True))
+
+    def basicblock(self, toplevel=False):
+        '''
+        basicblock : { statement }
+        toplevel   : { statement }
+        '''
+        statements = []
+        dispatch = self._statements
+        while True:
+            tok = self.nexttok
+            if tok is None or (tok.type == 'RCURL' and not toplevel):
+                break
+            try:
+                method = dispatch.get(tok.type)
+                if method is None:
+                    self._error()
+                statements.append(method(self))
+            except _ParseError as e:
+                if e.statement is not None:
+                    statements.append(e.statement)
+                statement = self._recover(toplevel)
+                if statement is not None:
+                    statements.append(statement)
+        return Statements(statements) if statements else None
+
+    def _block(self):
+        '''
+        { basicblock }
+        '''
+        self._expect('LCURL')
+        statements = self.basicblock()
+        self._expect('RCURL')
+        return statements
+
+    def const_declaration(self):
+        '''
+        const_declaration : CONST ID ASSIGN expression SEMI
+        '''
+        tok = self._expect('CONST')
+        name = self._expect('ID').value
+        self._expect('ASSIGN')
+        expr = self.expression()
+        self._expect('SEMI')
+        return ConstDeclaration(name, expr, lineno=tok.lineno)
+
+    def var_declaration(self):
+        '''
+        var_declaration : VAR ID typename [ ASSIGN expression ] SEMI
+        '''
+        tok = self._expect('VAR')
+        name = self._expect('ID').value
+        typename = self.typename()
+        expr = self.expression() if self._accept('ASSIGN') else None
+        self._expect('SEMI')
+        return VarDeclaration(name, typename, expr, lineno=tok.lineno)
+
+    def assign_or_call(self):
+        '''
+        assign_statement : location ASSIGN expression SEMI
+        func_call        : ID LPAREN arguments RPAREN SEMI
+        '''
+        tok = self._expect('ID')
+        if self._accept('LPAREN'):
+            arguments = self._sequence(self.expression, FuncCallArguments)
+            self._expect('RPAREN')
+            self._expect('SEMI')
+            return FuncCall(tok.value, arguments, lineno=tok.lineno)
+        assign = self._expect('ASSIGN')
+        expr = self.expression()
+        self._expect('SEMI')
+        return AssignmentStatement(Location(tok.value, lineno=tok.lineno), expr,
+                                   lineno=assign.lineno)
+
+    def print_statement(self):
+        '''
+        print_statement : PRINT expression SEMI
+        '''
+        tok = self._expect('PRINT')
+        expr = self.expression()
+        self._expect('SEMI')
+        return PrintStatement(expr, lineno=tok.lineno)
+
+    def return_statement(self):
+        '''
+        return_statement : RETURN expression SEMI
+        '''
+        tok = self._expect('RETURN')
+        expr = self.expression()
+        self._expect('SEMI')
+        return ReturnStatement(expr, lineno=tok.lineno)
+
+    def if_statement(self):
+        '''
+        if_statement : IF expression LCURL basicblock RCURL
+                       [ ELSE LCURL basicblock RCURL ]
+        '''
+        tok = self._expect('IF')
+        expr = self.expression()
+        truebranch = self._block()
+        if not self._accept('ELSE'):
+            return IfStatement(expr, truebranch, None, lineno=tok.lineno)
+        if self.nexttok is None or self.nexttok.type != 'LCURL':
+            # PLY backs up over the 'else' and keeps the if statement
+            self._error(IfStatement(expr, truebranch, None, lineno=tok.lineno))
+        return IfStatement(expr, truebranch, self._block(), lineno=tok.lineno)
+
+    def while_statement(self):
+        '''
+        while_statement : WHILE expression LCURL basicblock RCURL
+        '''
+        tok = self._expect('WHILE')
+        expr = self.expression()
+        return WhileStatement(expr, self._block(), lineno=tok.lineno)
+
+    def func_statement(self):
+        '''
+        func_statement : FUNC ID typename LPAREN parameters RPAREN LCURL basicblock RCURL
+        '''
+        tok = self._expect('FUNC')
+        name = self._expect('ID').value
+        returntype = self.typename()
+        self._expect('LPAREN')
+        parameters = self._sequence(self.parameter, FuncParameterList)
+        self._expect('RPAREN')
+        return FuncStatement(name, returntype, parameters, self._block(),
+                             lineno=tok.lineno)
+
+    def parameter(self):
+        '''
+        parameter : ID typename
+        '''
+        name = self._expect('ID').value
+        return FuncParameter(name, self.typename(), None)
+
+    def typename(self):
+        '''
+        typename : ID
+        '''
+        tok = self._expect('ID')
+        return Typename(tok.value, lineno=tok.lineno)
+
+    def _sequence(self, item, node):
+        '''
+        items : item { COMMA item }
+              | empty { COMMA item }
+
+        Returns node([items]), or None if the sequence starts out empty.
+        '''
+        tok = self.nexttok
+        if tok is not None and tok.type in ('RPAREN', 'COMMA'):
+            result = None
+        else:
+            result = node([item()])
+        while self._accept('COMMA'):
+            value = item()
+            if result is not None:
+                result.append(value)
+        return result
+
+    _statements = {
+        'CONST': const_declaration,
+        'VAR': var_declaration,
+        'ID': assign_or_call,
+        'PRINT': print_statement,
+        'RETURN': return_statement,
+        'IF': if_statement,
+        'WHILE': while_statement,
+        'FUNC': func_statement,
+    }
+
+    # ------------------------------------------------------------
+    # Expressions
+
+    def expression(self, minlevel=1):
+        '''
+        expression : unary { binop expression }
+
+        Only operators whose precedence level is at least minlevel
+        are consumed.
+        '''
+        left = self.unary()
+        operators = _binary_operators
+        built = None                    # Last node built by this loop
+        while True:
+            tok = self.nexttok
+            if tok is None or tok.type not in operators:
+                return left
+            level, assoc, node, chainnode = operators[tok.type]
+            if level < minlevel:
+                return left
+            self.tok, self.nexttok = tok, self._token()
+            right = self.expression(level if assoc == 'right' else level + 1)
+            if built is not left or left.op != tok.value or not self.flatten \
+                    or assoc != 'left':
+                left = built = node(tok.value, left, right, lineno=tok.lineno)
+            elif isinstance(left, chainnode):
+                left.operands.append(right)
+            else:
+                left = built = chainnode(tok.value, [left.left, left.right, right],
+                                         lineno=left.lineno)
+            if assoc == 'nonassoc':
+                after = self.nexttok
+                if after is not None and operators.get(after.type, (None,))[0] == level:
+                    self._error()
+
+    def unary(self):
+        '''
+        unary : PLUS unary | MINUS unary | NOT unary
+              | LPAREN expression RPAREN
+              | ID
+              | literal
+        '''
+        tok = self.nexttok
+        if tok is None:
+            self._error()
+        toktype = tok.type
+        if toktype in _literal_types:
+            self.tok, self.nexttok = tok, self._token()
+            return Literal(tok.value, lineno=tok.lineno)
+        elif toktype == 'ID':
+            self.tok, self.nexttok = tok, self._token()
+            return LoadLocation(Location(tok.value, lineno=tok.lineno), lineno=tok.lineno)
+        elif toktype in _unary_types:
+            self.tok, self.nexttok = tok, self._token()
+            return Unaryop(tok.value, self.unary(), lineno=tok.lineno)
+        elif toktype == 'LPAREN':
+            self.tok, self.nexttok = tok, self._token()
+            expr = self.expression()
+            self._expect('RPAREN')
+            return expr
+        self._error()
+
+# ----------------------------------------------------------------------
+# Cached parser tables, for make_parser() below.
+
+def grammar_signature():
+    '''
+    Return a digest identifying the grammar.  It covers the token list,
+    the precedence table, and every p_ rule in the order PLY sees them,
+    so any edit to the grammar produces a different signature.
+    '''
+    rules = sorted((func.__code__.co_firstlineno, name, func.__doc__)
+                   for name, func in globals().items()
+                   if name.startswith('p_') and callable(func))
+    return exprcache.fingerprint(yacc.__tabversion__, tokens, precedence,
+                                 [(name, doc) for _, name, doc in rules])
+
+def _load_parsetab(filename):
+    '''
+    Return a parser for the LALR tables pickled by PLY in filename.
+    Raises yacc.VersionError if they were written by another version of
+    PLY, or KeyError if they name a p_ rule that does not exist.
+    '''
+    # The same as LRTable.read_pickle(), which leaves the file open if
+    # it fails to read it
+    lr = yacc.LRTable()
+    with open(filename, "rb") as f:
+        if pickle.load(f) != yacc.__tabversion__:
+            raise yacc.VersionError("yacc table file version is out of date")
+        lr.lr_method = pickle.load(f)
+        pickle.load(f)                  # The signature
+        lr.lr_action = pickle.load(f)
+        lr.lr_goto = pickle.load(f)
+        lr.lr_productions = [yacc.MiniProduction(*p) for p in pickle.load(f)]
+    lr.bind_callables(globals())
+    return yacc.LRParser(lr, p_error)
+
+def _report_once(parser):
+    '''
+    Make parser report each bad token at most once.  When an error rule
+    calls errok() while reducing on the bad token itself (a block
+    followed by an unexpected 'else', say), PLY would report that token
+    again as it goes on to discard it.
+    '''
+    reported = [None]
+    def errorfunc(p):
+        if p is None or p is not reported[0]:
+            reported[0] = p
+            return p_error(p)
+    parser.errorfunc = errorfunc
+    return parser
+
+# ----------------------------------------------------------------------
+# Parallel parsing.
+#
+# Top-level func statements do not depend on each other syntactically,
+# so a large program can be cut into pieces just before any 'func'
+# keyword at brace depth 0 that is not inside a string or comment.
+# Each piece is a run of complete top-level statements.  The pieces are
+# lexed and parsed in a process pool, each one starting from its
+# absolute line number and offset, and their statements are joined
+# into a single Program.
+#
+# Sending the trees back to the parent is a large part of the cost.
+# The workers pickle them explicitly so that the garbage collector can
+# be paused while it happens: a parsed program is millions of small
+# objects that the collector would otherwise scan over and over, for
+# nothing, as they are created.
+
+@contextmanager
+def _gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+# Nesting, and split points at depth 0
+_func_boundary_re = exprlex.comment_string_re(r'[{}] | \bfunc\b')
+
+def _func_split_points(data, parts):
+    '''
+    Return a list of up to parts-1 offsets at which data can be split.
+    Each one is the start of a top-level 'func' keyword at or beyond the
+    next multiple of len(data)/parts.
+    '''
+    step = len(data) // parts
+    points = []
+    target = step
+    if not step:
+        return points
+    depth = 0
+    for m in _func_boundary_re.finditer(data):
+        text = m.group()
+        if text == '{':
+            depth += 1
+        elif text == '}':
+            depth -= 1
+        elif text == 'func' and depth == 0 and m.start() >= target:
+            points.append(m.start())
+            target = m.start() + step
+            if len(points) == parts - 1:
+                break
+    return points
+
+def _parse_chunk(job):
+    '''
+    Worker for parse_parallel().  Lex and parse one piece of the source
+    and return (program, errors) pickled, where errors is a list of
+    Diagnostics.
+    '''
+    data, lineno, lexpos, backend, flatten = job
+    # Errors are collected as in exprlex._lex_chunk()
+    with error_sink() as sink, _gc_paused():
+        lexer = exprlex.make_lexer(backend="scanner")
+        lexer.input(data)
+        lexer.lineno = lineno
+        lexer.lexoffset = lexpos
+        program = make_parser(backend=backend, flatten=flatten).parse(lexer=lexer)
+    return pickle.dumps((program, sink.diagnostics), pickle.HIGHEST_PROTOCOL)
+
+def parse_parallel(path, workers=None, backend="ply", flatten=False):
+    '''
+    Parse the file at path using a pool of worker processes and return
+    the Program.  workers defaults to the number of CPUs, and backend
+    and flatten select the parser as for make_parser().  Errors are
+    reported through error() in source order.
+
+    For a program without syntax errors the result is the same as
+    parsing the whole file at once.  Otherwise each piece recovers from
+    its own errors, and the result is None if any piece gave up at a
+    syntax error at its end.
+    '''
+    with open(path) as f:
+        data = f.read()
+    workers = workers or os.cpu_count() or 1
+    jobs = []
+    start = 0
+    lineno = 1
+    for end in _func_split_points(data, workers) + [len(data)]:
+        jobs.append((data[start:end], lineno, start, backend, flatten))
+        lineno += data.count('\n', start, end)
+        start = end
+    if len(jobs) == 1:
+        parser = make_parser(backend=backend, flatten=flatten)
+        return parser.parse(data, lexer=exprlex.make_lexer(backend="scanner"))
+
+    statements = []
+    failed = False
+    with concurrent.futures.ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+        for result in pool.map(_parse_chunk, jobs):
+            with _gc_paused():
+                program, errors = pickle.loads(result)
+            for diag in errors:
+                report(diag)
+            if program is None:
+                failed = True
+            elif program.statements is not None:
+                statements.extend(program.statements.statements)
+    if failed:
+        return None
+    return Program(Statements(statements) if statements else None)
+
+# ----------------------------------------------------------------------
+# Incremental parsing.
+#
+# An editor parses the same file over and over with small changes in
+# between.  Every top-level statement (normally a func, var or const
+# declaration) ends at a ';' or '}' at brace depth 0, so the source can
+# be cut into statements with one regex scan, much like parse_parallel()
+# cuts it into pieces.  A statement is lexed and parsed again only if
+# its text changed since the last parse; otherwise its old subtree is
+# reused.  The same text always gives the same tokens, apart from line
+# numbers, so a reused statement that has moved up or down only has the
+# line numbers of its nodes shifted.
+#
+# The later passes change the nodes they are given (exprcheck adds
+# types, exprconst replaces expressions), so the old subtrees are kept
+# serialized with exprserial, exactly as the parser built them, and
+# loaded as new nodes every time they are reused.  Loading them is
+# faster than lexing and parsing, but still takes time for every
+# statement of the file, so a reparse is not proportional to the edit.
+#
+# Each statement can be parsed on its own because the top level of the
+# grammar is just a list of statements.  That no longer holds once
+# there is a syntax error (recovery may run from one statement into the
+# next), so if the lexer or parser reports any error, the whole file is
+# parsed again the normal way and those errors are reported.
+
+# Nesting, and the end of a statement
+_statement_end_re = exprlex.comment_string_re(r'[{};]')
+
+_else_re = re.compile(r'''
+    (?: \s | /\*.*?\*/ | //[^\n]*\n )*
+    else\b
+''', re.DOTALL | re.VERBOSE)
+
+def _statement_spans(data):
+    '''
+    Return a list of (start, end) offsets of the top-level statements
+    in data.  Each one starts right after the one before, so comments
+    and blank lines go with the following statement.  Any text after
+    the last statement is returned as a span as well.
+    '''
+    spans = []
+    start = depth = 0
+    for m in _statement_end_re.finditer(data):
+        text = m.group()
+        if text == '{':
+            depth += 1
+        elif text == '}':
+            depth -= 1
+            if depth == 0 and not _else_re.match(data, m.end()):
+                spans.append((start, m.end()))
+                start = m.end()
+        elif text == ';' and depth == 0:
+            spans.append((start, m.end()))
+            start = m.end()
+    if start < len(data):
+        spans.append((start, len(data)))
+    return spans
+
+def _shift_lines(node, delta):
+    '''
+    Add delta to the line number of node and every node below it.
+    '''
+    for depth, child in flatten(node):
+        if hasattr(child, 'lineno'):
+            child.lineno += delta
+
+class IncrementalParser(object):
+    '''
+    Parser for successive versions of the same source, such as the
+    buffer of an editor.  parse() returns the same Program as a full
+    parse with make_parser(backend, flatten), but only lexes and parses
+    the top-level statements that changed since the previous call.
+
+    Every call returns new nodes, so the Program can be checked and
+    folded like any other.  The unchanged statements are loaded again
+    from an exprserial copy, so a reparse still takes time in
+    proportion to the whole program, not to the edit: about half as
+    long as a full parse.  After each call, reused and parsed give the
+    number of pieces of the source taken from the last parse and parsed
+    anew.
+    '''
+    def __init__(self, backend="ply", flatten=False):
+        self.parser = make_parser(backend=backend, flatten=flatten)
+        self.lexer = exprlex.make_lexer(backend="scanner")
+        self._statements = {}           # Source text -> (lineno, serialized Program)
+        self.reused = self.parsed = 0
+
+    def parse(self, text):
+        '''
+        Parse text and return the Program, or None if there was a
+        syntax error at the end of the input.
+        '''
+        old, new = self._statements, {}
+        statements = []
+        lineno = 1
+        pos = 0
+        spans = _statement_spans(text)
+        self.reused = self.parsed = 0
+        with error_sink() as sink:
+            for start, end in spans:
+                lineno += text.count('\n', pos, start)
+                pos = start
+                key = text[start:end]
+                entry = new.get(key) or old.get(key)
+                if entry is not None:
+                    program = exprserial.loads(entry[1])
+                    if entry[0] != lineno:
+                        _shift_lines(program, lineno - entry[0])
+                    self.reused += 1
+                else:
+                    self.lexer.input(key)
+                    self.lexer.lineno = lineno
+                    program = self.parser.parse(lexer=self.lexer)
+                    if sink.num_errors:
+                        break
+                    entry = (lineno, exprserial.dumps(program))
+                    self.parsed += 1
+                new[key] = entry
+                if program.statements:
+                    statements.extend(program.statements.statements)
+        if sink.num_errors:
+            # Keep the statements seen so far for when the errors have
+            # been fixed.
+            old.update(new)
+            self.reused, self.parsed = 0, len(spans)
+            self.lexer.lineno = 1
+            return self.parser.parse(text, lexer=self.lexer)
+        self._statements = new
+        return Program(Statements(statements) if statements else None)
 
 # ----------------------------------------------------------------------
 #                     DO NOT MODIFY ANYTHING BELOW HERE
 # ----------------------------------------------------------------------
 
-def make_parser():
-    parser = yacc.yacc()
-    return parser
+def make_parser(cache_dir=None, rebuild=False, backend="ply", flatten=False):
+    '''
+    Utility function for making the parser object.
+
+    backend selects the implementation: "ply" for the LALR parser built
+    by PLY from the p_ rules, or "rd" for the hand-written
+    RecursiveDescentParser, which needs no tables.  Both build the
+    same AST.  flatten=True (rd only) makes the parser build
+    BinopChain/RelopChain nodes for runs of the same operator.
+
+    For the "ply" backend, the LALR tables are loaded from a pickle in
+    cache_dir (see exprcache.py) named after the grammar signature.  If
+    no such file exists, it cannot be read, or rebuild is True, the
+    tables are regenerated and saved for the next process.
+    '''
+    if backend == "rd":
+        return RecursiveDescentParser(flatten=flatten)
+    elif backend != "ply":
+        raise ValueError("Unknown parser backend %r" % backend)
+    elif flatten:
+        raise ValueError("Flattened chains require the rd backend")
+
+    cache_dir = exprcache.get_cache_dir(cache_dir)
+    tabfile = os.path.join(cache_dir, "parsetab-%s.pickle" % grammar_signature())
+    module = sys.modules[__name__]
+    if not rebuild and os.path.exists(tabfile):
+        # The file name already encodes the grammar signature, so the
+        # grammar need not be validated against it.  The tables are read
+        # here rather than by yacc(), which would regenerate a bad file
+        # in place and write parser.out into the current directory.
+        try:
+            return _report_once(_load_parsetab(tabfile))
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError, IndexError,
+                KeyError, AttributeError, ImportError, yacc.VersionError):
+            # A corrupt or stale table.  Remove it so that it is rebuilt
+            # below instead of failing again in every later process.
+            try:
+                os.remove(tabfile)
+            except OSError:
+                pass
+    # Build into private files and move them into place so that concurrent
+    # processes never load a partially written table.  The description
+    # of the grammar, parser.out, goes in the cache directory too.
+    tmpfile = exprcache.temp_name(tabfile)
+    debugfile = os.path.join(cache_dir, "parser.out")
+    with open(exprcache.temp_name(debugfile), "w") as f:
+        parser = yacc.yacc(module=module, picklefile=tmpfile, debuglog=yacc.PlyLogger(f))
+    os.replace(f.name, debugfile)
+    os.replace(tmpfile, tabfile)
+    return _report_once(parser)
 
 if __name__ == '__main__':
-    import exprlex
-    import sys
     from errors import subscribe_errors
     lexer = exprlex.make_lexer()
     parser = make_parser()
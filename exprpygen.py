@@ -224,12 +224,12 @@ class BlockCodeEmitter(exprblock.BlockVisitor):
         # Emit a jump around the else-branch (if there is one)
         self.emit("if %s:" % block.condvar)
         self.indent()
-        self.visit(block.truebranch)
+        yield block.truebranch
         if block.falsebranch:
             self.dedent()
             self.emit("else:")
             self.indent()
-            self.visit(block.falsebranch)
+            yield block.falsebranch
         self.dedent()
 
     def visit_WhileBlock(self,block):
@@ -238,7 +238,7 @@ class BlockCodeEmitter(exprblock.BlockVisitor):
         self.indent()
         self.visit_BasicBlock(block)
         self.emit("if not %s: break" % block.condvar)
-        self.visit(block.truebranch)
+        yield block.truebranch
         self.dedent()
         # Emit a jump around the else-branch (if there is one)
 
@@ -0,0 +1,308 @@
+# exprserial.py
+'''
+Binary serialization of the AST.
+
+dumps(program) encodes a tree of exprast nodes as bytes, and loads()
+makes an equal tree from them again, much faster than lexing and
+parsing the source.  This lets a pipeline parse and check a source
+file once and have the later stages reload the result:
+
+       data = exprserial.dumps(program)        # After checking
+       ...
+       program = exprserial.loads(data)
+       code = exprcode.generate_code(exprconst.fold_constants(program))
+
+The encoding keeps the _fields of every node and the _attributes set
+by the parser and the checker: lineno, check_type (by type name),
+scope_level, the parm of function call arguments, and the symbol table
+of the Program.  A node that appears in several places is written once
+and comes back shared in the same way.  Attributes holding other kinds
+of objects, such as the Environment the checker leaves on the Program,
+are not written.
+
+The data starts with a header giving the format version and a digest
+of the node classes (their names, _fields and _attributes).  loads()
+raises ValueError if either differs from this version of the compiler,
+so data cached by an older compiler is rejected rather than loaded
+into the wrong fields.  The rest is written with the marshal module,
+so loading it never runs code, unlike a pickle.
+'''
+
+import sys
+import marshal
+from array import array
+
+import exprast
+import exprcache
+import exprtype
+from exprcheck import SymbolTable
+
+FORMAT_VERSION = 1
+
+_MAGIC = b'EXPRAST\0'
+
+# Every value is encoded as an integer, (payload << 3) | tag.  The
+# payload is the index of a node, list, value, type or symbol table in
+# its own table, or a small int itself.
+_NODE = 0
+_LIST = 1
+_VALUE = 2
+_INT = 3
+_NONE = 4
+_ABSENT = 5          # A field that is not set
+_TYPE = 6
+_SYMTAB = 7
+
+_MIN_INT = -2**59
+_MAX_INT = 2**59 - 1
+
+# Values that marshal can write and that are kept in the value table
+_MARSHAL_TYPES = (str, int, float, bool, complex, bytes)
+
+def _node_classes():
+    return sorted((cls for cls in vars(exprast).values()
+                   if isinstance(cls, type) and issubclass(cls, exprast.AST)),
+                  key=lambda cls: cls.__name__)
+
+def layout_signature():
+    '''
+    Return a digest of the format version and of the layout of the
+    node classes.  Data is only loaded if it was written with the same
+    signature.
+    '''
+    return exprcache.fingerprint(FORMAT_VERSION, sys.byteorder,
+                                 [(cls.__name__, cls._fields, cls._attributes)
+                                  for cls in _node_classes()])
+
+_header_bytes = None
+
+def _header():
+    # The node classes don't change, so the header is only made once
+    global _header_bytes
+    if _header_bytes is None:
+        _header_bytes = (_MAGIC + FORMAT_VERSION.to_bytes(2, 'little') +
+                         layout_signature().encode('ascii'))
+    return _header_bytes
+
+class _Unsupported(Exception):
+    pass
+
+_MISSING = object()
+
+def _pack(values):
+    # Return (typecode, bytes) for an array of ints, using the smallest
+    # typecode that holds all of them
+    low, high = min(values, default=0), max(values, default=0)
+    for typecode, limit in (('b', 2**7), ('h', 2**15), ('i', 2**31)):
+        if -limit <= low and high < limit:
+            break
+    else:
+        typecode = 'q'
+    return typecode, array(typecode, values).tobytes()
+
+def _unpack(packed):
+    typecode, data = packed
+    return array(typecode, data)
+
+# ----------------------------------------------------------------------
+# Writing
+
+class _Writer(object):
+    def __init__(self):
+        self.nodes = []
+        self.node_ids = { }
+        self.classes = []
+        self.class_ids = { }
+        self.kinds = array('B')
+        self.fields = array('q')
+        self.list_lengths = array('q')
+        self.list_items = array('q')
+        self.values = []
+        self.value_ids = { }
+        self.types = []
+        self.type_ids = { }
+        self.symtabs = []
+        self.symtab_ids = { }
+        self.attributes = { }
+
+    def write(self, program):
+        root = self.encode(program)
+        # Nodes are numbered as they are first seen and written in that
+        # order, so their fields can go in one array in the same order.
+        index = 0
+        while index < len(self.nodes):
+            node = self.nodes[index]
+            for name in node._fields:
+                value = getattr(node, name, _MISSING)
+                self.fields.append(_ABSENT if value is _MISSING else self.encode(value))
+            for name in node._attributes:
+                value = getattr(node, name, _MISSING)
+                if value is not _MISSING:
+                    try:
+                        value = self.encode(value)
+                    except _Unsupported:
+                        continue
+                    indices, values = self.attributes.get(name) or \
+                        self.attributes.setdefault(name, (array('q'), array('q')))
+                    indices.append(index)
+                    values.append(value)
+            index += 1
+        return marshal.dumps((
+            tuple(cls.__name__ for cls in self.classes),
+            self.kinds.tobytes(),
+            _pack(self.fields),
+            _pack(self.list_lengths),
+            _pack(self.list_items),
+            tuple(self.values),
+            tuple(self.types),
+            tuple((name, _pack(indices), _pack(values))
+                  for name, (indices, values) in sorted(self.attributes.items())),
+            tuple(self.symtabs),
+            root))
+
+    def encode(self, value):
+        if value is None:
+            return _NONE
+        if isinstance(value, exprast.AST):
+            index = self.node_ids.get(value)
+            if index is None:
+                index = self.node_ids[value] = len(self.nodes)
+                self.nodes.append(value)
+                cls = getattr(value, '_node_class', type(value))
+                kind = self.class_ids.get(cls)
+                if kind is None:
+                    if getattr(exprast, cls.__name__, None) is not cls:
+                        raise _Unsupported(value)
+                    kind = self.class_ids[cls] = len(self.classes)
+                    self.classes.append(cls)
+                self.kinds.append(kind)
+            return (index << 3) | _NODE
+        if type(value) is int and _MIN_INT <= value <= _MAX_INT:
+            return (value << 3) | _INT
+        if isinstance(value, list):
+            items = [self.encode(item) for item in value]
+            self.list_lengths.append(len(items))
+            self.list_items.extend(items)
+            return ((len(self.list_lengths) - 1) << 3) | _LIST
+        if type(value) in _MARSHAL_TYPES:
+            # Floats and complex numbers go by repr(), as 0.0 == -0.0
+            key = (type(value), repr(value) if type(value) in (float, complex) else value)
+            ident = self.value_ids.get(key)
+            if ident is None:
+                ident = self.value_ids[key] = len(self.values)
+                self.values.append(value)
+            return (ident << 3) | _VALUE
+        if isinstance(value, exprtype.ExprType):
+            ident = self.type_ids.get(value.typename)
+            if ident is None:
+                ident = self.type_ids[value.typename] = len(self.types)
+                self.types.append(value.typename)
+            return (ident << 3) | _TYPE
+        if isinstance(value, SymbolTable):
+            ident = self.symtab_ids.get(id(value))
+            if ident is None:
+                ident = self.symtab_ids[id(value)] = len(self.symtabs)
+                self.symtabs.append(None)
+                self.symtabs[ident] = (self.encode(value.decl), tuple(value),
+                                       _pack(array('q', map(self.encode, value.values()))))
+            return (ident << 3) | _SYMTAB
+        raise _Unsupported(value)
+
+def dumps(program):
+    '''
+    Return the AST rooted at program (normally a Program node) encoded
+    as bytes.  Raises ValueError if a field holds a value that cannot
+    be encoded.
+    '''
+    try:
+        return _header() + _Writer().write(program)
+    except _Unsupported as e:
+        raise ValueError("Cannot serialize {!r}".format(e.args[0])) from None
+
+def dump(program, file):
+    '''
+    Write the AST rooted at program to the binary file object file.
+    '''
+    file.write(dumps(program))
+
+# ----------------------------------------------------------------------
+# Reading
+
+_types = None
+
+def _types_by_name():
+    global _types
+    if _types is None:
+        _types = dict((value.typename, value) for value in vars(exprtype).values()
+                      if isinstance(value, exprtype.ExprType))
+    return _types
+
+def loads(data):
+    '''
+    Return the AST encoded in data by dumps().  Raises ValueError if
+    data was not written by dumps() or was written by a version of the
+    compiler with a different format or different node classes.
+    '''
+    header = _header()
+    if bytes(data[:len(_MAGIC)]) != _MAGIC:
+        raise ValueError("Not serialized AST data")
+    if bytes(data[:len(header)]) != header:
+        raise ValueError("Serialized AST data is from an incompatible compiler version")
+    (classnames, kinds, fields, list_lengths, list_items, values, typenames,
+     attributes, symtabs, root) = marshal.loads(memoryview(data)[len(header):])
+
+    classes = [getattr(exprast, name) for name in classnames]
+    nodes = [classes[kind].__new__(classes[kind]) for kind in kinds]
+    types = _types_by_name()
+    types = [types[name] for name in typenames]
+    list_starts = [0]
+    for length in _unpack(list_lengths):
+        list_starts.append(list_starts[-1] + length)
+    list_items = _unpack(list_items)
+    tables = [None] * len(symtabs)
+
+    def decode(value):
+        tag = value & 7
+        if tag == _NODE:
+            return nodes[value >> 3]
+        if tag == _INT:
+            return value >> 3
+        if tag == _NONE:
+            return None
+        if tag == _VALUE:
+            return values[value >> 3]
+        if tag == _LIST:
+            ident = value >> 3
+            return [decode(item) for item in list_items[list_starts[ident]:list_starts[ident+1]]]
+        if tag == _TYPE:
+            return types[value >> 3]
+        if tag == _SYMTAB:
+            ident = value >> 3
+            if tables[ident] is None:
+                decl, names, encoded = symtabs[ident]
+                table = tables[ident] = SymbolTable(decl=decode(decl))
+                for name, item in zip(names, _unpack(encoded)):
+                    table[name] = decode(item)
+            return tables[ident]
+        raise ValueError("Bad serialized AST value {}".format(value))
+
+    fields = _unpack(fields)
+    position = 0
+    for node in nodes:
+        for name in node._fields:
+            value = fields[position]
+            position += 1
+            if value & 7 == _NODE:
+                setattr(node, name, nodes[value >> 3])
+            elif value != _ABSENT:
+                setattr(node, name, decode(value))
+    for name, indices, encoded in attributes:
+        for index, value in zip(_unpack(indices), _unpack(encoded)):
+            setattr(nodes[index], name, decode(value))
+    return decode(root)
+
+def load(file):
+    '''
+    Read an AST written by dump() from the binary file object file.
+    '''
+    return loads(file.read())
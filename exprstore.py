@@ -0,0 +1,396 @@
+# exprstore.py
+'''
+Array-backed storage for the AST.
+
+Every exprast node is a Python object, and a machine-generated program
+of a few million nodes takes gigabytes as a tree of them.  An ASTStore
+holds the same tree in a handful of parallel arrays instead, one entry
+per node:
+
+      kinds      the class of the node (an index into store.classes)
+      linenos    the lineno attribute, or -1 if it has none
+      types      the check_type attribute (an index into store.type_table)
+      fields[n]  the nth of the node's _fields, encoded as an integer
+
+A field that holds a node holds its index in the arrays.  Lists of
+nodes are kept as an array of indices each (store.lists).  Small
+integers are kept in the field itself, and all other values, such as
+operators, names and other literal values, are kept once each in
+store.values.  The remaining attributes set by the later
+passes, like gen_location, are kept in a dictionary per attribute
+that only has entries for the nodes that have one.
+
+The passes work on a store without changes.  store.add(tree) copies
+a tree of nodes into the store and returns a proxy for its root:
+
+       store = ASTStore()
+       program = store.add(parser.parse(text))
+       exprcheck.check_program(program)
+       code = exprcode.generate_code(exprconst.fold_constants(program))
+
+A proxy is a small object made on demand that refers to one node of a
+store.  Its class is a subclass of the class of the node, with the
+same name, so isinstance() tests and visitor dispatch work as usual,
+and reading or setting its _fields and _attributes reads or sets the
+arrays.  Setting a field to a new node, such as a Literal made by the
+constant folder, adds that node to the store.  Two proxies for the
+same node compare equal, but are not necessarily the same object.
+
+A store only saves memory.  Every field read makes a proxy and goes
+through the arrays, so each pass over a stored program is slower than
+over the tree of nodes, by 3-4x on the program of 400 functions in
+bench_ast_store (see exprbench.py):
+
+       pass             nodes     store
+       check            31 ms    125 ms
+       fold             50 ms    161 ms
+       generate code    46 ms    160 ms
+
+Use a store only for programs whose trees would not otherwise fit in
+memory.
+'''
+
+from array import array
+
+import exprast
+
+# A field value is encoded as (payload << 3) | tag.  The payload is a
+# node index, a list index, a value index or a small int itself,
+# depending on the tag.
+_NODE = 0
+_LIST = 1
+_VALUE = 2
+_INT = 3
+_NONE = 4            # The field holds None
+_ABSENT = 5          # The field is not set (deleted by a transformer)
+
+_MIN_INT = -2**28
+_MAX_INT = 2**28 - 1
+
+class ASTStore(object):
+    '''
+    Parallel arrays holding the nodes of one or more trees.  See above.
+    '''
+    def __init__(self):
+        self.kinds = array('B')
+        self.linenos = array('i')
+        self.types = array('h')
+        self.fields = []
+        self.lists = []
+        self.values = []
+        self.classes = []
+        self.type_table = []
+        self.attributes = { }
+        self._value_ids = { }
+        self._class_ids = { }
+        self._type_ids = { }
+        self._proxies = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, node):
+        '''
+        Copy node, and the nodes under it, into the store and return a
+        proxy for it.  The tree is walked without recursing, so it can
+        be of any depth.  If node is None, as returned by the parser for
+        some syntax errors, nothing is added and None is returned.
+        '''
+        if node is None:
+            return None
+        return self.proxy(self._add(node))
+
+    def proxy(self, index):
+        '''
+        Return a proxy for the node at index.
+        '''
+        return self._proxies[self.kinds[index]](self, index)
+
+    def index_of(self, node):
+        '''
+        Return the index of node, which is a proxy for a node of this
+        store, or None if it is not.
+        '''
+        if isinstance(node, NodeProxy) and node._store is self:
+            return node._index
+        return None
+
+    # Adding nodes
+
+    def _add(self, node):
+        return self.encode(node) >> 3
+
+    def _new_node(self, node, pending):
+        # Make room for node and queue it to have its fields filled in
+        cls = getattr(node, '_node_class', type(node))
+        kind = self._class_ids.get(cls)
+        if kind is None:
+            kind = self._add_class(cls)
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.linenos.append(-1)
+        self.types.append(-1)
+        for slot in self.fields:
+            slot.append(_ABSENT)
+        pending.append((node, index))
+        return index
+
+    def _add_class(self, cls):
+        kind = self._class_ids[cls] = len(self.classes)
+        self.classes.append(cls)
+        self._proxies.append(proxy_class(cls))
+        while len(self.fields) < len(cls._fields):
+            self.fields.append(array('i', [_ABSENT]) * len(self.kinds))
+        return kind
+
+    def _fill(self, pending):
+        # Fill in the fields and attributes of the queued nodes, queueing
+        # any nodes found in them in turn
+        while pending:
+            node, index = pending.pop()
+            for slot, name in enumerate(node._fields):
+                if hasattr(node, name):
+                    self.fields[slot][index] = self._encode(getattr(node, name), pending)
+            for name in node._attributes:
+                if hasattr(node, name):
+                    self.set_attribute(index, name, getattr(node, name))
+
+    def _encode(self, value, pending):
+        if value is None:
+            return _NONE
+        if isinstance(value, exprast.AST):
+            index = self.index_of(value)
+            if index is None:
+                index = self._new_node(value, pending)
+            return (index << 3) | _NODE
+        if isinstance(value, list):
+            self.lists.append(array('i', [self._encode(item, pending) for item in value]))
+            return ((len(self.lists) - 1) << 3) | _LIST
+        if type(value) is int and _MIN_INT <= value <= _MAX_INT:
+            return (value << 3) | _INT
+        return (self._value_id(value) << 3) | _VALUE
+
+    def _value_id(self, value):
+        # Values are shared by type and value, so that 1, 1.0 and True
+        # stay distinct.  Floats and complex numbers go by their repr(),
+        # as 0.0 == -0.0.  Unhashable values are simply appended.
+        try:
+            key = (type(value), repr(value) if type(value) in (float, complex) else value)
+            ident = self._value_ids.get(key)
+            if ident is None:
+                ident = self._value_ids[key] = len(self.values)
+                self.values.append(value)
+        except TypeError:
+            ident = len(self.values)
+            self.values.append(value)
+        return ident
+
+    def encode(self, value):
+        '''
+        Return value encoded as a field, adding it (and any nodes in it)
+        to the store as needed.
+        '''
+        pending = []
+        encoded = self._encode(value, pending)
+        self._fill(pending)
+        return encoded
+
+    def decode(self, value):
+        '''
+        Return the value of a field encoded with encode().  Nodes are
+        returned as proxies and lists as NodeLists.
+        '''
+        tag = value & 7
+        if tag == _NODE:
+            return self.proxy(value >> 3)
+        if tag == _INT:
+            return value >> 3
+        if tag == _VALUE:
+            return self.values[value >> 3]
+        if tag == _LIST:
+            return NodeList(self, value >> 3)
+        if tag == _NONE:
+            return None
+        raise AttributeError("field is not set")
+
+    # Attributes.  lineno and check_type are kept in the linenos and
+    # types arrays, and everything else (including a lineno that does
+    # not fit) in the attributes dictionary.
+
+    def get_attribute(self, index, name):
+        if name == 'lineno':
+            if self.linenos[index] >= 0:
+                return self.linenos[index]
+        elif name == 'check_type':
+            if self.types[index] >= 0:
+                return self.type_table[self.types[index]]
+        values = self.attributes.get(name)
+        if values is not None and index in values:
+            return values[index]
+        raise AttributeError(name)
+
+    def set_attribute(self, index, name, value):
+        self.del_attribute(index, name, missing_ok=True)
+        if name == 'lineno' and type(value) is int and 0 <= value < 2**31:
+            self.linenos[index] = value
+        elif name == 'check_type':
+            ident = self._type_ids.get(id(value))
+            if ident is None:
+                ident = self._type_ids[id(value)] = len(self.type_table)
+                self.type_table.append(value)
+            self.types[index] = ident
+        else:
+            self.attributes.setdefault(name, { })[index] = value
+
+    def del_attribute(self, index, name, missing_ok=False):
+        found = False
+        if name == 'lineno' and self.linenos[index] >= 0:
+            self.linenos[index] = -1
+            found = True
+        elif name == 'check_type' and self.types[index] >= 0:
+            self.types[index] = -1
+            found = True
+        values = self.attributes.get(name)
+        if values is not None and index in values:
+            del values[index]
+            found = True
+        if not found and not missing_ok:
+            raise AttributeError(name)
+
+class NodeList(list):
+    '''
+    A list field of a node in a store, as a list of proxies.  Changes
+    made to it are written back to the store.
+    '''
+    __slots__ = ('_store', '_ident')
+
+    def __init__(self, store, ident):
+        list.__init__(self, map(store.decode, store.lists[ident]))
+        self._store = store
+        self._ident = ident
+
+    def _save(self):
+        store = self._store
+        encoded = store.lists[self._ident] = array('i', map(store.encode, self))
+        list.__setitem__(self, slice(None), map(store.decode, encoded))
+
+    def append(self, item):
+        encoded = self._store.encode(item)
+        self._store.lists[self._ident].append(encoded)
+        list.append(self, self._store.decode(encoded))
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def _changes(name):
+        method = getattr(list, name)
+        def change(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self._save()
+            return result
+        change.__name__ = name
+        return change
+
+    insert = _changes('insert')
+    pop = _changes('pop')
+    remove = _changes('remove')
+    clear = _changes('clear')
+    sort = _changes('sort')
+    reverse = _changes('reverse')
+    __setitem__ = _changes('__setitem__')
+    __delitem__ = _changes('__delitem__')
+    __imul__ = _changes('__imul__')
+    del _changes
+
+class NodeProxy(object):
+    '''
+    Base class of the proxies for nodes in an ASTStore.  The proxy
+    class for each node class is made by proxy_class().
+    '''
+    __slots__ = ()
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __eq__(self, other):
+        if isinstance(other, NodeProxy):
+            return self._store is other._store and self._index == other._index
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash((id(self._store), self._index))
+
+def _no_attribute(node, name):
+    return AttributeError("'{}' object has no attribute '{}'".format(type(node).__name__, name))
+
+def _field_property(name, slot):
+    def get(self):
+        store = self._store
+        value = store.fields[slot][self._index]
+        if value & 7 == _NODE:
+            index = value >> 3
+            return store._proxies[store.kinds[index]](store, index)
+        try:
+            return store.decode(value)
+        except AttributeError:
+            raise _no_attribute(self, name) from None
+    def set(self, value):
+        store = self._store
+        store.fields[slot][self._index] = store.encode(value)
+    def delete(self):
+        get(self)
+        self._store.fields[slot][self._index] = _ABSENT
+    return property(get, set, delete)
+
+def _attribute_property(name):
+    def get(self):
+        try:
+            return self._store.get_attribute(self._index, name)
+        except AttributeError:
+            raise _no_attribute(self, name) from None
+    if name == 'lineno':
+        def get(self, get_attribute=get):
+            lineno = self._store.linenos[self._index]
+            return lineno if lineno >= 0 else get_attribute(self)
+    elif name == 'check_type':
+        def get(self, get_attribute=get):
+            ident = self._store.types[self._index]
+            return self._store.type_table[ident] if ident >= 0 else get_attribute(self)
+    def set(self, value):
+        self._store.set_attribute(self._index, name, value)
+    def delete(self):
+        try:
+            self._store.del_attribute(self._index, name)
+        except AttributeError:
+            raise _no_attribute(self, name) from None
+    return property(get, set, delete)
+
+# Node class -> proxy class
+_proxy_classes = { }
+
+def proxy_class(cls):
+    '''
+    Return the proxy class for nodes of class cls.  It is a subclass
+    of cls with the same name.
+    '''
+    proxy = _proxy_classes.get(cls)
+    if proxy is None:
+        namespace = { '__slots__': ('_store', '_index'), '_node_class': cls }
+        for slot, name in enumerate(cls._fields):
+            namespace[name] = _field_property(name, slot)
+        for name in cls._attributes:
+            if name not in namespace:
+                namespace[name] = _attribute_property(name)
+        proxy = type(cls)(cls.__name__, (NodeProxy, cls), namespace)
+        proxy = _proxy_classes.setdefault(cls, proxy)
+    return proxy
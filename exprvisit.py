@@ -0,0 +1,150 @@
+# exprvisit.py
+'''
+Visiting the AST without recursion.
+
+NodeVisitor and NodeTransformer in exprast.py recurse once per level
+of the tree, so a long chain of binary operators or deeply nested if
+and while statements runs into Python's recursion limit.
+IterativeNodeVisitor and IterativeNodeTransformer are drop-in
+replacements that keep the nodes still being visited on a stack of
+their own instead.
+
+A visit_NodeName() method written as usual, calling self.visit() on
+the children, works as before (and recurses as before).  To visit a
+child without recursing, write the method as a generator that yields
+the child instead.  The result of visiting the child is sent back as
+the value of the yield, and the value returned by the generator is
+the result for the node:
+
+    class VisitOps(IterativeNodeVisitor):
+        def visit_Binop(self,node):
+            left = yield node.left
+            right = yield node.right
+            return (node.op, left, right)
+
+Nodes without a visit_NodeName() method have their children visited
+without recursing.  A visitor can also define enter_NodeName(node) and
+leave_NodeName(node) methods, called before and after a node is
+visited, with generic_enter() and generic_leave() as the fallbacks for
+all other nodes.  The methods to call for each class of node are
+looked up once per visitor class and kept in its dispatch table.
+'''
+
+from types import GeneratorType as _GeneratorType
+
+from exprast import AST, NodeVisitor
+from exprdispatch import dispatch_table
+
+class IterativeNodeVisitor(NodeVisitor):
+    '''
+    NodeVisitor that keeps its own stack of the nodes being visited
+    rather than recursing, so that the depth of the tree is limited
+    only by memory.  See the top of this file for writing visit_NodeName() methods
+    as generators.
+    '''
+    # Node class -> (enter, visit, leave), from exprdispatch.  Each
+    # subclass gets its own.
+    _dispatch_table = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch_table = dispatch_table(cls, _node_methods)
+
+    def visit(self,node):
+        '''
+        Visit node and return the result of its visit_NodeName() method.
+        '''
+        if not node:
+            return None
+        stack = []
+        value = self._begin(node, stack)
+        if stack:
+            value = self._run(stack, value)
+        return value
+
+    def generic_visit(self,node):
+        '''
+        Visit the children of node.
+        '''
+        return self._run([(self._children(node), node, None)], None)
+
+    def _children(self,node):
+        for field in node._fields:
+            value = getattr(node,field,None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item,AST):
+                        yield item
+            elif isinstance(value, AST):
+                yield value
+
+    def _begin(self, node, stack):
+        # Start visiting node.  Returns its result if it is finished, or
+        # None after pushing a generator that still has to be run.
+        enter, visit, leave = self._dispatch_table[type(node)]
+        if enter is not None:
+            enter(self, node)
+        if visit is None:
+            gen = self._children(node)
+        else:
+            result = visit(self, node)
+            if type(result) is not _GeneratorType:
+                if leave is not None:
+                    leave(self, node)
+                return result
+            gen = result
+        stack.append((gen, node, leave))
+        return None
+
+    def _run(self, stack, value):
+        while stack:
+            gen, node, leave = stack[-1]
+            try:
+                child = gen.send(value)
+            except StopIteration as e:
+                stack.pop()
+                value = e.value
+                if leave is not None:
+                    leave(self, node)
+                continue
+            value = self._begin(child, stack) if child else None
+        return value
+
+def _node_methods(cls, nodetype):
+    # Return (enter, visit, leave) for nodetype in the visitor class cls
+    name = nodetype.__name__
+    enter = getattr(cls, 'enter_' + name, None) or getattr(cls, 'generic_enter', None)
+    leave = getattr(cls, 'leave_' + name, None) or getattr(cls, 'generic_leave', None)
+    visit = getattr(cls, 'visit_' + name, None)
+    if visit is None and cls.generic_visit is not IterativeNodeVisitor.generic_visit:
+        visit = cls.generic_visit
+    return (enter, visit, leave)
+
+IterativeNodeVisitor._dispatch_table = dispatch_table(IterativeNodeVisitor, _node_methods)
+
+class IterativeNodeTransformer(IterativeNodeVisitor):
+    '''
+    NodeTransformer that does not recurse, in the same way as
+    IterativeNodeVisitor.  The result of visiting each child replaces
+    it, and a result of None deletes it.
+    '''
+    def _children(self,node):
+        for field in node._fields:
+            value = getattr(node,field,None)
+            if isinstance(value,list):
+                newvalues = []
+                for item in value:
+                    if isinstance(item,AST):
+                        newnode = yield item
+                        if newnode is not None:
+                            newvalues.append(newnode)
+                    else:
+                        newvalues.append(item)
+                value[:] = newvalues
+            elif isinstance(value,AST):
+                newnode = yield value
+                if newnode is None:
+                    delattr(node,field)
+                else:
+                    setattr(node,field,newnode)
+        return node
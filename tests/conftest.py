@@ -0,0 +1,8 @@
+# conftest.py
+'''
+The compiler modules live in the directory above this one.
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,128 @@
+# test_errors.py
+'''
+Tests for error reporting in errors.py.
+
+       bash % python -m pytest tests
+'''
+import asyncio
+import threading
+import unittest
+
+from errors import error, error_sink, ErrorSink, errors_reported, clear_errors, \
+    current_sink, subscribe_errors, error_filename
+
+class TestError(unittest.TestCase):
+    def test_format_args(self):
+        with error_sink() as sink:
+            error(3, "Undefined name {!r}", "x", code="undefined")
+        self.assertEqual(sink.messages(), ["3: Undefined name 'x'"])
+        self.assertEqual(sink.diagnostics[0].code, "undefined")
+
+    def test_filename(self):
+        # The old form error(lineno, message, filename) is deprecated
+        with error_sink() as sink:
+            with self.assertWarns(DeprecationWarning):
+                error(3, "Something is wrong", "prog.e")
+            error(4, "Something else", filename="prog.e")
+        self.assertEqual(sink.messages(), ["prog.e:3: Something is wrong",
+                                           "prog.e:4: Something else"])
+
+    def test_sink_filename(self):
+        sink = ErrorSink()
+        with self.assertWarns(DeprecationWarning):
+            sink.error(3, "Something is wrong", "prog.e")
+        self.assertEqual(sink.messages(), ["prog.e:3: Something is wrong"])
+
+    def test_literal_braces(self):
+        with error_sink() as sink:
+            error(3, "Expected '{'")
+            error(4, "Expected '{{' after {}", "if", filename="prog.e")
+            with self.assertWarns(DeprecationWarning):
+                error(5, "Expected '{' or '}'", "prog.e")
+        self.assertEqual(sink.messages(), ["3: Expected '{'",
+                                           "prog.e:4: Expected '{' after if",
+                                           "prog.e:5: Expected '{' or '}'"])
+
+    def test_extra_args(self):
+        with error_sink() as sink:
+            with self.assertRaises(TypeError):
+                error(3, "Something is wrong", "a", "b")
+            with self.assertRaises(TypeError):
+                error(3, "Something is wrong", "a", filename="prog.e")
+            with self.assertRaises(TypeError):
+                error(3, "Cannot assign {} to {}", "int")
+            with self.assertRaises(TypeError):
+                error(3, "Cannot assign {}", "int", "float")
+            with self.assertRaises(TypeError):
+                error(3, "Expected '{' or '}'", "prog.e", "x")
+        self.assertEqual(sink.errors_reported(), 0)
+
+class TestErrorSink(unittest.TestCase):
+    def test_nested(self):
+        messages = []
+        with error_sink() as outer, subscribe_errors(messages.append):
+            error(1, "Outer")
+            with error_sink() as inner, error_filename("inner.e"):
+                self.assertIs(current_sink(), inner)
+                self.assertEqual(errors_reported(), 0)
+                error(2, "Inner")
+                self.assertEqual(errors_reported(), 1)
+            self.assertIs(current_sink(), outer)
+            error(3, "Outer again")
+            self.assertEqual(errors_reported(), 2)
+            clear_errors()
+        self.assertEqual(outer.messages(), ["1: Outer", "3: Outer again"])
+        self.assertEqual(inner.messages(), ["inner.e:2: Inner"])
+        self.assertEqual(messages, ["1: Outer", "3: Outer again"])
+        self.assertEqual((outer.errors_reported(), inner.errors_reported()), (0, 1))
+
+    def test_shared_sink(self):
+        # Outside error_sink(), errors are counted but not kept
+        shared = current_sink()
+        count = shared.errors_reported()
+        with error_sink():
+            error(1, "Not shared")
+        self.assertEqual(shared.errors_reported(), count)
+        messages = []
+        with subscribe_errors(messages.append):
+            error(1, "Shared")
+        self.assertEqual(messages, ["1: Shared"])
+        self.assertEqual(shared.errors_reported(), count + 1)
+        self.assertEqual(shared.diagnostics, [])
+        shared.num_errors = count
+
+    def test_threads(self):
+        # Threads reporting at the same time each see only their own errors
+        barrier = threading.Barrier(4)
+        sinks = [None] * 4
+        def compile(n):
+            with error_sink(ErrorSink("file%d.e" % n)) as sink:
+                for lineno in range(1, 51):
+                    if lineno % 10 == 0:
+                        barrier.wait()
+                    error(lineno, "Error {} of thread {}", lineno, n)
+            sinks[n] = sink
+        threads = [threading.Thread(target=compile, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for n, sink in enumerate(sinks):
+            self.assertEqual(sink.errors_reported(), 50)
+            self.assertEqual(sink.messages(), ["file%d.e:%d: Error %d of thread %d" % (n, i, i, n)
+                                               for i in range(1, 51)])
+
+    def test_tasks(self):
+        async def compile(n):
+            with error_sink() as sink:
+                for lineno in range(1, 11):
+                    error(lineno, "Error of task {}", n)
+                    await asyncio.sleep(0)
+                return sink.messages()
+        async def main():
+            return await asyncio.gather(*[compile(n) for n in range(3)])
+        for n, messages in enumerate(asyncio.run(main())):
+            self.assertEqual(messages, ["%d: Error of task %d" % (i, n) for i in range(1, 11)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+# test_expr.py
+'''
+Tests for the compiler entry points in expr.py and exprclient.py.
+
+       bash % python -m pytest tests
+'''
+import io
+import os
+import json
+import socket
+import tempfile
+import threading
+import contextlib
+import unittest
+import unittest.mock
+
+import expr
+import exprclient
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+
+def read_test(name):
+    with open(os.path.join(TESTDIR, name)) as f:
+        return f.read()
+
+class TestCompileText(unittest.TestCase):
+    def test_syntax_errors(self):
+        # funcerrors.e has a syntax error in each of its 11 functions and
+        # calls, and only those are reported
+        text = read_test("funcerrors.e")
+        for backend in ("ply", "rd"):
+            with self.subTest(backend=backend):
+                lexer = expr.exprlex.make_lexer()
+                parser = expr.exprparse.make_parser(backend=backend)
+                result = expr.compile_text(text, lexer, parser)
+                self.assertIsNone(result.code)
+                self.assertEqual(len(result.diagnostics), 11)
+                self.assertEqual(set(diag.code for diag in result.diagnostics),
+                                 {"syntax-error"})
+
+class TestCompileMany(unittest.TestCase):
+    # errors.e makes the checker fail with an AttributeError, which
+    # only fails that file
+    paths = [os.path.join(TESTDIR, name) for name in ("fngood.e", "errors.e", "fngood.e")]
+
+    def check_results(self, results):
+        self.assertEqual([result.filename for result in results], self.paths)
+        good, bad, again = results
+        self.assertEqual(good.errors, [])
+        self.assertEqual(again.errors, [])
+        self.assertIsNotNone(good.code)
+        self.assertIsNotNone(again.code)
+        self.assertIsNone(bad.code)
+        self.assertIn(self.paths[1] + ":37: d is not a valid type", bad.errors)
+        self.assertEqual(bad.diagnostics[-1].code, "internal-error")
+        self.assertTrue(bad.errors[-1].startswith(
+            self.paths[1] + ": Internal compiler error: AttributeError: "))
+
+    def test_compile_many(self):
+        self.check_results(expr.compile_many(self.paths))
+
+    def test_compile_parallel(self):
+        self.check_results(list(expr.compile_parallel(self.paths, workers=2, chunksize=1)))
+        self.check_results(list(expr.compile_parallel(self.paths, workers=1)))
+
+class TestCompileListing(unittest.TestCase):
+    def test_deep_nesting(self):
+        # Far deeper than the recursion limit
+        depth = 3000
+        text = ("func main int() {\n    var x int = 1;\n" + "if x > 0 {\n" * depth +
+                "print x;\n" + "}\n" * depth + "}\n")
+        sink = expr.ErrorSink()
+        listing = expr.compile_listing(text, sink=sink)
+        self.assertEqual(sink.messages(), [])
+        lines = listing.splitlines()
+        self.assertEqual(sum(line.strip().startswith("if ") for line in lines), depth)
+        self.assertTrue(lines[-1].startswith("    " * depth))
+
+class TestCompileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_listing(self):
+        cache = expr.CompileCache(self.tmpdir.name)
+        # The second compile of each file comes from the cache, with the
+        # same errors
+        for name, errors in (("fngood.e", 0), ("funcerrors.e", 11)):
+            text = read_test(name)
+            sinks = [expr.ErrorSink() for _ in range(2)]
+            listings = [expr.compile_listing(text, sink=sink, cache=cache) for sink in sinks]
+            self.assertEqual(listings[1], listings[0])
+            self.assertEqual(listings[0] is None, errors > 0)
+            self.assertEqual(len(sinks[0].messages()), errors)
+            self.assertEqual(sinks[1].messages(), sinks[0].messages())
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_cache_stats(self):
+        path = os.path.join(TESTDIR, "fngood.e")
+        with unittest.mock.patch.dict(os.environ, {"EXPR_CACHE_DIR": self.tmpdir.name}):
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(3):
+                    expr.main(["expr.py", path])
+                expr.main(["expr.py", "--no-cache", path])
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                expr.main(["expr.py", "--cache-stats"])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertRegex(lines[0], r"^1 entries, \d+ bytes$")
+        self.assertEqual(lines[1], "2 hits, 1 misses (66.7% hits), 0 evictions")
+
+class TestCompileServer(unittest.TestCase):
+    def setUp(self):
+        self.server = expr.CompileServer()
+
+    def request(self, text):
+        return json.loads(self.server.handle(json.dumps({"source": text})))
+
+    def test_compile(self):
+        response = self.request(read_test("fngood.e"))
+        self.assertEqual(response["errors"], [])
+        self.assertIsNotNone(response["code"])
+
+    def test_internal_error(self):
+        # errors.e makes the checker fail with an AttributeError after
+        # it has reported some errors, which are kept
+        response = self.request(read_test("errors.e"))
+        self.assertIsNone(response["code"])
+        errors = response["errors"]
+        self.assertIn("10: Cannot assign variable 'e' outside function body", errors)
+        self.assertIn("37: d is not a valid type", errors)
+        self.assertTrue(errors[-1].startswith("Internal compiler error: AttributeError: "))
+        self.assertFalse(any(msg.startswith("Internal") for msg in errors[:-1]))
+        # The server still answers the next request
+        self.assertEqual(self.request(read_test("fngood.e"))["errors"], [])
+
+    def test_serve_stdio(self):
+        lines = [json.dumps({"source": read_test(name)}) + "\n"
+                 for name in ("errors.e", "fngood.e")]
+        outfile = io.StringIO()
+        self.server.serve_stdio(io.StringIO("".join(lines)), outfile)
+        responses = [json.loads(line) for line in outfile.getvalue().splitlines()]
+        self.assertEqual(len(responses), 2)
+        self.assertTrue(responses[0]["errors"][-1].startswith("Internal compiler error: "))
+        self.assertIsNotNone(responses[1]["code"])
+
+class TestAsyncCompiler(unittest.TestCase):
+    def test_event_loops(self):
+        # The shared compiler of compile_source() is used from two event
+        # loops in turn, with more compiles at once than its limit
+        import asyncio
+        text = read_test("fngood.e")
+        async def compile_all():
+            return await asyncio.gather(*[expr.compile_source(text) for _ in range(12)])
+        for _ in range(2):
+            results = asyncio.run(compile_all())
+            self.assertEqual(len(results), 12)
+            for result in results:
+                self.assertEqual(result.errors, [])
+                self.assertIsNotNone(result.code)
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "expr.sock")
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(1)
+
+    def tearDown(self):
+        self.listener.close()
+        self.tmpdir.cleanup()
+
+    def answer(self, data):
+        # Answer one connection with data and close it
+        def serve():
+            conn, _ = self.listener.accept()
+            with conn:
+                conn.makefile('rb').readline()
+                conn.sendall(data)
+        thread = threading.Thread(target=serve)
+        thread.start()
+        return thread
+
+    def test_bad_response(self):
+        for data in (b"", b"not json\n", b"[1, 2]\n", b"{\"code\": null}\n"):
+            thread = self.answer(data)
+            with self.assertRaises(ValueError):
+                exprclient.compile_remote("print 1;", self.path)
+            thread.join()
+
+    def test_fallback(self):
+        # With no proper response, the client compiles the file itself
+        thread = self.answer(b"")
+        filename = os.path.join(TESTDIR, "fngood.e")
+        environ = {"EXPR_SOCKET": self.path,
+                   "EXPR_CACHE_DIR": os.path.join(self.tmpdir.name, "cache")}
+        output = io.StringIO()
+        with unittest.mock.patch.dict(os.environ, environ), contextlib.redirect_stdout(output):
+            exprclient.main(["exprclient.py", filename])
+        thread.join()
+        self.assertEqual(output.getvalue().strip(),
+                         expr.compile_listing(read_test("fngood.e")).strip())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# test_exprast.py
+'''
+Tests for the AST node classes in exprast.py.
+
+       bash % python -m pytest tests
+'''
+import copy
+import pickle
+import unittest
+
+import exprast
+
+def node_classes():
+    classes = []
+    pending = [exprast.AST]
+    while pending:
+        cls = pending.pop()
+        classes.append(cls)
+        pending.extend(cls.__subclasses__())
+    return [cls for cls in classes if cls.__module__ == 'exprast']
+
+def all_slots(cls):
+    return [name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ())]
+
+class TestSlots(unittest.TestCase):
+    def test_slots_from_fields(self):
+        for cls in node_classes():
+            with self.subTest(cls=cls.__name__):
+                slots = all_slots(cls)
+                self.assertEqual(len(slots), len(set(slots)))
+                self.assertEqual(set(slots), set(cls._fields) | set(cls._attributes))
+                self.assertNotIn('__dict__', slots)
+
+    def test_no_other_attributes(self):
+        node = exprast.Binop('+', exprast.Literal(1), exprast.Literal(2), lineno=3)
+        self.assertFalse(hasattr(node, '__dict__'))
+        node.check_type = None
+        with self.assertRaises(AttributeError):
+            node.colour = 'red'
+        with self.assertRaises(AttributeError):
+            exprast.Literal(1, colour='red')
+
+    def test_unset_attributes(self):
+        node = exprast.Literal(1)
+        self.assertFalse(hasattr(node, 'lineno'))
+        self.assertIsNone(getattr(node, 'check_type', None))
+        self.assertEqual(repr(node), "Literal[{'value': 1}]")
+
+    def test_subclass(self):
+        # FuncParameter has the slots of VarDeclaration, and no more
+        self.assertEqual(exprast.FuncParameter.__slots__, ())
+        param = exprast.FuncParameter('x', exprast.Typename('int'), None, lineno=2)
+        self.assertEqual((param.name, param.lineno), ('x', 2))
+
+    def test_copy_and_pickle(self):
+        node = exprast.Binop('+', exprast.Literal(1, lineno=1), exprast.Literal(2.5), lineno=1)
+        node.check_type = 'int'
+        for other in (pickle.loads(pickle.dumps(node)), copy.deepcopy(node)):
+            self.assertEqual(repr(other), repr(node))
+            self.assertEqual(other.lineno, 1)
+            self.assertFalse(hasattr(other.right, 'lineno'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# test_exprcache.py
+'''
+Tests for the on-disk cache in exprcache.py.
+
+       bash % python -m pytest tests
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import exprcache
+
+class TestContentCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def make_cache(self, max_bytes=1000):
+        return exprcache.ContentCache("test", self.cache_dir, max_bytes)
+
+    def touch(self, cache, key, mtime):
+        os.utime(cache._path(key), (mtime, mtime))
+
+    def keys(self, cache):
+        return sorted(os.path.basename(path)[:-len(".entry")]
+                      for _, _, path in cache._entries())
+
+    def test_get_put(self):
+        cache = self.make_cache()
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", b"data")
+        self.assertEqual(cache.get("a"), b"data")
+        # Another cache on the same directory sees the entry
+        self.assertEqual(self.make_cache().get("a"), b"data")
+
+    def test_evict_least_recently_used(self):
+        cache = self.make_cache(max_bytes=300)
+        for n, key in enumerate("abc"):
+            cache.put(key, b"x" * 100)
+            self.touch(cache, key, 1000 + n)
+        # Reading a marks it as the most recently used, so b goes first
+        self.assertEqual(cache.get("a"), b"x" * 100)
+        cache.put("d", b"x" * 100)
+        self.assertEqual(self.keys(cache), ["a", "c", "d"])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_size_limit(self):
+        cache = self.make_cache(max_bytes=250)
+        for n in range(10):
+            key = "k%d" % n
+            cache.put(key, b"x" * 100)
+            self.touch(cache, key, 1000 + n)
+            self.assertLessEqual(cache.stats()["bytes"], 250)
+        self.assertEqual(self.keys(cache), ["k8", "k9"])
+        self.assertEqual(cache.evictions, 8)
+        # An entry larger than the limit is evicted at once
+        cache.put("big", b"x" * 300)
+        self.assertEqual(self.keys(cache), [])
+        # The limit also holds for entries left by an earlier process
+        cache = self.make_cache(max_bytes=1000)
+        for n in range(5):
+            cache.put("k%d" % n, b"x" * 100)
+        self.make_cache(max_bytes=250).put("new", b"x" * 100)
+        self.assertEqual(len(self.keys(cache)), 2)
+
+    def test_stats(self):
+        cache = self.make_cache(max_bytes=150)
+        cache.get("a")
+        cache.put("a", b"x" * 100)
+        cache.get("a")
+        cache.put("b", b"x" * 100)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 1, 1))
+        # Nothing is counted in the directory until it is saved
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 0, "evictions": 0,
+                                         "entries": 1, "bytes": 100})
+        cache.save_stats()
+        cache.save_stats()                      # Counts are only added once
+        other = self.make_cache(max_bytes=150)
+        other.get("a")
+        other.get("b")
+        other.save_stats()
+        cache.get("b")
+        cache.save_stats()
+        self.assertEqual(self.make_cache().stats(), {"hits": 3, "misses": 2, "evictions": 1,
+                                                     "entries": 1, "bytes": 100})
+
+    def test_clear(self):
+        cache = self.make_cache()
+        cache.put("a", b"data")
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
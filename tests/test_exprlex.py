@@ -0,0 +1,347 @@
+# test_exprlex.py
+'''
+Tests for the lexer backends in exprlex.py.
+
+       bash % python -m pytest tests
+'''
+import io
+import os
+import glob
+import mmap
+import random
+import shutil
+import tempfile
+import unittest
+
+import exprlex
+from errors import subscribe_errors
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE = '''
+/* Sample program */
+const pi = 3.14159;
+var x int = 0x1F + 017;
+print "Hello\\n";
+// C++ comment
+func f(a int) int { return a * 2 >= 1e3 && !false; }
+'''
+
+# Sources with lexical errors and other corner cases
+MALFORMED = [
+    'x = 1.5e+',
+    '/* unterminated\n\n',
+    '"abc\nx = 1;',
+    '"abc',
+    'a // no newline',
+    '@ $ ` 1.2.3 .x',
+    'trueish falsey true1 false',
+    'a /= b / c /* x */ / d',
+    '   \n  ',
+    '"bad \\q escape" "\\b4G" "\\b41\\n"',
+    '"backslash at the end \\\n";',
+    'x\r\n\ty',
+    '0x1G 0X ==== !== <=> &&& ||| !',
+    '/* a */ b /* c\n */ d /**/ e /***/ f /* * / **/',
+]
+
+def source_files():
+    texts = []
+    for filename in sorted(glob.glob(os.path.join(TESTDIR, '*.e'))):
+        with open(filename) as f:
+            texts.append(f.read())
+    return texts
+
+def token_list(lexer, text):
+    lexer.input(text)
+    return [(tok.type, tok.value, tok.lineno, tok.lexpos)
+            for tok in iter(lexer.token, None)]
+
+def token_list_of(lexer, text):
+    lexer.input(text)
+    return list(iter(lexer.token, None))
+
+def tok_tuple(tok):
+    return (tok.type, tok.value, tok.lineno, tok.lexpos)
+
+def lex(lexer, source):
+    '''
+    Return the tokens of source, as tuples, and the error messages.
+    '''
+    errors = []
+    with subscribe_errors(errors.append):
+        lexer.lineno = 1
+        return token_list(lexer, source), errors
+
+class TestScanner(unittest.TestCase):
+    def check_same(self, texts, **options):
+        ply = exprlex.make_lexer()
+        scanner = exprlex.make_lexer(backend="scanner", **options)
+        for text in texts:
+            self.assertEqual(lex(scanner, text), lex(ply, text), text)
+
+    def test_sources(self):
+        self.check_same(source_files() + [SAMPLE])
+
+    def test_malformed(self):
+        self.check_same(MALFORMED)
+
+    def test_compact(self):
+        self.check_same(source_files() + MALFORMED, compact=True)
+
+    def test_lineno_set_after_input(self):
+        scanner = exprlex.make_lexer(backend="scanner")
+        scanner.input("a\nb")
+        scanner.lineno = 10
+        self.assertEqual([tok.lineno for tok in scanner], [10, 11])
+        self.assertEqual(scanner.lineno, 11)
+
+class TestEscapes(unittest.TestCase):
+    # Source text of a string literal, its value and the number of bad
+    # escape codes in it
+    STRINGS = [
+        (r'"plain"', 'plain', 0),
+        (r'"a\nb\rc\td"', 'a\nb\rc\td', 0),
+        (r'"\"quoted\" \\"', '"quoted" \\', 0),
+        (r'"\\n is not a newline"', '\\n is not a newline', 0),
+        (r'"\b41\b4a\b4F\B41"', 'AJO\\B41', 1),
+        (r'"\\b41"', '\\b41', 0),
+        (r'"\b00\bff"', '\x00\xff', 0),
+        (r'"\q \b4G"', '\\q \\b4G', 2),
+    ]
+
+    def test_escapes(self):
+        for backend in ("ply", "scanner"):
+            lexer = exprlex.make_lexer(backend=backend)
+            for text, value, bad in self.STRINGS:
+                with self.subTest(backend=backend, text=text):
+                    tokens, errors = lex(lexer, text)
+                    self.assertEqual([(tok[0], tok[1]) for tok in tokens], [('STRING', value)])
+                    self.assertEqual(len(errors), bad)
+                    for msg in errors:
+                        self.assertIn("Bad string escape code", msg)
+
+class TestStreaming(unittest.TestCase):
+    '''
+    The scanner reading file objects and mmaps in small chunks, so that
+    tokens, comments and strings are split across chunk boundaries.
+    '''
+    CHUNKSIZES = (1, 2, 3, 5, 7, 16, 65536)
+
+    TEXTS = source_files() + MALFORMED + [
+        SAMPLE,
+        '/* a comment that spans\n several\n lines ;"*/ x = "a string; /*";\n',
+        '/* ends with a star **/ y;\n/* unterminated\n * comment\n',
+        'print "caf\u00e9 \u2603";\n',       # Multibyte UTF-8 in binary files
+        'var x = 12345678.5e-10 + 0x1F;\n',
+    ]
+
+    def check_source(self, make_source):
+        ply = exprlex.make_lexer()
+        scanner = exprlex.make_lexer(backend="scanner")
+        for text in self.TEXTS:
+            expected = lex(ply, text)
+            for chunksize in self.CHUNKSIZES:
+                errors = []
+                with subscribe_errors(errors.append):
+                    scanner.lineno = 1
+                    scanner.input(make_source(text), chunksize=chunksize)
+                    toks = [(tok.type, tok.value, tok.lineno, tok.lexpos)
+                            for tok in iter(scanner.token, None)]
+                self.assertEqual((toks, errors), expected, (text, chunksize))
+
+    def test_text_file(self):
+        self.check_source(io.StringIO)
+
+    def test_binary_file(self):
+        self.check_source(lambda text: io.BytesIO(text.encode('utf-8')))
+
+    def test_mmap(self):
+        def make_mmap(text):
+            data = text.encode('utf-8')
+            if not data:
+                return io.BytesIO(data)
+            with tempfile.TemporaryFile() as f:
+                f.write(data)
+                f.flush()
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.addCleanup(source.close)
+            return source
+        self.check_source(make_mmap)
+
+class TestParallel(unittest.TestCase):
+    def lex_file(self, text, **options):
+        with tempfile.NamedTemporaryFile("w", suffix=".e", delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        errors = []
+        with subscribe_errors(errors.append):
+            toks = exprlex.lex_parallel(f.name, **options)
+        return [(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in toks], errors
+
+    def check_same(self, text):
+        expected = lex(exprlex.make_lexer(backend="scanner"), text)
+        for workers in (2, 3, 4):
+            self.assertEqual(self.lex_file(text, workers=workers), expected)
+        self.assertEqual(self.lex_file(text, workers=3, compact=True), expected)
+
+    def test_split_points(self):
+        # Every split point must be just past a ';' or '}' token
+        text = "\n".join(source_files() + MALFORMED[:-1])
+        scanner = exprlex.make_lexer(backend="scanner")
+        with subscribe_errors(lambda msg: None):
+            ends = set(tok.lexpos + 1 for tok in token_list_of(scanner, text)
+                       if tok.type in ('SEMI', 'RCURL'))
+        for parts in range(2, 40):
+            points = exprlex._split_points(text, parts)
+            self.assertTrue(points)
+            self.assertLessEqual(set(points), ends)
+
+    def test_sources(self):
+        self.check_same("\n".join(source_files()))
+
+    def test_comments_and_strings(self):
+        # Split characters in a long comment and in strings, around the
+        # places the file would be split at
+        comment = "/*\n" + "".join('comment line %d; "quote } here;\n' % n
+                                    for n in range(50)) + "*/\n"
+        strings = "".join('print "a;b}c %d";\n' % n for n in range(50))
+        self.check_same(comment + "var x int = 1;\nprint x;\n" * 3)
+        self.check_same(strings + comment + strings)
+        self.check_same('print "unterminated; string;\n' * 20 + comment * 2)
+        self.check_same("x;\n" * 20 + "/* unterminated; comment;\n" * 20)
+        # A backslash before a newline does not continue a string
+        self.check_same('print "a\\\nx; "b;} c";\n' * 20)
+        self.check_same("x;\n" * 20 + "// comment; at the end")
+
+    def test_comment_string_re(self):
+        regex = exprlex.comment_string_re(r'[;]')
+        matches = lambda text: [m.group() for m in regex.finditer(text)]
+        self.assertEqual(matches('"a\\\n;"b;"'), ['"a\\', ';', '"b;"'])
+        self.assertEqual(matches('; // c;'), [';', '// c;'])
+        self.assertEqual(matches('/* ; */ ; /* ;'), ['/* ; */', ';', '/* ;'])
+
+class SmallBlocks(exprlex.IncrementalLexer):
+    # Small blocks, so that edits often cross block boundaries
+    BLOCKSIZE = 4
+
+class TestIncrementalLexer(unittest.TestCase):
+    '''
+    After any edit, the tokens of an IncrementalLexer must be the same
+    as lexing the new text from scratch.
+    '''
+    TEXT = "\n".join(source_files()[:4]) + SAMPLE
+
+    def full_lex(self, text, compact=False):
+        return lex(exprlex.make_lexer(backend="scanner", compact=compact), text)[0]
+
+    def apply(self, lexer, offset, deleted, inserted):
+        before = [(tok.type, tok.value) for tok in lexer.tokens]
+        text = lexer.text[:offset] + inserted + lexer.text[offset+deleted:]
+        with subscribe_errors(lambda msg: None):
+            index, count, new = lexer.edit(offset, deleted, inserted)
+        tokens = [tok_tuple(tok) for tok in lexer.tokens]
+        self.assertEqual(lexer.text, text)
+        self.assertEqual(tokens, self.full_lex(text, lexer.compact),
+                         (offset, deleted, inserted))
+        # The edit is described by the tokens it replaced.  The tokens
+        # after them keep their type and value, but may have moved.
+        before[index:index+count] = [(tok.type, tok.value) for tok in new]
+        self.assertEqual(before, [token[:2] for token in tokens])
+
+    def make(self, cls=exprlex.IncrementalLexer, text=TEXT, compact=False):
+        with subscribe_errors(lambda msg: None):
+            return cls(text, compact=compact)
+
+    def test_comments(self):
+        for cls in (exprlex.IncrementalLexer, SmallBlocks):
+            lexer = self.make(cls)
+            start = lexer.text.index('/*')
+            end = lexer.text.index('*/', start)
+            self.apply(lexer, start + 3, 0, "*/ x = 1;")       # Close the comment early
+            self.apply(lexer, start + 3, 9, "")                # And reopen it
+            self.apply(lexer, end, 2, "")                      # Unterminate it
+            self.apply(lexer, end, 0, "*/")
+            self.apply(lexer, start, 2, "")                    # Uncomment it
+            self.apply(lexer, start, 0, "/*")
+            self.apply(lexer, 0, 0, "// ")                     # Comment out a line
+            self.apply(lexer, 0, 3, "")
+
+    def test_strings(self):
+        for cls in (exprlex.IncrementalLexer, SmallBlocks):
+            lexer = self.make(cls)
+            start = lexer.text.index('"')
+            self.apply(lexer, start + 1, 0, '"')               # End the string early
+            self.apply(lexer, start + 1, 1, '')
+            self.apply(lexer, start, 1, '')                    # Remove the opening quote
+            self.apply(lexer, start, 0, '"')
+            self.apply(lexer, start + 1, 0, '\\')            # Escape a character
+            self.apply(lexer, start + 1, 1, '')
+            self.apply(lexer, start + 1, 0, '/* ; */')         # Comment text in a string
+            self.apply(lexer, len(lexer.text), 0, '\nprint "abc')
+
+    def test_block_boundaries(self):
+        lexer = self.make(SmallBlocks)
+        n = SmallBlocks.BLOCKSIZE
+        while n < len(lexer.tokens):
+            pos = lexer.tokens[n].lexpos
+            n += SmallBlocks.BLOCKSIZE
+            self.apply(lexer, pos, 0, "x ")
+            self.apply(lexer, pos, 2, "")
+            self.apply(lexer, pos, 1, "yy")
+            self.apply(lexer, pos - 1, 2, "\n")
+
+    def test_random_edits(self):
+        # Edits anywhere, often near the previous one, so that the
+        # shifted tokens after the gap are checked too
+        pieces = ['/*', '*/', '"', '\\', '\n', ';', '}', 'x', '1e', '+5', '//', ' ',
+                  'true', '.', '0x', 'func', '"a;b"', '/* c */']
+        rand = random.Random(8)
+        for trial in range(20):
+            lexer = self.make(SmallBlocks if trial % 2 else exprlex.IncrementalLexer,
+                              compact=trial % 3 == 0)
+            offset = 0
+            for step in range(30):
+                if rand.random() < 0.5:
+                    offset = rand.randint(0, len(lexer.text))
+                else:
+                    offset = min(max(offset + rand.randint(-10, 10), 0), len(lexer.text))
+                deleted = min(rand.choice([0, 0, 1, 2, 5]), len(lexer.text) - offset)
+                inserted = ''.join(rand.choice(pieces) for _ in range(rand.randint(0, 2)))
+                self.apply(lexer, offset, deleted, inserted)
+
+class TestOptimizedLexer(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.tabfile = os.path.join(self.cache_dir,
+                                    "lextab_%s.py" % exprlex.lexer_signature())
+
+    def test_cached_table(self):
+        expected = token_list(exprlex.make_lexer(), SAMPLE)
+        lexer = exprlex.make_lexer(optimize=True, cache_dir=self.cache_dir)
+        self.assertTrue(os.path.exists(self.tabfile))
+        self.assertEqual(token_list(lexer, SAMPLE), expected)
+        lexer = exprlex.make_lexer(optimize=True, cache_dir=self.cache_dir)
+        self.assertEqual(token_list(lexer, SAMPLE), expected)
+
+    def check_rebuilt(self, contents):
+        with open(self.tabfile, "w") as f:
+            f.write(contents)
+        lexer = exprlex.make_lexer(optimize=True, cache_dir=self.cache_dir)
+        self.assertEqual(token_list(lexer, SAMPLE), token_list(exprlex.make_lexer(), SAMPLE))
+        with open(self.tabfile) as f:
+            self.assertNotEqual(f.read(), contents)
+        exprlex._load_lextab(self.tabfile)._lexstatere
+
+    def test_corrupt_table(self):
+        self.check_rebuilt("_tabversion = '3.4'\n_lextokens = {\n")
+
+    def test_incomplete_table(self):
+        self.check_rebuilt("import ply.lex\n_tabversion = ply.lex.__version__\n")
+
+    def test_stale_table(self):
+        self.check_rebuilt("_tabversion = '0.0'\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,333 @@
+# test_exprparse.py
+'''
+Tests for the parser backends in exprparse.py.
+
+       bash % python -m pytest tests
+'''
+import os
+import glob
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+
+import expr
+import exprast
+import exprlex
+import exprparse
+import exprcheck
+import exprconst
+from errors import subscribe_errors
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+
+# Programs with syntax errors
+MALFORMED = [
+    '',
+    'var',
+    'print 1 +;',
+    'var x int = ;\nprint x;\n',
+    'x = 1 print x;',
+    'if x { print 1; ',
+    'if { } else { }',
+    'while (x) { print 1; } }',
+    '} print 1;',
+    'func f(a int, ) int { return a; }',
+    'func f(,a int) int { return a; }',
+    'func (a int) { }',
+    'f(,x);\nf(x,);\nf(;\n',
+    'print 1 2 3 4 5;\nprint 6;\n',
+    'var x int = 1 +* 2;\nvar y int = 3;\nconst z = ;\n',
+    '{ print 1; }',
+    'if x { print 1; } else else { print 2; }',
+    'print ((1);\nprint 2));\n',
+    'return return;',
+    'const a = 1\nconst b = 2;\n',
+    'func f() int { if x { return 1 } return 2; }',
+]
+
+def source_files():
+    result = []
+    for filename in sorted(glob.glob(os.path.join(TESTDIR, '*.e'))):
+        with open(filename) as f:
+            result.append((os.path.basename(filename), f.read()))
+    return result
+
+def dump(node):
+    '''
+    Return the tree under node as a list of (depth, class name, lineno,
+    values of the other fields and attributes that are not nodes), or
+    None for no tree.
+    '''
+    if node is None:
+        return None
+    result = []
+    for depth, child in exprast.flatten(node):
+        values = tuple((name, getattr(child, name)) for name in child._fields + child._attributes
+                       if name != 'lineno' and hasattr(child, name) and
+                       not isinstance(getattr(child, name), (exprast.AST, list)))
+        result.append((depth, type(child).__name__, getattr(child, 'lineno', None), values))
+    return result
+
+def parse(parser, lexer, text):
+    '''
+    Return the dumped tree of text and the error messages.
+    '''
+    errors = []
+    with subscribe_errors(errors.append):
+        lexer.lineno = 1
+        program = parser.parse(text, lexer=lexer)
+    return dump(program), errors
+
+class TestRecursiveDescentParser(unittest.TestCase):
+    '''
+    The recursive-descent parser must build the same trees, with the
+    same line numbers, and report the same syntax errors as the LALR
+    parser.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        cls.ply = exprparse.make_parser()
+        cls.rd = exprparse.make_parser(backend="rd")
+        cls.ply_lexer = exprlex.make_lexer()
+        cls.rd_lexer = exprlex.make_lexer(backend="scanner")
+
+    def check_same(self, text, label=None):
+        self.assertEqual(parse(self.rd, self.rd_lexer, text),
+                         parse(self.ply, self.ply_lexer, text), label or text)
+
+    def test_sources(self):
+        for name, text in source_files():
+            self.check_same(text, name)
+
+    def test_malformed(self):
+        for text in MALFORMED:
+            self.check_same(text)
+
+    def test_mutated_sources(self):
+        # Insert, replace and delete bits of the sample programs
+        pieces = ['', ';', '}', '{', '(', ')', '+', '*', 'var', 'else', '1', 'x',
+                  '=', 'func', 'print', ',', 'return', 'if']
+        rand = random.Random(9)
+        for name, text in source_files():
+            for _ in range(40):
+                pos = rand.randint(0, len(text))
+                mutated = text[:pos] + rand.choice(pieces) + text[pos + rand.randint(0, 3):]
+                self.check_same(mutated, (name, mutated))
+
+class TestFlattenedChains(unittest.TestCase):
+    def setUp(self):
+        self.lexer = exprlex.make_lexer(backend="scanner")
+        self.parser = exprparse.make_parser(backend="rd", flatten=True)
+
+    def expression(self, text):
+        # Return the expression of "print text;" in the form
+        # (class name, op, operands) with the leaves as values or names
+        def shape(node):
+            if isinstance(node, exprast.Literal):
+                return node.value
+            if isinstance(node, exprast.LoadLocation):
+                return node.location.name
+            if isinstance(node, (exprast.BinopChain, exprast.RelopChain)):
+                return (type(node).__name__, node.op, [shape(n) for n in node.operands])
+            return (type(node).__name__, node.op, [shape(node.left), shape(node.right)])
+        errors = []
+        with subscribe_errors(errors.append):
+            program = self.parser.parse("print %s;" % text, lexer=self.lexer)
+        self.assertEqual(errors, [])
+        return shape(program.statements.statements[0].expr)
+
+    def test_chains(self):
+        self.assertEqual(self.expression("1 + 2"), ('Binop', '+', [1, 2]))
+        self.assertEqual(self.expression("1 + 2 + 3 + 4"), ('BinopChain', '+', [1, 2, 3, 4]))
+        self.assertEqual(self.expression("a + b - c * d * e"),
+                         ('Binop', '-', [('Binop', '+', ['a', 'b']),
+                                         ('BinopChain', '*', ['c', 'd', 'e'])]))
+        self.assertEqual(self.expression("(a + b) + c"),
+                         ('Binop', '+', [('Binop', '+', ['a', 'b']), 'c']))
+        self.assertEqual(self.expression("a && b && c || d || e"),
+                         ('RelopChain', '||', [('RelopChain', '&&', ['a', 'b', 'c']), 'd', 'e']))
+        # Comparisons do not chain
+        self.assertEqual(self.expression("a < b"), ('Relop', '<', ['a', 'b']))
+
+    def test_same_code(self):
+        # Compiling with chains gives the same code as without
+        text = "func main int() {\n    var x int = 2;\n    var y int = 3;\n"
+        for op in "+-*/":
+            text += "    print %s;\n" % (" %s " % op).join(["x", "2", "y"] * 4)
+        text += ("    print 1 + 2 + 3 + x - 1 - 2;\n"
+                 "    print 1.5 * 2.0 * 4.0;\n"
+                 "    print x > 1 && y > 1 && x < y;\n}\n")
+        listings = []
+        for flatten in (False, True):
+            sink = expr.ErrorSink()
+            parser = exprparse.make_parser(backend="rd", flatten=flatten)
+            listings.append(expr.compile_listing(text, exprlex.make_lexer(backend="scanner"),
+                                                 parser, sink=sink))
+            self.assertEqual(sink.messages(), [])
+        self.assertIsNotNone(listings[0])
+        self.assertEqual(listings[1], listings[0])
+
+    def test_long_chain(self):
+        # Far deeper than the recursion limit as a tree of Binops
+        text = "func main int() {\n    var x int = 1;\n    print %s;\n}\n" % \
+               " + ".join(["x"] * 5000)
+        sink = expr.ErrorSink()
+        listing = expr.compile_listing(text, exprlex.make_lexer(backend="scanner"),
+                                       self.parser, sink=sink)
+        self.assertEqual(sink.messages(), [])
+        self.assertEqual(listing.count("('add'"), 4999)
+
+# Sources with ';', '{', '}' and 'func' in comments and strings
+TRICKY = [
+    '/* func f int() { } ; */\nfunc f int() {\n    print "} func ;";\n}\n',
+    'print "a\\\n}; func g int() {\nprint "b";\n} // func {\n',
+    'var x int = 1; // } func',
+    'print "a\\\nx; "b;} func c";\nfunc d int() { }\n',
+]
+
+def token_positions(text, types):
+    # Return the offsets of the start and end of each token of the
+    # given types in text
+    lexer = exprlex.make_lexer(backend="scanner")
+    starts, ends = set(), set()
+    with subscribe_errors(lambda msg: None):
+        lexer.input(text)
+        for tok in iter(lexer.token, None):
+            if tok.type in types:
+                starts.add(tok.lexpos)
+                ends.add(tok.lexpos + len(tok.value))
+    return starts, ends
+
+class TestSplitting(unittest.TestCase):
+    def texts(self):
+        sources = [text for _, text in source_files()]
+        return ["\n".join(sources), "\n".join(TRICKY * 10)] + TRICKY
+
+    def test_func_split_points(self):
+        # Every split point of parse_parallel() is at a 'func' token
+        for text in self.texts():
+            starts, _ = token_positions(text, ('FUNC',))
+            for parts in range(2, 20):
+                self.assertLessEqual(set(exprparse._func_split_points(text, parts)), starts)
+
+    def test_statement_spans(self):
+        # Every statement of IncrementalParser ends just past a ';' or '}'
+        for text in self.texts():
+            _, ends = token_positions(text, ('SEMI', 'RCURL'))
+            spans = exprparse._statement_spans(text)
+            self.assertEqual(spans[0][0], 0)
+            self.assertEqual(spans[-1][1], len(text))
+            self.assertLessEqual(set(end for _, end in spans[:-1]), ends)
+
+class TestIncrementalParser(unittest.TestCase):
+    TEXT = '''
+const a = 2 * 3;
+var b int = a + 1;
+
+func f int(x int) {
+    return x * (4 + 5);
+}
+
+f(b);
+'''
+
+    def full_parse(self, text):
+        return parse(exprparse.make_parser(), exprlex.make_lexer(), text)
+
+    def check(self, parser, text):
+        errors = []
+        with subscribe_errors(errors.append):
+            program = parser.parse(text)
+        self.assertEqual((dump(program), errors), self.full_parse(text))
+        return program
+
+    def test_edits(self):
+        parser = exprparse.IncrementalParser()
+        text = self.TEXT
+        self.check(parser, text)
+        self.assertEqual(parser.parsed, 5)
+        text = text.replace("f(b);", "f(b + 1);")
+        self.check(parser, text)
+        self.assertEqual((parser.reused, parser.parsed), (4, 1))
+        text = "var c int = 7;\n\n" + text            # Moves everything down
+        self.check(parser, text)
+        self.assertEqual((parser.reused, parser.parsed), (4, 2))
+        text = text.replace("return x", "return x +")  # Syntax error
+        self.check(parser, text)
+        text = text.replace("return x +", "return x")
+        self.check(parser, text)
+        self.assertEqual(parser.parsed, 0)
+        text = text + "var b int = a + 1;\n"            # A repeated statement
+        self.check(parser, text)
+        self.assertEqual(parser.parsed, 0)
+
+    def test_checked_and_folded(self):
+        # The passes change the nodes they are given, which must not
+        # change the statements that are reused
+        parser = exprparse.IncrementalParser()
+        text = self.TEXT
+        for n in range(3):
+            program = self.check(parser, text)
+            with subscribe_errors(lambda msg: None):
+                exprcheck.check_program(program)
+            exprconst.fold_constants(program)
+            text += "print %d;\n" % n
+        self.assertEqual((parser.reused, parser.parsed), (6, 1))
+
+class TestParserTables(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.tabfile = os.path.join(self.cache_dir,
+                                    "parsetab-%s.pickle" % exprparse.grammar_signature())
+        # Nothing may be written outside the cache directory
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.workdir)
+        self.text = "".join(text for _, text in source_files())
+        self.expected = parse(exprparse.make_parser(), exprlex.make_lexer(), self.text)
+
+    def check_parser(self, parser):
+        self.assertEqual(parse(parser, exprlex.make_lexer(), self.text), self.expected)
+        self.assertEqual(os.listdir(self.workdir), [])
+        # The table left behind can be loaded
+        exprparse._load_parsetab(self.tabfile)
+
+    def test_cached_table(self):
+        self.check_parser(exprparse.make_parser(cache_dir=self.cache_dir))
+        self.assertTrue(os.path.exists(self.tabfile))
+        with open(self.tabfile, "rb") as f:
+            contents = f.read()
+        self.check_parser(exprparse.make_parser(cache_dir=self.cache_dir))
+        with open(self.tabfile, "rb") as f:
+            self.assertEqual(f.read(), contents)
+
+    def check_rebuilt(self, contents, rebuild=False):
+        with open(self.tabfile, "wb") as f:
+            f.write(contents)
+        self.check_parser(exprparse.make_parser(cache_dir=self.cache_dir, rebuild=rebuild))
+        with open(self.tabfile, "rb") as f:
+            self.assertNotEqual(f.read(), contents)
+
+    def test_corrupt_table(self):
+        self.check_rebuilt(b"not a pickle")
+
+    def test_incomplete_table(self):
+        from ply import yacc
+        self.check_rebuilt(pickle.dumps(yacc.__tabversion__) + pickle.dumps("LALR"))
+
+    def test_stale_table(self):
+        self.check_rebuilt(pickle.dumps("0.0") + pickle.dumps("LALR"))
+
+    def test_rebuild(self):
+        exprparse.make_parser(cache_dir=self.cache_dir)
+        with open(self.tabfile, "rb") as f:
+            contents = f.read()
+        # A table that could be loaded, but is replaced anyway
+        self.check_rebuilt(contents[:len(contents) // 2] + contents, rebuild=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# test_exprserial.py
+'''
+Tests for the binary AST format in exprserial.py.
+
+       bash % python -m pytest tests
+'''
+import os
+import glob
+import unittest
+
+import exprast
+import exprlex
+import exprparse
+import exprcheck
+import exprconst
+import exprcode
+import exprserial
+import exprtype
+from errors import error_sink
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+
+def source_files():
+    for path in sorted(glob.glob(os.path.join(TESTDIR, "*.e"))):
+        if os.path.basename(path) != "errors.e":      # Crashes the checker
+            with open(path) as f:
+                yield os.path.basename(path), f.read()
+
+def dump(node):
+    '''
+    Return the tree under node as a list of (depth, class name, values
+    of the fields and attributes that are not nodes).  Values are given
+    by repr(), so that 0.0 and -0.0 differ, and types by name.
+    '''
+    result = []
+    for depth, child in exprast.flatten(node):
+        values = []
+        for name in child._fields + child._attributes:
+            value = getattr(child, name, None)
+            if isinstance(value, exprtype.ExprType):
+                values.append((name, value.typename))
+            elif not isinstance(value, (exprast.AST, list, exprcheck.SymbolTable)) and \
+                    name != 'environment':
+                values.append((name, repr(value)))
+        result.append((depth, type(child).__name__, tuple(values)))
+    return result
+
+class TestSerialization(unittest.TestCase):
+    def setUp(self):
+        self.lexer = exprlex.make_lexer()
+        self.parser = exprparse.make_parser()
+
+    def parse(self, text):
+        self.lexer.lineno = 1
+        with error_sink():
+            return self.parser.parse(text, lexer=self.lexer)
+
+    def test_round_trip(self):
+        for name, text in source_files():
+            program = self.parse(text)
+            if program is None:
+                continue
+            with self.subTest(name=name):
+                self.assertEqual(dump(exprserial.loads(exprserial.dumps(program))), dump(program))
+                # And again after the checker has set its attributes
+                with error_sink() as sink:
+                    exprcheck.check_program(program)
+                loaded = exprserial.loads(exprserial.dumps(program))
+                self.assertEqual(dump(loaded), dump(program))
+                self.assertEqual(sorted(loaded.symtab), sorted(program.symtab))
+                if not sink.errors_reported():
+                    listings = [exprcode.list_code(exprcode.generate_code(
+                                    exprconst.fold_constants(tree)))
+                                for tree in (program, loaded)]
+                    self.assertEqual(listings[1], listings[0])
+
+    def test_signed_zero(self):
+        # 0.0 == -0.0, but they are different values
+        program = self.parse("func main int() {\n    print 0.0;\n    print -0.0;\n}\n")
+        with error_sink():
+            exprcheck.check_program(program)
+        program = exprconst.fold_constants(program)
+        listing = exprcode.list_code(exprcode.generate_code(
+            exprserial.loads(exprserial.dumps(program))))
+        self.assertIn("-0.0", listing)
+        self.assertEqual(dump(exprserial.loads(exprserial.dumps(program))), dump(program))
+
+    def test_shared_nodes(self):
+        program = self.parse("var x int = 1;\nprint x;\n")
+        statements = program.statements.statements
+        statements.append(statements[0])
+        loaded = exprserial.loads(exprserial.dumps(program)).statements.statements
+        self.assertEqual(len(loaded), 3)
+        self.assertIs(loaded[0], loaded[2])
+        self.assertIsNot(loaded[0], loaded[1])
+
+    def test_bad_data(self):
+        data = exprserial.dumps(self.parse("print 1;\n"))
+        magic = len(exprserial._MAGIC)
+        with self.assertRaises(ValueError):
+            exprserial.loads(b"NOTEXPR\0" + data[magic:])
+        with self.assertRaises(ValueError):
+            exprserial.loads(b"")
+        # A different format version, and a different layout signature
+        version = (exprserial.FORMAT_VERSION + 1).to_bytes(2, 'little')
+        with self.assertRaises(ValueError):
+            exprserial.loads(data[:magic] + version + data[magic + 2:])
+        with self.assertRaises(ValueError):
+            exprserial.loads(data[:magic + 2] + b"0" * 16 + data[magic + 18:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# test_exprstore.py
+'''
+Tests for the array-backed AST storage in exprstore.py.
+
+       bash % python -m pytest tests
+'''
+import os
+import glob
+import unittest
+
+import exprast
+import exprlex
+import exprparse
+import exprcheck
+import exprconst
+import exprcode
+import exprstore
+from errors import error_sink
+
+TESTDIR = os.path.dirname(os.path.abspath(__file__))
+
+def source_files():
+    for path in sorted(glob.glob(os.path.join(TESTDIR, "*.e"))):
+        if os.path.basename(path) != "errors.e":      # Crashes the checker
+            with open(path) as f:
+                yield os.path.basename(path), f.read()
+
+def compile_tree(program):
+    # Return (flattened tree, messages, code listing) for program
+    with error_sink() as sink:
+        exprcheck.check_program(program)
+        listing = None
+        if not sink.errors_reported():
+            code = exprcode.generate_code(exprconst.fold_constants(program))
+            listing = exprcode.list_code(code)
+    tree = [(depth, type(node).__name__) for depth, node in exprast.flatten(program)]
+    return tree, sink.messages(), listing
+
+class TestASTStore(unittest.TestCase):
+    def setUp(self):
+        self.lexer = exprlex.make_lexer()
+        self.parser = exprparse.make_parser()
+
+    def parse(self, text):
+        self.lexer.lineno = 1
+        with error_sink():
+            return self.parser.parse(text, lexer=self.lexer)
+
+    def test_same_as_nodes(self):
+        for name, text in source_files():
+            program = self.parse(text)
+            if program is None:
+                continue
+            with self.subTest(name=name):
+                store = exprstore.ASTStore()
+                self.assertEqual(compile_tree(store.add(self.parse(text))),
+                                 compile_tree(program))
+
+    def test_signed_zero(self):
+        # 0.0 == -0.0, but they are different values
+        text = "func main int() {\n    print 0.0;\n    print -0.0;\n}\n"
+        program = self.parse(text)
+        store = exprstore.ASTStore()
+        expected = compile_tree(program)
+        self.assertIn("-0.0", expected[2])
+        self.assertEqual(compile_tree(store.add(self.parse(text))), expected)
+
+    def test_add_none(self):
+        # The parser returns None for a syntax error at the end of input
+        with open(os.path.join(TESTDIR, "small.e")) as f:
+            program = self.parse(f.read())
+        self.assertIsNone(program)
+        store = exprstore.ASTStore()
+        self.assertIsNone(store.add(program))
+        self.assertEqual(len(store), 0)
+
+if __name__ == '__main__':
+    unittest.main()